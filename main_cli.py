@@ -4,16 +4,70 @@ import os
 # 禁用 HuggingFace Tokenizers 的并行化，防止死锁和警告
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+import argparse
 import warnings
 import sys
+import time
 import traceback
+from pathlib import Path
 from src.agent.agent_creator import create_port_agent
+from src.agent.batch import BatchRunner
+from src.agent.memory import ConversationMemory
+from src.agent.streaming import ConsoleStreamHandler
 from src.config import settings
+from src.observability.metrics import start_metrics_server
 
 # 忽略一些不必要的警告 (如 LangChain 的 Pydantic 警告)
 warnings.filterwarnings("ignore")
 
 
+def _check_api_key() -> bool:
+    # 具体的 Key 检查已在 agent_creator 或 settings 中处理，这里只做最基础的拦截
+    if settings.LLM_PROVIDER == "zhipu" and not settings.ZHIPUAI_API_KEY:
+        print("❌ 错误：未检测到 ZHIPUAI_API_KEY，请检查 .env 文件。")
+        return False
+    elif settings.LLM_PROVIDER == "qwen" and not settings.DASHSCOPE_API_KEY:
+        print("❌ 错误：未检测到 DASHSCOPE_API_KEY，请检查 .env 文件。")
+        return False
+    return True
+
+
+def run_batch(query_file: Path, concurrency: int, out_path: Path):
+    """
+    批量离线诊断：并发执行查询文件中的问题，结果逐条追加到 JSONL 文件。
+    中断后使用相同参数重新运行即可从断点续跑。
+    """
+    if not query_file.exists():
+        print(f"❌ 查询文件不存在: {query_file}")
+        return
+    if not _check_api_key():
+        return
+
+    print(f"⚙️  正在初始化 Agent... (引擎: {settings.LLM_PROVIDER.upper()})")
+    executor = create_port_agent()
+    executor.verbose = False
+
+    def report(record):
+        icon = "✅" if record["status"] == "success" else "❌"
+        print(f"{icon} [{record['id']}] {record['latency']:.2f}s {record['query'][:40]}")
+
+    runner = BatchRunner(
+        executor,
+        out_path,
+        concurrency=concurrency,
+        session_id=f"batch-{query_file.stem}"[:50],
+        on_result=report,
+    )
+    print(f"🚀 批量诊断开始: {query_file} -> {out_path} (并发 {concurrency})")
+    start = time.perf_counter()
+    stats = runner.run(query_file)
+    print("=" * 50)
+    print(
+        f"🏁 完成 {stats['submitted']} 条 (成功 {stats['success']} / 失败 {stats['error']})，"
+        f"跳过已完成 {stats['skipped']} 条，耗时 {time.perf_counter() - start:.1f}s"
+    )
+
+
 def run_cli():
     """
     启动命令行交互界面。
@@ -28,16 +82,8 @@ def run_cli():
     print(" - '退出' 或 'exit' 来结束对话。")
     print("=" * 50)
 
-    # --- ✅ 修正：移除硬编码的 OpenAI 检查，改为通用检查 ---
-    # 具体的 Key 检查已在 agent_creator 或 settings 中处理
-    # 这里只做最基础的拦截
-    if settings.LLM_PROVIDER == "zhipu" and not settings.ZHIPUAI_API_KEY:
-        print("❌ 错误：未检测到 ZHIPUAI_API_KEY，请检查 .env 文件。")
+    if not _check_api_key():
         return
-    elif settings.LLM_PROVIDER == "qwen" and not settings.DASHSCOPE_API_KEY:
-        print("❌ 错误：未检测到 DASHSCOPE_API_KEY，请检查 .env 文件。")
-        return
-    # -------------------------------------------------------
 
     try:
         # 创建Agent
@@ -47,6 +93,9 @@ def run_cli():
         print(f"❌ 初始化Agent时出错: {e}")
         return
 
+    # 本次命令行会话的对话记忆
+    memory = ConversationMemory.from_settings()
+
     while True:
         try:
             user_input = input("\n👤 你: ").strip()
@@ -61,11 +110,19 @@ def run_cli():
             # 调用Agent并获取响应
             print("\n🤖 小宁正在思考中... (查询数据 & 检索法规)")
 
-            # 使用 invoke 调用 Agent
-            response = agent_executor.invoke({"input": user_input})
-
+            # 使用 invoke 调用 Agent，最终答案逐 Token 流式打印
+            stream_handler = ConsoleStreamHandler()
             print("\n🤖 小宁:")
-            print(response["output"])
+            response = agent_executor.invoke(
+                {"input": user_input, **memory.load_variables()},
+                config={"callbacks": [stream_handler]},
+            )
+            memory.add_turn(user_input, response["output"])
+
+            # 模型未开启流式时没有 Token 事件，直接打印完整结果
+            if not stream_handler.text:
+                print(response["output"])
+            print()
             print("-" * 50)
 
         except KeyboardInterrupt:
@@ -85,5 +142,27 @@ if __name__ == "__main__":
     帮我查一下箱号 NBCT1234567，提单号 BILL002。这票货明天能赶上“中远海运金牛座”吗？我很急，一直没放行。
     查一下集装箱 TRLU1234567，提单号 BILL001。船名是“中远海运金牛座”。一切正常吗？
     帮我查个不存在的箱子 ERROR999999，看看什么情况。
+
+    批量模式 (可中断续跑)：
+    uv run python -m main_cli --batch query_examples --concurrency 4 --out results.jsonl
     """
-    run_cli()
+    parser = argparse.ArgumentParser(description="智能口岸通关异常诊断助手")
+    parser.add_argument("--batch", type=Path, help="查询文件 (每行一条或 query_examples 格式)")
+    parser.add_argument("--concurrency", type=int, default=4, help="批量模式并发数")
+    parser.add_argument("--out", type=Path, default=Path("results.jsonl"), help="结果文件")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=settings.METRICS_PORT,
+        help="Prometheus 指标端口 (0 表示不启动)",
+    )
+    args = parser.parse_args()
+
+    if args.metrics_port > 0:
+        start_metrics_server(args.metrics_port, settings.METRICS_HOST)
+        print(f"📈 指标端点: http://{settings.METRICS_HOST}:{args.metrics_port}/metrics")
+
+    if args.batch:
+        run_batch(args.batch, args.concurrency, args.out)
+    else:
+        run_cli()
@@ -0,0 +1,59 @@
+# script/archive_logs.py
+"""
+审计日志保留任务：把超过保留天数的 chat_logs 归档为按日期分区的 Parquet 并从数据库删除
+
+适合配置为每日定时任务 (cron)：
+
+    uv run python -m script.archive_logs
+    uv run python -m script.archive_logs --days 7 --vacuum
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# 将项目根目录加入路径，确保能导入 src
+root_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.config import settings
+from src.database.archive import archive_root, list_partitions, run_retention
+
+
+def main():
+    parser = argparse.ArgumentParser(description="归档过期审计日志")
+    parser.add_argument(
+        "--days", type=int, default=settings.LOG_RETENTION_DAYS, help="保留最近 N 天的日志"
+    )
+    parser.add_argument("--archive-dir", type=Path, default=None, help="归档目录")
+    parser.add_argument(
+        "--chunk-size", type=int, default=settings.ARCHIVE_CHUNK_SIZE, help="每个事务的行数"
+    )
+    parser.add_argument("--vacuum", action="store_true", help="归档后 VACUUM 回收数据库文件空间")
+    args = parser.parse_args()
+
+    db_size = settings.DB_PATH.stat().st_size if settings.DB_PATH.exists() else 0
+    t0 = time.perf_counter()
+    stats = run_retention(args.days, args.archive_dir, args.chunk_size, args.vacuum)
+    elapsed = time.perf_counter() - t0
+
+    print(
+        f"📦 已归档 {stats['archived']} 条 {args.days} 天前的日志 -> {archive_root(args.archive_dir)}"
+        f" ({stats['files']} 个文件, {stats['bytes'] / 1024:.1f} KB, {elapsed:.2f}s)"
+    )
+    if args.vacuum:
+        print(
+            f"🗜️ 数据库文件: {db_size / 1024:.1f} KB -> "
+            f"{settings.DB_PATH.stat().st_size / 1024:.1f} KB"
+        )
+    partitions = list_partitions(args.archive_dir)
+    if partitions:
+        total = sum(p["bytes"] for p in partitions)
+        print(
+            f"🗂️ 归档共 {len(partitions)} 个日期分区 "
+            f"({partitions[0]['date']} ~ {partitions[-1]['date']}, {total / 1024:.1f} KB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
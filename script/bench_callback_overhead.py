@@ -0,0 +1,140 @@
+# script/bench_callback_overhead.py
+"""
+监控回调开销基准：各埋点级别下每个请求增加的 CPU 耗时
+
+不调用真实 LLM / 工具，直接通过 LangChain CallbackManager 重放一次典型请求的回调事件
+(根 Chain -> N 轮 LLM (流式 Token) -> 工具调用 -> 知识库检索 -> 结束)，
+分别测量不挂回调 (baseline)、空回调 (noop) 与 off / metrics / full / full 抽样 的单请求耗时。
+只要挂了任意回调，LangChain 就会为每个流式 Token 分发一次事件，这部分框架开销体现在 noop 中，
+监控回调自身的开销看相对 noop 的增量。
+审计日志照常进入异步写入队列 (写入端替换为空操作，不落库)，因此入队开销计入结果。
+
+    uv run python -m script.bench_callback_overhead
+    uv run python -m script.bench_callback_overhead --requests 5000 --llm-rounds 3 --tokens 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+# 将项目根目录加入路径，确保能导入 src
+root_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+# 基准不触碰正式数据库；队列放大，避免高频请求下丢弃日志打印告警
+_tmp_dir = tempfile.mkdtemp(prefix="bench_callback_")
+os.environ.setdefault("DB_PATH", str(Path(_tmp_dir) / "bench.db"))
+os.environ.setdefault("AUDIT_QUEUE_SIZE", "100000")
+
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManager
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from src.database.audit_writer import get_audit_writer
+from src.web.callbacks import AgentMonitorCallback
+
+QUERY = "帮我查一下箱号 NBCT1234567，提单号 BILL002。这票货明天能赶上“中远海运金牛座”吗？"
+TOOL_OUTPUT = str({"bill_no": "BILL002", "status": "查验中", "code": "H98", "note": "人工查验" * 20})
+DOCS = [Document(page_content="H98 指令表示海关布控人工查验。" * 40) for _ in range(4)]
+
+# 名称 -> 回调工厂 (None 表示不挂监控回调)
+PROFILES: Dict[str, Callable[[], Any]] = {
+    "baseline": lambda: None,
+    "noop": BaseCallbackHandler,
+    "off": lambda: AgentMonitorCallback(level="off"),
+    "metrics": lambda: AgentMonitorCallback(level="metrics"),
+    "full@10%": lambda: AgentMonitorCallback(level="full", sample_rate=0.1),
+    "full": lambda: AgentMonitorCallback(level="full", sample_rate=1.0),
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="监控回调开销基准")
+    parser.add_argument("--requests", type=int, default=2000, help="每种级别重放的请求数")
+    parser.add_argument("--llm-rounds", type=int, default=3, help="每个请求的 LLM 调用轮数")
+    parser.add_argument("--tokens", type=int, default=100, help="每轮流式输出的 Token 数")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    return parser.parse_args()
+
+
+def _llm_result(round_no: int, tokens: int) -> LLMResult:
+    usage = {"input_tokens": 800 + 200 * round_no, "output_tokens": tokens, "total_tokens": 800 + 200 * round_no + tokens}
+    message = AIMessage(
+        content="字" * tokens,
+        usage_metadata=usage,
+        response_metadata={"model_name": "bench-model"},
+    )
+    # llm_output 与 usage_metadata 同时存在 (OpenAI 兼容适配器的常见形态)
+    return LLMResult(
+        generations=[[ChatGeneration(message=message)]],
+        llm_output={"token_usage": {"prompt_tokens": usage["input_tokens"], "completion_tokens": tokens}},
+    )
+
+
+def replay_request(handler: Any, args: argparse.Namespace) -> None:
+    """按 AgentExecutor 的事件顺序重放一次请求"""
+    manager = CallbackManager.configure(inheritable_callbacks=[handler] if handler else [])
+    chain = manager.on_chain_start({"name": "AgentExecutor"}, {"input": QUERY}, name="AgentExecutor")
+    child = chain.get_child()
+    for round_no in range(args.llm_rounds):
+        [llm] = child.on_chat_model_start(
+            {"name": "bench"}, [[HumanMessage(content=QUERY)]],
+            invocation_params={"model_name": "bench-model"},
+        )
+        for _ in range(args.tokens):
+            llm.on_llm_new_token("字")
+        llm.on_llm_end(_llm_result(round_no, args.tokens))
+        if round_no == args.llm_rounds - 1:
+            break
+        tool = child.on_tool_start({"name": "get_customs_status"}, "BILL002", name="get_customs_status")
+        if round_no == 0:
+            retriever = tool.get_child().on_retriever_start({"name": "faiss"}, "H98")
+            retriever.on_retriever_end(DOCS)
+        tool.on_tool_end(TOOL_OUTPUT, name="get_customs_status")
+    chain.on_chain_end({"output": "**🔍 状态核查**\n- 海关状态: 查验中 (H98)"})
+
+
+def run_profile(name: str, args: argparse.Namespace) -> List[float]:
+    factory = PROFILES[name]
+    for _ in range(min(200, args.requests)):  # 预热
+        replay_request(factory(), args)
+    timings = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        replay_request(factory(), args)
+        timings.append(time.perf_counter() - start)
+    get_audit_writer().flush()
+    return timings
+
+
+def main():
+    args = parse_args()
+    # 只测回调本身：写入线程丢弃日志而不是写 SQLite
+    get_audit_writer().sink = lambda batch: None
+    print(
+        f"🏁 监控回调开销基准: requests={args.requests}, "
+        f"llm_rounds={args.llm_rounds}, tokens/round={args.tokens}"
+    )
+    print("=" * 60)
+    print(f"{'级别':<10}{'mean(µs)':>12}{'p50(µs)':>12}{'p99(µs)':>12}{'相对noop(µs)':>14}")
+    noop = None
+    for name in args.profiles:
+        timings = sorted(run_profile(name, args))
+        mean = statistics.fmean(timings) * 1e6
+        p50 = timings[len(timings) // 2] * 1e6
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6
+        if name == "noop":
+            noop = p50
+        # 用中位数比较，受写入线程 / GC 抖动影响更小
+        delta = f"{p50 - noop:+.1f}" if noop is not None and name != "baseline" else "-"
+        print(f"{name:<10}{mean:>12.1f}{p50:>12.1f}{p99:>12.1f}{delta:>14}")
+    print(f"\n📊 审计写入器: {get_audit_writer().stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# script/bench_sqlite_concurrency.py
+"""
+SQLite 并发基准：审计日志写入 + 监控页同时读取
+
+在临时数据库上分别用 "默认配置 (rollback journal)" 与 "调优配置 (WAL + PRAGMA)"
+运行相同的负载：W 个写线程按批次插入 chat_logs，R 个读线程循环执行监控页查询
+(最近 100 条 + KPI 聚合)，输出写入吞吐、读取次数、锁等待错误与写入延迟分位数。
+
+    uv run python -m script.bench_sqlite_concurrency
+    uv run python -m script.bench_sqlite_concurrency --writers 4 --readers 4 --duration 10 --batch 20
+"""
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# 将项目根目录加入路径，确保能导入 src
+root_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from src.database.engine import create_sqlite_engine, current_pragmas, sqlite_pragmas
+from src.database.models import Base, ChatLog
+from src.database.repository import ChatLogRepository
+
+PROFILES = {
+    # SQLite 默认：rollback journal + FULL 同步，读事务期间写者被阻塞
+    "default": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "mmap_size": 0,
+        "cache_size": -2000,
+    },
+    "tuned": sqlite_pragmas(),
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="SQLite 审计库并发基准")
+    parser.add_argument("--writers", type=int, default=2, help="写线程数")
+    parser.add_argument("--readers", type=int, default=4, help="读线程数 (模拟监控页)")
+    parser.add_argument("--duration", type=float, default=5.0, help="每种配置运行秒数")
+    parser.add_argument("--batch", type=int, default=10, help="每个写事务的行数")
+    parser.add_argument("--seed-rows", type=int, default=2000, help="预置行数")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    return parser.parse_args()
+
+
+def _record(i: int) -> Dict[str, Any]:
+    return {
+        "user_input": f"查一下提单 BILL{i:06d} 的状态",
+        "ai_output": "**🔍 状态核查**\n" + "- 海关状态: 放行\n" * 20,
+        "latency": 1.0 + (i % 50) / 10,
+        "token_usage": {"input": 800, "output": 200, "total": 1000},
+        "intermediate_steps": [{"tool": "get_customs_status", "result": "x" * 300}],
+        "rag_sources": ["人工查验需 1-2 个工作日。" * 10],
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def run_profile(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(
+            Path(tmp) / "bench.db",
+            pragmas=PROFILES[name],
+            pool_size=args.writers + args.readers,
+        )
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            db.add_all(ChatLogRepository.build_log(**_record(i)) for i in range(args.seed_rows))
+            db.commit()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {"rows": 0, "reads": 0, "errors": 0, "write_latency": []}
+
+        def writer(worker: int):
+            i = 0
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    with Session() as db:
+                        db.add_all(
+                            ChatLogRepository.build_log(**_record(worker * 10**6 + i + j))
+                            for j in range(args.batch)
+                        )
+                        db.commit()
+                except OperationalError:
+                    with lock:
+                        result["errors"] += 1
+                    continue
+                with lock:
+                    result["rows"] += args.batch
+                    result["write_latency"].append(time.perf_counter() - t0)
+                i += args.batch
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    with Session() as db:
+                        # 与监控页相同：最近 100 条完整行 + 全表 KPI
+                        db.query(ChatLog).order_by(ChatLog.timestamp.desc()).limit(100).all()
+                        db.query(
+                            func.count(ChatLog.id),
+                            func.avg(ChatLog.latency),
+                            func.sum(ChatLog.total_tokens),
+                        ).one()
+                except OperationalError:
+                    with lock:
+                        result["errors"] += 1
+                    continue
+                with lock:
+                    result["reads"] += 1
+
+        threads = [threading.Thread(target=writer, args=(w,)) for w in range(args.writers)]
+        threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        result["pragmas"] = current_pragmas(engine)
+        engine.dispose()
+        return result
+
+
+def main():
+    args = parse_args()
+    print(
+        f"🏁 SQLite 并发基准: writers={args.writers}, readers={args.readers}, "
+        f"batch={args.batch}, duration={args.duration}s"
+    )
+    for name in args.profiles:
+        r = run_profile(name, args)
+        latencies = r["write_latency"]
+        print("\n" + "=" * 60)
+        print(f"📊 [{name}] {r['pragmas']}")
+        print("=" * 60)
+        print(f"写入吞吐      : {r['rows'] / args.duration:,.0f} rows/s ({len(latencies)} 个事务)")
+        print(f"读取吞吐      : {r['reads'] / args.duration:,.1f} 次/s")
+        print(f"锁超时错误    : {r['errors']}")
+        for p in (50, 95, 99):
+            print(f"写事务 p{p:<2}    : {percentile(latencies, p) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
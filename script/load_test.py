@@ -0,0 +1,293 @@
+# script/load_test.py
+"""
+Agent 流水线并发压测脚本
+
+模拟 N 个并发会话，通过 create_port_agent() 驱动完整的 AgentExecutor
+(预路由 -> LLM -> 工具/RAG -> 审计日志)，输出吞吐量、延迟分位数、错误率以及分阶段耗时。
+
+默认使用离线 Fake 模型 (LLM_PROVIDER=fake)，无需 API Key：
+    uv run python -m script.load_test --sessions 8 --turns 5 --mode threads
+    uv run python -m script.load_test --sessions 32 --mode asyncio --llm-latency 1.0
+    uv run python -m script.load_test --provider qwen --query-file my_queries.txt
+
+查询文件格式：每行一条查询，可选 "权重|查询" 形式控制查询配比，# 开头为注释。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+# 将项目根目录加入路径，确保能导入 src
+root_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+DEFAULT_QUERY_MIX: List[Tuple[float, str]] = [
+    (3, "帮我查一下箱号 TRLU1234567 和提单号 BILL001。这票货是配‘中远海运金牛座’的，状态正常吗？"),
+    (2, "重点关注一下 BILL_URGENT 这票货，船名是‘东方海外宁波’。海关状态刚变成 H98，还能赶上吗？"),
+    (2, "最急的是提单号 BILL_RISK，也是配‘东方海外宁波’。但这票货早上9点被‘人工查验’了。我该怎么办？"),
+    (2, "最后查一下箱号 NOVGM999，提单号 BILL_NOVGM。海关已经放行了，应该没问题了吧？"),
+    (1, "帮我查个不存在的箱子 ERROR999999，看看什么情况。"),
+]
+
+STAGES = ["prefetch", "llm", "tool", "retriever", "audit"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="SmartPortAgent 并发压测")
+    parser.add_argument("--sessions", type=int, default=4, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=5, help="每个会话的请求数")
+    parser.add_argument("--mode", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--provider", default="fake", help="LLM_PROVIDER (默认 fake)")
+    parser.add_argument("--query-file", type=Path, help="自定义查询配比文件")
+    parser.add_argument("--llm-latency", type=float, help="Fake 模型模拟延迟(秒)")
+    parser.add_argument("--llm-jitter", type=float, help="Fake 模型延迟抖动(秒)")
+    parser.add_argument("--no-audit", action="store_true", help="不写审计日志")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def load_query_mix(path: Optional[Path]) -> List[Tuple[float, str]]:
+    if not path:
+        return DEFAULT_QUERY_MIX
+    mix = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        weight, sep, query = line.partition("|")
+        if sep and weight.strip().replace(".", "", 1).isdigit():
+            mix.append((float(weight), query.strip()))
+        else:
+            mix.append((1.0, line))
+    return mix
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法计算分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(p / 100 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def build_stage_timer():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class StageTimer(BaseCallbackHandler):
+        """按 run_id 统计 LLM / 工具 / 检索器 各阶段耗时"""
+
+        def __init__(self):
+            self.durations: Dict[str, float] = defaultdict(float)
+            self._starts: Dict[UUID, Tuple[str, float]] = {}
+
+        def _start(self, stage: str, run_id: UUID) -> None:
+            self._starts[run_id] = (stage, time.perf_counter())
+
+        def _end(self, run_id: UUID) -> None:
+            started = self._starts.pop(run_id, None)
+            if started:
+                stage, t0 = started
+                self.durations[stage] += time.perf_counter() - t0
+
+        def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+            if isinstance(inputs, dict) and inputs.get("prefetch_stats"):
+                self.durations["prefetch"] = inputs["prefetch_stats"]["latency"]
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start("llm", run_id)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+            self._start("tool", run_id)
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+            self._start("retriever", run_id)
+
+        def on_retriever_end(self, documents, *, run_id, **kwargs):
+            self._end(run_id)
+
+    return StageTimer
+
+
+def build_audit_callback():
+    from src.web.callbacks import AgentMonitorCallback
+
+    class TimedMonitorCallback(AgentMonitorCallback):
+        """记录审计日志写入的耗时 (异步模式下仅为入队耗时)"""
+
+        def __init__(self):
+            super().__init__()
+            self.audit_time = 0.0
+
+        def on_chain_end(self, outputs, **kwargs):
+            t0 = time.perf_counter()
+            super().on_chain_end(outputs, **kwargs)
+            if "output" in outputs:
+                self.audit_time += time.perf_counter() - t0
+
+    return TimedMonitorCallback
+
+
+class LoadTestRunner:
+    def __init__(self, args: argparse.Namespace):
+        from src.agent.agent_creator import create_port_agent
+
+        self.args = args
+        self.mix = load_query_mix(args.query_file)
+        self.executor = create_port_agent()
+        # 压测时关闭 verbose 输出，避免 stdout 成为瓶颈
+        self.executor.verbose = False
+        self.stage_timer_cls = build_stage_timer()
+        self.audit_cls = None if args.no_audit else build_audit_callback()
+        self.results: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _pick_queries(self, session: int) -> List[str]:
+        rng = random.Random(self.args.seed + session)
+        weights = [w for w, _ in self.mix]
+        queries = [q for _, q in self.mix]
+        return rng.choices(queries, weights=weights, k=self.args.turns)
+
+    def _callbacks(self):
+        timer = self.stage_timer_cls()
+        audit = self.audit_cls() if self.audit_cls else None
+        return timer, audit, [cb for cb in (timer, audit) if cb]
+
+    def _record(self, latency: float, error: Optional[str], timer, audit) -> None:
+        stages = dict(timer.durations)
+        if audit:
+            stages["audit"] = audit.audit_time
+        with self._lock:
+            self.results.append({"latency": latency, "error": error, "stages": stages})
+
+    # --- 线程模式 ---
+    def _run_session_sync(self, session: int) -> None:
+        for query in self._pick_queries(session):
+            timer, audit, callbacks = self._callbacks()
+            t0 = time.perf_counter()
+            error = None
+            try:
+                self.executor.invoke({"input": query}, config={"callbacks": callbacks})
+            except Exception as e:
+                error = repr(e)
+            self._record(time.perf_counter() - t0, error, timer, audit)
+
+    def run_threads(self) -> float:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.sessions) as pool:
+            list(pool.map(self._run_session_sync, range(self.args.sessions)))
+        return time.perf_counter() - t0
+
+    # --- asyncio 模式 ---
+    async def _run_session_async(self, session: int) -> None:
+        for query in self._pick_queries(session):
+            timer, audit, callbacks = self._callbacks()
+            t0 = time.perf_counter()
+            error = None
+            try:
+                await self.executor.ainvoke(
+                    {"input": query}, config={"callbacks": callbacks}
+                )
+            except Exception as e:
+                error = repr(e)
+            self._record(time.perf_counter() - t0, error, timer, audit)
+
+    def run_asyncio(self) -> float:
+        async def _main():
+            await asyncio.gather(
+                *(self._run_session_async(i) for i in range(self.args.sessions))
+            )
+
+        t0 = time.perf_counter()
+        asyncio.run(_main())
+        return time.perf_counter() - t0
+
+    def report(self, wall_time: float) -> None:
+        total = len(self.results)
+        latencies = [r["latency"] for r in self.results]
+        errors = [r for r in self.results if r["error"]]
+
+        print("\n" + "=" * 60)
+        print(
+            f"📊 压测结果 (mode={self.args.mode}, sessions={self.args.sessions}, "
+            f"turns={self.args.turns}, provider={self.args.provider})"
+        )
+        print("=" * 60)
+        print(f"请求总数      : {total}")
+        print(f"总耗时        : {wall_time:.2f} s")
+        print(f"吞吐量        : {total / wall_time:.2f} req/s")
+        print(f"错误率        : {len(errors) / total * 100 if total else 0:.1f}%")
+        for p in (50, 95, 99):
+            print(f"p{p:<2} 延迟      : {percentile(latencies, p) * 1000:.0f} ms")
+
+        print("\n⏱️  分阶段耗时 (每请求平均，阶段可能并行，占比按总延迟计算)")
+        mean_latency = sum(latencies) / total if total else 0
+        accounted = 0.0
+        for stage in STAGES:
+            mean = sum(r["stages"].get(stage, 0.0) for r in self.results) / max(total, 1)
+            accounted += mean
+            share = mean / mean_latency * 100 if mean_latency else 0
+            print(f"  {stage:<10}: {mean * 1000:8.1f} ms ({share:5.1f}%)")
+        other = max(0.0, mean_latency - accounted)
+        share = other / mean_latency * 100 if mean_latency else 0
+        print(f"  {'other':<10}: {other * 1000:8.1f} ms ({share:5.1f}%)  # 框架开销 / 排队 / GIL")
+
+        if self.audit_cls:
+            from src.database.audit_writer import get_audit_writer
+
+            writer = get_audit_writer()
+            writer.flush()
+            stats = writer.stats()
+            print(
+                f"\n🗄️  审计写入: {stats['written']} 条 / {stats['batches']} 批, "
+                f"最大队列深度 {stats['max_queue_depth']}, 丢弃 {stats['dropped']}, 失败 {stats['failed']}"
+            )
+
+        if errors:
+            print("\n❌ 错误样例:")
+            for r in errors[:3]:
+                print(f"  - {r['error']}")
+
+
+def main():
+    args = parse_args()
+    # 必须在导入 src.config 之前设置环境变量
+    os.environ["LLM_PROVIDER"] = args.provider
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    if args.llm_latency is not None:
+        os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+    if args.llm_jitter is not None:
+        os.environ["FAKE_LLM_LATENCY_JITTER"] = str(args.llm_jitter)
+
+    print("⚙️  正在初始化 Agent...")
+    runner = LoadTestRunner(args)
+    print(f"🚀 开始压测: {args.sessions} 个并发会话 x {args.turns} 轮 ({args.mode})")
+    wall_time = runner.run_threads() if args.mode == "threads" else runner.run_asyncio()
+    runner.report(wall_time)
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m script.load_test --sessions 8 --turns 5
+    """
+    main()
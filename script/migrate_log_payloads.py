@@ -0,0 +1,77 @@
+# script/migrate_log_payloads.py
+"""
+把 chat_logs 中内联的大字段 (工具调用链 / RAG 片段 / Span) 迁入压缩去重的 log_payloads 表，
+并输出迁移前后的空间对比。可重复执行 (只处理尚未迁移的行)。
+
+    uv run python -m script.migrate_log_payloads
+    uv run python -m script.migrate_log_payloads --vacuum
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# 将项目根目录加入路径，确保能导入 src
+root_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from sqlalchemy import text
+
+from src.config import settings
+from src.database.models import engine
+from src.database.payloads import default_codec, migrate_inline_payloads, payload_report
+from src.database.repository import get_db
+
+
+def _kb(n: int) -> str:
+    return f"{n / 1024:,.1f} KB"
+
+
+def print_report(title: str, report: dict) -> None:
+    print(f"\n📊 {title}")
+    print(f"  内联 JSON        : {_kb(report['inline'])}")
+    print(f"  引用展开原始大小 : {_kb(report['logical'])}")
+    print(f"  去重后原始大小   : {_kb(report['unique'])} ({report['blobs']} 个 blob)")
+    print(f"  压缩后实际存储   : {_kb(report['stored'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移审计日志大字段到压缩侧表")
+    parser.add_argument("--chunk-size", type=int, default=500, help="每个事务迁移的行数")
+    parser.add_argument("--vacuum", action="store_true", help="迁移后 VACUUM 回收数据库文件空间")
+    args = parser.parse_args()
+
+    db_size = settings.DB_PATH.stat().st_size
+    with get_db() as db:
+        before = payload_report(db)
+        print_report("迁移前", before)
+
+        t0 = time.perf_counter()
+        migrated = migrate_inline_payloads(db, args.chunk_size)
+        print(
+            f"\n✅ 已迁移 {migrated} 条日志 (codec={default_codec()}, "
+            f"{time.perf_counter() - t0:.2f}s)"
+        )
+        after = payload_report(db)
+        print_report("迁移后", after)
+
+    # 节省 = 原内联大小 + 原有 blob 存储 - 当前内联与 blob 存储
+    saved = before["inline"] + before["stored"] - after["inline"] - after["stored"]
+    print(f"\n💾 大字段节省空间: {_kb(saved)}")
+    if after["logical"]:
+        print(
+            f"   去重率 {1 - after['unique'] / after['logical']:.1%}，"
+            f"整体压缩比 {after['logical'] / max(after['stored'], 1):.1f}x"
+        )
+
+    if args.vacuum:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        print(
+            f"🗜️ 数据库文件: {_kb(db_size)} -> {_kb(settings.DB_PATH.stat().st_size)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
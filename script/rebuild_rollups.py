@@ -0,0 +1,42 @@
+# script/rebuild_rollups.py
+"""
+从 chat_logs 重新计算 metrics_hourly / metrics_daily 预聚合表
+
+用于首次上线时回填历史日志，或聚合数据与日志不一致时修复。
+
+    uv run python -m script.rebuild_rollups
+    uv run python -m script.rebuild_rollups --since-days 7
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 将项目根目录加入路径，确保能导入 src
+root_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.database.repository import MetricsRollupRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建审计指标预聚合表")
+    parser.add_argument(
+        "--since-days", type=int, default=None, help="只重建最近 N 天 (默认全部)"
+    )
+    args = parser.parse_args()
+
+    since = datetime.now() - timedelta(days=args.since_days) if args.since_days else None
+    t0 = time.perf_counter()
+    processed = MetricsRollupRepository.rebuild(since)
+    hourly = MetricsRollupRepository.get_rollups("hour", since)
+    daily = MetricsRollupRepository.get_rollups("day", since)
+    print(
+        f"✅ 已重建聚合: 日志 {processed} 条 -> 小时桶 {len(hourly)} 个, "
+        f"天桶 {len(daily)} 个 ({time.perf_counter() - t0:.2f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 # src/agent/agent_creator.py
 from datetime import datetime
-from typing import List
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+import asyncio
 import sys
+import threading
 import importlib.metadata
 import logging
 
@@ -33,12 +34,18 @@ except ImportError as e:
     )
     sys.exit(1)
 
+from langchain.chains.base import Chain
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import BaseTool
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.callbacks import BaseCallbackHandler
-from langchain_community.chat_models import ChatZhipuAI
-
+from langchain_core.callbacks import (
+    AsyncCallbackManager,
+    BaseCallbackHandler,
+    CallbackManager,
+)
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig, ensure_config
+from langchain_core.runnables.utils import AddableDict
 # from langchain_community.chat_models import ChatTongyi
 try:
     from langchain_openai import ChatOpenAI
@@ -49,6 +56,131 @@ from src.tools.port_tools import all_tools
 from src.rag.retriever_factory import get_rag_tool
 from src.config import settings
 from src.agent.prompts import SYSTEM_PROMPT_TEMPLATE
+from src.agent.prerouter import EntityPrefetcher
+from src.agent.fast_path import apply_prefetch, template_output
+from src.agent.fake_llm import FakePortChatModel
+from src.agent.hedging import HedgedChatModel
+from src.agent.scratchpad import ScratchpadCompactor, project_observation
+from src.agent.plan_execute import PlanExecuteExecutor, build_plan_prompts
+from src.database.repository import ProviderStatRepository
+from src.database.audit_writer import write_provider_stat
+from src.agent.llm_transport import (
+    get_async_http_client,
+    get_http_client,
+    get_timeout,
+)
+
+
+# 显式禁用智谱内置的联网搜索，防止模型自行搜索互联网干扰 RAG
+ZHIPU_WEB_SEARCH_OFF = {"type": "web_search", "web_search": {"enable": False}}
+
+
+class ZhipuChatOpenAI(ChatOpenAI):
+    """
+    智谱 OpenAI 兼容端点。
+    bind_tools 会整体覆盖 model_kwargs / extra_body 中的 tools，
+    因此在生成请求体时把关闭 web_search 的声明追加到已绑定的工具之后。
+    """
+
+    def _get_request_payload(self, input_, *, stop=None, **kwargs) -> dict:
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        payload["tools"] = [*payload.get("tools", []), ZHIPU_WEB_SEARCH_OFF]
+        return payload
+
+
+def build_request_context() -> Dict[str, Any]:
+    """生成单次请求的上下文变量 (每次调用时重新计算，避免长驻进程使用过期时间)"""
+    return {
+        "current_time": datetime.now().strftime("%Y年%m月%d日 %H:%M"),
+        # 无会话记忆时为空，由调用方通过 ConversationMemory.load_variables() 覆盖
+        "memory_context": "",
+    }
+
+
+class PortAgentExecutor(AgentExecutor):
+    """
+    支持调用时注入上下文的 AgentExecutor。
+    同一个执行器实例 (及其 LLM 客户端) 可以在多个请求之间安全复用，
+    调用方显式传入的同名变量优先于默认上下文。
+    """
+
+    # 实体预路由：调用 LLM 前先并发查询用户输入中出现的箱号/提单/船名
+    prefetcher: Optional[EntityPrefetcher] = None
+
+    def prep_inputs(self, inputs: Union[Dict[str, Any], Any]) -> Dict[str, str]:
+        inputs = super().prep_inputs(inputs)
+        return self._with_request_context(inputs)
+
+    async def aprep_inputs(self, inputs: Union[Dict[str, Any], Any]) -> Dict[str, str]:
+        inputs = await super().aprep_inputs(inputs)
+        # 预取包含线程池中的工具调用与知识库检索 (Embedding + FAISS)，放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self._with_request_context, inputs)
+
+    def _with_request_context(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        formatter = project_observation if settings.SCRATCHPAD_COMPACTION else None
+        return apply_prefetch({**build_request_context(), **inputs}, self.prefetcher, formatter)
+
+    def _call(self, inputs: Dict[str, Any], run_manager=None) -> Dict[str, Any]:
+        if inputs.get("fast_path_answer"):
+            return self._fast_path_output(inputs)
+        return super()._call(inputs, run_manager=run_manager)
+
+    async def _acall(self, inputs: Dict[str, Any], run_manager=None) -> Dict[str, Any]:
+        if inputs.get("fast_path_answer"):
+            return self._fast_path_output(inputs)
+        return await super()._acall(inputs, run_manager=run_manager)
+
+    # stream / astream (及 astream_events) 经由 AgentExecutorIterator 执行，不会调用 _call / _acall，
+    # 因此在进入迭代器之前先准备输入并判断快速通道；准备好的输入带有 prefetched_context，不会重复预取
+    def stream(
+        self,
+        input: Union[Dict[str, Any], Any],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Iterator[AddableDict]:
+        inputs = self.prep_inputs(input)
+        if not inputs.get("fast_path_answer"):
+            yield from super().stream(inputs, config, **kwargs)
+            return
+        config = ensure_config(config)
+        run_manager = CallbackManager.configure(
+            config.get("callbacks"), self.callbacks, self.verbose,
+            config.get("tags"), self.tags, config.get("metadata"), self.metadata,
+        ).on_chain_start(None, inputs, config.get("run_id"), name=config.get("run_name"))
+        output = self._fast_path_output(inputs)
+        run_manager.on_chain_end(output)
+        yield self._fast_path_chunk(output)
+
+    async def astream(
+        self,
+        input: Union[Dict[str, Any], Any],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[AddableDict]:
+        inputs = await self.aprep_inputs(input)
+        if not inputs.get("fast_path_answer"):
+            async for chunk in super().astream(inputs, config, **kwargs):
+                yield chunk
+            return
+        config = ensure_config(config)
+        run_manager = await AsyncCallbackManager.configure(
+            config.get("callbacks"), self.callbacks, self.verbose,
+            config.get("tags"), self.tags, config.get("metadata"), self.metadata,
+        ).on_chain_start(None, inputs, config.get("run_id"), name=config.get("run_name"))
+        output = self._fast_path_output(inputs)
+        await run_manager.on_chain_end(output)
+        yield self._fast_path_chunk(output)
+
+    def _fast_path_output(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        output = template_output(inputs)
+        if self.return_intermediate_steps:
+            output["intermediate_steps"] = []
+        return output
+
+    @staticmethod
+    def _fast_path_chunk(output: Dict[str, Any]) -> AddableDict:
+        """与 AgentExecutorIterator 最终输出块的结构一致"""
+        return AddableDict(**output, messages=[AIMessage(content=output["output"])])
 
 
 class PortAgentFactory:
@@ -61,67 +193,155 @@ class PortAgentFactory:
         return all_tools + [get_rag_tool()]
 
     def _init_llm(self) -> BaseChatModel:
-        provider = settings.LLM_PROVIDER
+        primary = settings.LLM_PROVIDER
+        secondary = settings.LLM_SECONDARY_PROVIDER
+        if not settings.LLM_HEDGING or secondary == primary:
+            return self._build_llm(primary)
+        # 对冲模式：主供应商慢于 p95 时并发请求备用供应商，并按错误率故障转移
+        logger.info(f"🔀 已启用对冲请求: {primary} -> {secondary}")
+        return HedgedChatModel.from_settings(
+            primary=self._build_llm(primary),
+            secondary=self._build_llm(secondary),
+            primary_name=primary,
+            secondary_name=secondary,
+            # 统计入队后由后台线程批量落库，不在请求路径上提交 SQLite
+            stats_sink=write_provider_stat,
+            history=ProviderStatRepository.get_recent_latencies,
+        )
+
+    def _build_llm(self, provider: str) -> BaseChatModel:
         if provider == "zhipu":
-            return ChatZhipuAI(
+            # 通过智谱的 OpenAI 兼容端点接入，从而复用共享连接池与重试策略；
+            # 请求中始终携带 web_search 关闭声明 (与原 ChatZhipuAI 配置一致)
+            return ZhipuChatOpenAI(
                 model=settings.ZHIPU_MODEL_NAME,
                 api_key=settings.ZHIPUAI_API_KEY,
+                base_url=settings.ZHIPU_BASE_URL,
                 temperature=self.temperature,
                 # Zhipu 建议关闭流式以获得更稳定的工具调用
                 streaming=False,
-                # 注意: ChatZhipuAI 默认会在 llm_output 中返回 token_usage
-                # 显式禁用搜索工具，防止模型自行搜索互联网干扰 RAG
-                model_kwargs={
-                    "tools": [{"type": "web_search", "web_search": {"enable": False}}]
-                },
+                **self._transport_kwargs(provider),
             )
         elif provider == "qwen":
             return ChatOpenAI(
                 model=settings.QWEN_MODEL_NAME,  # 确保这里是 "qwen-turbo" 或 "qwen-max"
                 api_key=settings.DASHSCOPE_API_KEY,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",  # 阿里云兼容端点
+                base_url=settings.QWEN_BASE_URL,  # 阿里云兼容端点
                 temperature=self.temperature,
-                streaming=False,  # 即使这里设为 False，ChatOpenAI 也能处理 Agent 强制的 stream 调用
+                # 开启后 on_llm_new_token 回调逐 Token 触发，用于 CLI / Web 实时输出
+                streaming=settings.LLM_STREAMING,
                 # 关键: 强制要求返回 Token 用量 (OpenAI 协议兼容)
                 model_kwargs={"stream_options": {"include_usage": True}},
+                **self._transport_kwargs(provider),
             )
+        elif provider == "fake":
+            # 离线模拟模型：规则/脚本驱动的工具调用，用于无 Key 环境下的压测
+            return FakePortChatModel.from_settings()
         else:
             raise ValueError(f"❌ Unsupport Provider: {provider}")
 
+    @staticmethod
+    def _transport_kwargs(provider: str) -> Dict[str, Any]:
+        """共享连接池 + 超时；重试由传输层统一处理，关闭 SDK 自带重试"""
+        return {
+            "http_client": get_http_client(provider),
+            "http_async_client": get_async_http_client(provider),
+            "timeout": get_timeout(),
+            "max_retries": 0,
+        }
+
     def _build_prompt(self) -> ChatPromptTemplate:
-        current_time_str = datetime.now().strftime("%Y年%m月%d日 %H:%M")
-        prompt = ChatPromptTemplate.from_messages(
+        # current_time 不再通过 partial 固化，而是在每次调用时由 PortAgentExecutor 注入
+        return ChatPromptTemplate.from_messages(
             [
                 ("system", SYSTEM_PROMPT_TEMPLATE),
+                # 会话记忆的滑动窗口 (可选)
+                ("placeholder", "{chat_history}"),
                 ("human", "{input}"),
+                # 预路由注入的工具调用结果 (可选)，位置等同于首轮工具调用
+                ("placeholder", "{prefetched_context}"),
                 ("placeholder", "{agent_scratchpad}"),
             ]
         )
-        return prompt.partial(current_time=current_time_str)
 
     def create_executor(
         self,
         verbose: bool = True,
         callbacks: Optional[List[BaseCallbackHandler]] = None,
-    ) -> AgentExecutor:
+    ) -> Chain:
         """
-        创建 Agent 执行器
+        创建 Agent 执行器 (按 settings.AGENT_MODE 选择 ReAct 或 Plan-then-Execute)
         :param verbose: 是否打印详细日志
         :param callbacks: 回调列表，用于传递给 Agent 监控 Token 和耗时
         """
+        if settings.AGENT_MODE != "plan":
+            return self._create_react_executor(verbose, callbacks)
+
+        planning_prompt, synthesis_prompt = build_plan_prompts()
+        return PlanExecuteExecutor(
+            llm=self.llm,
+            tools=self.tools,
+            planning_prompt=planning_prompt,
+            synthesis_prompt=synthesis_prompt,
+            # 计划不完整时回退到 ReAct，复用已执行的工具结果 (回调由外层向下传递)
+            fallback=self._create_react_executor(verbose),
+            context_factory=build_request_context,
+            observation_formatter=(
+                project_observation if settings.SCRATCHPAD_COMPACTION else None
+            ),
+            # 规划前先预路由，纯状态查询同样走模板快速通道
+            prefetcher=self._build_prefetcher(),
+            max_workers=settings.PREFETCH_MAX_WORKERS,
+            verbose=verbose,
+            callbacks=callbacks,
+        )
+
+    def _build_prefetcher(self) -> Optional[EntityPrefetcher]:
+        if not settings.PREFETCH_ENABLED:
+            return None
+        return EntityPrefetcher(self.tools, max_workers=settings.PREFETCH_MAX_WORKERS)
+
+    def _create_react_executor(
+        self,
+        verbose: bool = True,
+        callbacks: Optional[List[BaseCallbackHandler]] = None,
+    ) -> AgentExecutor:
         prompt = self._build_prompt()
-        agent = create_tool_calling_agent(self.llm, self.tools, prompt)
+        # 工具结果压缩后再写入 scratchpad，避免输入 Token 随迭代轮数平方增长
+        formatter_kwargs = (
+            {"message_formatter": ScratchpadCompactor.from_settings()}
+            if settings.SCRATCHPAD_COMPACTION
+            else {}
+        )
+        agent = create_tool_calling_agent(
+            self.llm, self.tools, prompt, **formatter_kwargs
+        )
 
-        return AgentExecutor(
+        return PortAgentExecutor(
             agent=agent,
             tools=self.tools,
             verbose=verbose,
             callbacks=callbacks,  # ✅  将监控回调注入到执行器
             handle_parsing_errors=True,
             max_iterations=5,
+            prefetcher=self._build_prefetcher(),
         )
 
 
-def create_port_agent() -> AgentExecutor:
-    factory = PortAgentFactory()
-    return factory.create_executor()
+# --- 进程级共享工厂 (LLM 客户端与工具只初始化一次) ---
+_shared_factory: Optional[PortAgentFactory] = None
+_shared_factory_lock = threading.Lock()
+
+
+def get_agent_factory() -> PortAgentFactory:
+    """获取进程内共享的 PortAgentFactory 单例 (线程安全)"""
+    global _shared_factory
+    if _shared_factory is None:
+        with _shared_factory_lock:
+            if _shared_factory is None:
+                _shared_factory = PortAgentFactory()
+    return _shared_factory
+
+
+def create_port_agent() -> Chain:
+    return get_agent_factory().create_executor()
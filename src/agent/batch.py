@@ -0,0 +1,155 @@
+# src/agent/batch.py
+"""
+批量离线诊断 (Batch Diagnosis)
+
+从查询文件流式读取问题，用线程池并发驱动同一个 Agent 执行器 (执行器可跨请求复用)，
+每完成一条即追加一行 JSON 到结果文件并刷盘。再次运行时跳过结果文件中已成功的查询，
+因此中断后可直接续跑；失败的查询会重新执行，读取结果时按 id 取最后一条即可。
+
+查询文件支持两种格式：
+- query_examples 剧本格式：取每个 "**Query:**" 之后的第一行引用 (> “...”)；
+- 纯文本：每行一条查询，# 开头为注释。
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+from langchain.chains.base import Chain
+
+from src.web.callbacks import AgentMonitorCallback
+
+QUERY_MARKER = "**Query"
+QUOTE_CHARS = "“”\"'‘’ "
+
+
+def _clean_query(text: str) -> str:
+    return text.lstrip(">").strip().replace("**", "").strip(QUOTE_CHARS)
+
+
+def query_id(lineno: int, query: str) -> str:
+    """查询 id：行号 + 内容摘要 (文件中重复的问题按行区分)"""
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:8]
+    return f"{lineno}-{digest}"
+
+
+def iter_queries(path: Path) -> Iterator[Tuple[str, str]]:
+    """逐行读取查询文件，产出 (id, query)"""
+    with path.open(encoding="utf-8") as f:
+        markdown = any(line.lstrip().startswith(QUERY_MARKER) for line in f)
+
+    with path.open(encoding="utf-8") as f:
+        pending = False
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if markdown:
+                if line.startswith(QUERY_MARKER):
+                    pending = True
+                elif pending and line.startswith(">"):
+                    pending = False
+                    query = _clean_query(line)
+                    if query:
+                        yield query_id(lineno, query), query
+            elif line and not line.startswith("#"):
+                yield query_id(lineno, line), line
+
+
+def completed_ids(out_path: Path) -> Set[str]:
+    """结果文件中已成功的查询 id (末尾被中断写坏的行忽略)"""
+    done: Set[str] = set()
+    if not out_path.exists():
+        return done
+    with out_path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "success":
+                done.add(record["id"])
+            else:
+                done.discard(record.get("id"))
+    return done
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        executor: Chain,
+        out_path: Path,
+        concurrency: int = 4,
+        session_id: Optional[str] = None,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.executor = executor
+        self.out_path = out_path
+        self.concurrency = max(1, concurrency)
+        self.session_id = session_id
+        self.on_result = on_result
+        self._write_lock = threading.Lock()
+        # 限制已提交但未完成的任务数，查询文件不会被一次性读入内存
+        self._slots = threading.BoundedSemaphore(self.concurrency * 2)
+
+    def run(self, query_path: Path) -> Dict[str, int]:
+        done = completed_ids(self.out_path)
+        stats = {"submitted": 0, "skipped": 0, "success": 0, "error": 0}
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self.out_path.open("a", encoding="utf-8") as out, ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="batch"
+        ) as pool:
+            if out.tell() and not self._ends_with_newline():
+                # 上次中断时写了半行，另起一行避免与新记录粘连
+                out.write("\n")
+            for qid, query in iter_queries(query_path):
+                if qid in done:
+                    stats["skipped"] += 1
+                    continue
+                self._slots.acquire()
+                stats["submitted"] += 1
+                future = pool.submit(self._diagnose, qid, query)
+                future.add_done_callback(lambda f: self._write(out, f, stats))
+        return stats
+
+    def _ends_with_newline(self) -> bool:
+        with self.out_path.open("rb") as f:
+            f.seek(-1, 2)
+            return f.read(1) == b"\n"
+
+    def _diagnose(self, qid: str, query: str) -> Dict[str, Any]:
+        monitor = AgentMonitorCallback(session_id=self.session_id)
+        record: Dict[str, Any] = {"id": qid, "query": query}
+        t0 = time.perf_counter()
+        try:
+            response = self.executor.invoke(
+                {"input": query}, config={"callbacks": [monitor]}
+            )
+            record.update(status="success", output=response["output"], error=None)
+        except Exception as e:
+            record.update(status="error", output=None, error=str(e))
+        record.update(
+            latency=round(time.perf_counter() - t0, 3),
+            ttft=monitor.ttft,
+            tokens=monitor.token_usage,
+            llm_calls=monitor.llm_calls,
+            llm_calls_saved=monitor.llm_calls_saved,
+            tokens_saved=monitor.tokens_saved,
+            finished_at=datetime.now().isoformat(timespec="seconds"),
+        )
+        return record
+
+    def _write(self, out, future: Future, stats: Dict[str, int]) -> None:
+        try:
+            record = future.result()
+            with self._write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                stats[record["status"]] += 1
+            if self.on_result:
+                self.on_result(record)
+        finally:
+            self._slots.release()
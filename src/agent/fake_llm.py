@@ -0,0 +1,334 @@
+# src/agent/fake_llm.py
+"""
+离线 Fake 聊天模型 (LLM_PROVIDER=fake)
+
+不依赖任何在线 API Key，按规则 (或脚本) 生成工具调用和最终答案，
+并模拟网络延迟与 Token 用量，用于在离线环境下压测完整的 AgentExecutor 流水线、
+回调与审计日志。
+
+脚本文件格式 (JSON)：
+[
+  {"match": "BILL_RISK", "steps": [
+      {"tool_calls": [{"name": "get_customs_status", "args": {"bill_of_lading": "BILL_RISK"}}]},
+      {"content": "最终答案..."}
+  ]},
+  {"steps": [{"content": "默认回答"}]}
+]
+按最近一条用户消息匹配第一个 match (正则) 命中的条目，第 N 轮 LLM 调用使用 steps[N]。
+"""
+import asyncio
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import (
+    BaseChatModel,
+    agenerate_from_stream,
+    generate_from_stream,
+)
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from src.config import settings
+from src.agent.prerouter import (
+    CONTAINER_TOOL_NAME,
+    CUSTOMS_TOOL_NAME,
+    VESSEL_TOOL_NAME,
+    extract_entities,
+)
+from src.agent.memory import estimate_tokens
+
+
+def _parse_observation(content: Any) -> Any:
+    if isinstance(content, str):
+        try:
+            return json.loads(content)
+        except (TypeError, ValueError):
+            return content
+    return content
+
+
+class FakePortChatModel(BaseChatModel):
+    """确定性的本地聊天模型，支持工具调用、流式输出和模拟延迟"""
+
+    # 每次调用的模拟延迟 (秒) 及随机抖动范围
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # 若设置则每次调用固定返回该用量，否则按消息长度估算
+    fixed_token_usage: Optional[Dict[str, int]] = None
+    script: Optional[List[Dict[str, Any]]] = None
+    seed: Optional[int] = None
+    # 与 ChatOpenAI 一致：开启后 invoke 也走流式路径并触发 on_llm_new_token
+    streaming: bool = False
+    # 流式输出时每个 chunk 的字符数
+    stream_chunk_size: int = 4
+    # bind_tools 绑定的工具名
+    tool_names: List[str] = []
+
+    @classmethod
+    def from_settings(cls) -> "FakePortChatModel":
+        script = None
+        if settings.FAKE_LLM_SCRIPT_PATH:
+            script_path = Path(settings.FAKE_LLM_SCRIPT_PATH)
+            script = json.loads(script_path.read_text(encoding="utf-8"))
+        return cls(
+            latency=settings.FAKE_LLM_LATENCY,
+            latency_jitter=settings.FAKE_LLM_LATENCY_JITTER,
+            script=script,
+            seed=settings.FAKE_LLM_SEED,
+            streaming=settings.LLM_STREAMING,
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-port"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakePortChatModel":
+        names = [convert_to_openai_tool(t)["function"]["name"] for t in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    # ------------------------------------------------------------------
+    # LangChain 接口
+    # ------------------------------------------------------------------
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            return generate_from_stream(
+                self._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+        time.sleep(self._sample_latency(messages))
+        message = self._respond(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            return await agenerate_from_stream(
+                self._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+        await asyncio.sleep(self._sample_latency(messages))
+        message = self._respond(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._sample_latency(messages))
+        for chunk in self._to_chunks(self._respond(messages)):
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._sample_latency(messages))
+        for chunk in self._to_chunks(self._respond(messages)):
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    # ------------------------------------------------------------------
+    # 内部逻辑
+    # ------------------------------------------------------------------
+    def _sample_latency(self, messages: List[BaseMessage]) -> float:
+        if not self.latency and not self.latency_jitter:
+            return 0.0
+        # 以对话内容为种子，保证相同输入得到相同延迟
+        rng = random.Random(f"{self.seed}:{messages[-1].content if messages else ''}")
+        return max(0.0, self.latency + rng.uniform(-1, 1) * self.latency_jitter)
+
+    def _to_chunks(self, message: AIMessage) -> List[ChatGenerationChunk]:
+        if message.tool_calls:
+            chunk = AIMessageChunk(
+                content=message.content,
+                tool_call_chunks=[
+                    {
+                        "name": tc["name"],
+                        "args": json.dumps(tc["args"], ensure_ascii=False),
+                        "id": tc["id"],
+                        "index": i,
+                    }
+                    for i, tc in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            )
+            return [ChatGenerationChunk(message=chunk)]
+
+        text = message.content
+        size = max(1, self.stream_chunk_size)
+        pieces = [text[i : i + size] for i in range(0, len(text), size)] or [""]
+        chunks = [ChatGenerationChunk(message=AIMessageChunk(content=p)) for p in pieces]
+        # 用量只在最后一个 chunk 上报 (与 OpenAI include_usage 行为一致)
+        chunks[-1] = ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=pieces[-1], usage_metadata=message.usage_metadata
+            )
+        )
+        return chunks
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        turn = self._current_turn(messages)
+        step = self._scripted_step(turn) if self.script else self._rule_based_step(turn)
+
+        tool_calls = [
+            {"name": tc["name"], "args": tc.get("args", {}), "id": f"call_{turn['round']}_{i}"}
+            for i, tc in enumerate(step.get("tool_calls", []))
+            if not self.tool_names or tc["name"] in self.tool_names
+        ]
+        content = "" if tool_calls else step.get("content", "")
+        return AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata=self._usage(messages, content, tool_calls),
+            response_metadata={"model_name": self._llm_type},
+        )
+
+    def _usage(self, messages, content: str, tool_calls: List[Dict]) -> Dict[str, int]:
+        if self.fixed_token_usage:
+            usage = dict(self.fixed_token_usage)
+            usage.setdefault(
+                "total_tokens",
+                usage.get("input_tokens", 0) + usage.get("output_tokens", 0),
+            )
+            return usage
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(content) + 20 * len(tool_calls)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    @staticmethod
+    def _current_turn(messages: List[BaseMessage]) -> Dict[str, Any]:
+        """解析最近一条用户消息之后的工具调用与结果"""
+        last_human = max(
+            (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)),
+            default=-1,
+        )
+        user_input = messages[last_human].content if last_human >= 0 else ""
+        after = messages[last_human + 1 :]
+
+        call_names = {}
+        for m in after:
+            if isinstance(m, AIMessage):
+                for tc in m.tool_calls:
+                    call_names[tc["id"]] = tc["name"]
+        observations = [
+            (call_names.get(m.tool_call_id, ""), _parse_observation(m.content))
+            for m in after
+            if isinstance(m, ToolMessage)
+        ]
+        return {
+            "input": str(user_input),
+            "round": sum(1 for m in after if isinstance(m, AIMessage)),
+            "observations": observations,
+        }
+
+    def _scripted_step(self, turn: Dict[str, Any]) -> Dict[str, Any]:
+        for entry in self.script:
+            pattern = entry.get("match")
+            if pattern is None or re.search(pattern, turn["input"]):
+                steps = entry.get("steps") or [{"content": ""}]
+                return steps[min(turn["round"], len(steps) - 1)]
+        return {"content": "（脚本未覆盖该问题）"}
+
+    def _rule_based_step(self, turn: Dict[str, Any]) -> Dict[str, Any]:
+        observations = turn["observations"]
+        called = {name for name, _ in observations}
+
+        # 1. 尚未查询数据：按抽取到的实体调用查询工具
+        if not observations:
+            entities = extract_entities(turn["input"])
+            calls = (
+                [{"name": CONTAINER_TOOL_NAME, "args": {"container_id": c}} for c in entities.containers]
+                + [{"name": CUSTOMS_TOOL_NAME, "args": {"bill_of_lading": b}} for b in entities.bills]
+                + [{"name": VESSEL_TOOL_NAME, "args": {"vessel_name": v}} for v in entities.vessels]
+            )
+            if calls:
+                return {"tool_calls": calls}
+            return {"content": "请提供需要查询的箱号、提单号或船名，我来帮您核查。"}
+
+        # 2. 报关异常且尚未检索知识库：调用 RAG
+        codes = [
+            obs.get("customs_code") or obs.get("customs_status")
+            for name, obs in observations
+            if name == CUSTOMS_TOOL_NAME
+            and isinstance(obs, dict)
+            and obs.get("customs_status") != "放行"
+        ]
+        if codes and settings.RETRIEVER_TOOL_NAME not in called:
+            return {
+                "tool_calls": [
+                    {
+                        "name": settings.RETRIEVER_TOOL_NAME,
+                        "args": {"query": f"{code} 含义、处理时效及应对策略"},
+                    }
+                    for code in dict.fromkeys(codes)
+                ]
+            }
+
+        # 3. 汇总输出最终答案
+        return {"content": self._render_answer(observations, codes)}
+
+    @staticmethod
+    def _render_answer(observations, codes: List[str]) -> str:
+        status_lines = []
+        knowledge = []
+        for name, obs in observations:
+            if name == settings.RETRIEVER_TOOL_NAME:
+                knowledge.append(str(obs)[:120])
+            elif isinstance(obs, dict):
+                fields = "，".join(f"{k}: {v}" for k, v in obs.items())
+                status_lines.append(f"- {fields}")
+            else:
+                status_lines.append(f"- {obs}")
+
+        if codes:
+            diagnosis = f"报关状态异常 ({'、'.join(codes)})。" + (
+                f"知识库参考：{knowledge[0]}" if knowledge else ""
+            )
+            advice = "1. 立即联系报关行确认查验进度。\n2. 对比截关时间评估是否需要申请预漏装。"
+        else:
+            diagnosis = "未发现报关异常。"
+            advice = "1. 按计划跟进装船即可。"
+
+        return (
+            "**🔍 状态核查**\n"
+            + "\n".join(status_lines)
+            + f"\n\n**🧠 智能诊断**\n{diagnosis}"
+            + f"\n\n**💡 行动建议**\n{advice}"
+        )
@@ -0,0 +1,137 @@
+# src/agent/fast_path.py
+"""
+纯状态查询快速通道 (Template Fast Path)
+
+"箱子 X 现在什么状态" 这类问题只需要把查询结果念给用户，不需要任何推理。
+预路由已经并发查到了全部数据，本模块判断能否直接用模板回答：
+- 分类：问题只包含状态查询意图，不含时效推算 / 风险 / 建议等需要推理的诉求；
+- 校验：所有实体都查到了结构化结果，且没有报关异常 (H98 / 人工查验) 或 VGM 未发送；
+- 渲染：按系统提示词约定的 "🔍 状态核查" 格式输出。
+任一条件不满足即返回 None，交给 LLM Agent 处理。
+"""
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import settings
+from src.agent.prerouter import (
+    CONTAINER_TOOL_NAME,
+    CUSTOMS_TOOL_NAME,
+    VESSEL_TOOL_NAME,
+    EntityPrefetcher,
+    PrefetchResult,
+    find_customs_exceptions,
+)
+
+logger = logging.getLogger(__name__)
+
+ROUTE_TEMPLATE = "template"
+ROUTE_AGENT = "agent"
+
+# 问题中至少出现一个状态查询意图
+STATUS_INTENT_KEYWORDS = (
+    "状态", "查一下", "查下", "查询", "查个", "在哪", "到哪", "进港",
+    "放行", "靠泊", "船期", "动态", "正常吗",
+)
+# 出现这些诉求说明需要推理，交给 LLM
+ESCALATION_KEYWORDS = (
+    "怎么办", "赶上", "赶得上", "来得及", "能否", "能不能", "风险", "为什么",
+    "建议", "分析", "含义", "意思", "多久", "影响", "应对", "截关", "H98",
+    "查验", "急", "比较", "对比", "如果",
+)
+
+FIELD_LABELS = {
+    "status": "状态",
+    "vgm_status": "VGM",
+    "location": "位置",
+    "customs_status": "海关状态",
+    "customs_code": "指令",
+    "declaration_time": "申报时间",
+    "instruction_time": "指令时间",
+    "voyage": "航次",
+    "estimated_berthing_time": "预计靠泊",
+    "customs_clearance_deadline": "截关时间(CVT)",
+}
+# 各工具结果的主键字段与展示名
+SUBJECTS = {
+    CONTAINER_TOOL_NAME: ("container_id", "📦 箱号"),
+    CUSTOMS_TOOL_NAME: ("bill_of_lading", "📄 提单"),
+    VESSEL_TOOL_NAME: ("vessel_name", "🚢 船舶"),
+}
+
+
+def is_status_query(text: str) -> bool:
+    """问题是否只是在询问状态 (不含需要推理的诉求)"""
+    upper_text = text.upper()
+    if any(k in upper_text for k in ESCALATION_KEYWORDS):
+        return False
+    return any(k in text for k in STATUS_INTENT_KEYWORDS)
+
+
+def _has_anomaly(prefetch: PrefetchResult) -> bool:
+    if find_customs_exceptions(prefetch.calls):
+        return True
+    for call in prefetch.calls:
+        # 未查到 / 多条匹配等反馈，或数据源异常，需要 LLM 组织回复
+        if call.tool not in SUBJECTS or not isinstance(call.result, dict):
+            return True
+        if call.tool == CONTAINER_TOOL_NAME and call.result.get("vgm_status") not in (
+            None,
+            "已发送",
+        ):
+            return True
+    return False
+
+
+def _render_line(tool: str, result: Dict[str, Any]) -> str:
+    key, label = SUBJECTS[tool]
+    fields = "，".join(
+        f"{FIELD_LABELS.get(k, k)}: {v}" for k, v in result.items() if k != key and v
+    )
+    return f"- {label} **{result.get(key, '-')}**：{fields}"
+
+
+def render_status_answer(text: str, prefetch: Optional[PrefetchResult]) -> Optional[str]:
+    """满足快速通道条件时返回模板答案，否则返回 None"""
+    if not prefetch or not prefetch.calls or not is_status_query(text):
+        return None
+    if _has_anomaly(prefetch):
+        return None
+
+    lines: List[str] = [_render_line(c.tool, c.result) for c in prefetch.calls]
+    return (
+        "**🔍 状态核查**\n"
+        + "\n".join(lines)
+        + "\n\n**💡 结论**\n所查单证状态正常，未发现报关异常或 VGM 缺失，按计划跟进即可。"
+    )
+
+
+def apply_prefetch(
+    inputs: Dict[str, Any],
+    prefetcher: Optional[EntityPrefetcher],
+    formatter: Optional[Callable[[str, Any], str]] = None,
+) -> Dict[str, Any]:
+    """
+    执行预路由并判断快速通道 (ReAct 与 Plan-then-Execute 两种模式共用)
+    写入 prefetched_context (预取过即存在，为空表示无结果)、prefetch_stats，
+    模板可以作答时写入 fast_path_answer
+    """
+    # 已经预取过 (例如调用方自行处理) 则不重复执行
+    if not prefetcher or "prefetched_context" in inputs:
+        return inputs
+    inputs = dict(inputs)
+    prefetch = prefetcher.prefetch(inputs.get("input", ""))
+    inputs["prefetched_context"] = []
+    if prefetch:
+        inputs["prefetched_context"] = prefetch.to_messages(formatter)
+        inputs["prefetch_stats"] = prefetch.stats()
+    if settings.FAST_PATH_ENABLED:
+        answer = render_status_answer(inputs.get("input", ""), prefetch)
+        if answer:
+            inputs["fast_path_answer"] = answer
+    return inputs
+
+
+def template_output(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """纯状态查询：直接返回模板答案，跳过 LLM；只有模板实际作答时才标记 route"""
+    logger.info("⚡ 模板快速通道命中，跳过 LLM")
+    return {"output": inputs["fast_path_answer"], "route": ROUTE_TEMPLATE}
@@ -0,0 +1,342 @@
+# src/agent/hedging.py
+"""
+对冲请求 (Hedged Requests) 与故障转移
+
+HedgedChatModel 包装主 / 备两个聊天模型：
+- 主供应商在 p95 延迟 (滚动统计) 内未返回时，向备用供应商发送同一请求，先返回者胜出；
+- 任一请求失败时立即改用另一家，不必等待对冲延迟；
+- 某个供应商错误率超过阈值时熔断，冷却期内优先使用另一家 (故障转移)。
+
+每次底层调用的延迟 / 成败通过 stats_sink 回调持久化 (审计库 provider_stats 表)，
+启动时可用历史延迟预热 p95。stats_sink 在请求路径上 (异步调用时即事件循环中) 同步执行，
+应只做入队等轻量操作 (见 audit_writer.write_provider_stat)。
+
+注意：对冲模式下底层模型不接入外部回调，最终答案不会逐 Token 流式输出。
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 底层调用与外层回调隔离，避免 LLM 调用次数与 Token 被重复统计
+_DETACHED_CONFIG = {"callbacks": []}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    """同步路径共享的线程池 (落败的请求会在后台跑完并记录统计)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        return _pool
+
+
+class ProviderHealth:
+    """单个供应商的滚动延迟与错误率统计 (线程安全)"""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 200,
+        error_window: int = 20,
+        error_threshold: float = 0.5,
+        min_samples: int = 5,
+        cooldown: float = 30.0,
+    ):
+        self.name = name
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.tripped_until = 0.0
+        self._latencies: deque = deque(maxlen=window)
+        self._outcomes: deque = deque(maxlen=error_window)
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.tripped_until
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._error_rate()
+
+    def _error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def seed(self, latencies: Sequence[float]) -> None:
+        """用历史延迟预热 (不影响错误率)"""
+        with self._lock:
+            self._latencies.extend(latencies)
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self._latencies.append(latency)
+            self._outcomes.append(ok)
+            if (
+                len(self._outcomes) >= self.min_samples
+                and self._error_rate() >= self.error_threshold
+            ):
+                # 熔断后清空窗口，冷却结束需重新积累样本才会再次熔断
+                self.tripped_until = time.monotonic() + self.cooldown
+                self._outcomes.clear()
+                logger.warning(
+                    f"🔌 [{self.name}] 错误率过高，熔断 {self.cooldown:.0f}s，切换备用供应商"
+                )
+
+    def percentile(self, p: float) -> Optional[float]:
+        """最近秩法计算延迟分位数，无样本时返回 None"""
+        with self._lock:
+            ordered = sorted(self._latencies)
+        if not ordered:
+            return None
+        rank = max(1, min(len(ordered), math.ceil(p / 100 * len(ordered))))
+        return ordered[rank - 1]
+
+
+class HedgedChatModel(BaseChatModel):
+    """主备供应商对冲请求 + 基于健康度的故障转移"""
+
+    primary: BaseChatModel
+    secondary: BaseChatModel
+    primary_name: str = "primary"
+    secondary_name: str = "secondary"
+    # bind_tools 后的可调用对象 (未绑定工具时直接调用模型本身)
+    primary_runnable: Optional[Runnable] = None
+    secondary_runnable: Optional[Runnable] = None
+    # 按供应商名索引；bind_tools 产生的副本共享同一份统计
+    health: Dict[str, ProviderHealth] = {}
+    hedge_percentile: float = 95.0
+    default_delay: float = 3.0
+    min_delay: float = 0.5
+    max_delay: float = 15.0
+    # 每次底层调用结束后回调 (provider, latency, success, hedged, error)
+    stats_sink: Optional[Callable[..., Any]] = None
+
+    @classmethod
+    def from_settings(
+        cls,
+        primary: BaseChatModel,
+        secondary: BaseChatModel,
+        primary_name: str,
+        secondary_name: str,
+        stats_sink: Optional[Callable[..., Any]] = None,
+        history: Optional[Callable[[str], List[float]]] = None,
+    ) -> "HedgedChatModel":
+        health = {}
+        for name in (primary_name, secondary_name):
+            health[name] = ProviderHealth(
+                name,
+                window=settings.HEDGE_WINDOW,
+                error_threshold=settings.FAILOVER_ERROR_RATE,
+                min_samples=settings.FAILOVER_MIN_SAMPLES,
+                cooldown=settings.FAILOVER_COOLDOWN,
+            )
+            if history:
+                health[name].seed(history(name))
+        return cls(
+            primary=primary,
+            secondary=secondary,
+            primary_name=primary_name,
+            secondary_name=secondary_name,
+            health=health,
+            hedge_percentile=settings.HEDGE_PERCENTILE,
+            default_delay=settings.HEDGE_DEFAULT_DELAY,
+            min_delay=settings.HEDGE_MIN_DELAY,
+            max_delay=settings.HEDGE_MAX_DELAY,
+            stats_sink=stats_sink,
+        )
+
+    def model_post_init(self, __context: Any) -> None:
+        for name in (self.primary_name, self.secondary_name):
+            self.health.setdefault(name, ProviderHealth(name))
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"primary": self.primary_name, "secondary": self.secondary_name}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "HedgedChatModel":
+        return self.model_copy(
+            update={
+                "primary_runnable": self.primary.bind_tools(tools, **kwargs),
+                "secondary_runnable": self.secondary.bind_tools(tools, **kwargs),
+            }
+        )
+
+    def hedge_delay(self, provider: str) -> float:
+        """对冲延迟：该供应商的 p95 延迟，样本不足时使用默认值"""
+        delay = self.health[provider].percentile(self.hedge_percentile)
+        if delay is None:
+            delay = self.default_delay
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _order(self) -> List[Tuple[str, Runnable]]:
+        """返回 (供应商名, 可调用对象) 的调用顺序；主供应商熔断时先调用备用"""
+        order = [
+            (self.primary_name, self.primary_runnable or self.primary),
+            (self.secondary_name, self.secondary_runnable or self.secondary),
+        ]
+        if not self.health[self.primary_name].healthy and self.health[
+            self.secondary_name
+        ].healthy:
+            order.reverse()
+        return order
+
+    def _record(
+        self, provider: str, latency: float, ok: bool, hedged: bool, error=None
+    ) -> None:
+        self.health[provider].record(latency, ok)
+        if self.stats_sink:
+            try:
+                self.stats_sink(provider, latency, ok, hedged, error)
+            except Exception as e:
+                logger.warning(f"⚠️ 供应商统计写入失败: {e}")
+
+    @staticmethod
+    def _to_result(message: AIMessage, provider: str, hedged: bool) -> ChatResult:
+        message.response_metadata = {**message.response_metadata, "provider": provider}
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"provider": provider, "hedged": hedged},
+        )
+
+    # ------------------------------------------------------------------
+    # 同步路径：线程池
+    # ------------------------------------------------------------------
+    def _call(self, provider, target, messages, stop, hedged, kwargs) -> AIMessage:
+        t0 = time.perf_counter()
+        try:
+            message = target.invoke(messages, _DETACHED_CONFIG, stop=stop, **kwargs)
+        except Exception as e:
+            self._record(provider, time.perf_counter() - t0, False, hedged, str(e))
+            raise
+        self._record(provider, time.perf_counter() - t0, True, hedged)
+        return message
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        order = self._order()
+        futures: Dict[Future, str] = {}
+
+        def launch(index: int) -> Future:
+            provider, target = order[index]
+            future = _get_pool().submit(
+                self._call, provider, target, messages, stop, index > 0, kwargs
+            )
+            futures[future] = provider
+            return future
+
+        pending = {launch(0)}
+        done, _ = wait(pending, timeout=self.hedge_delay(order[0][0]))
+        if not done:
+            logger.info(f"⏱️ [{order[0][0]}] 超过对冲延迟，同时请求 {order[1][0]}")
+            pending.add(launch(1))
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    return self._to_result(
+                        future.result(), futures[future], len(futures) > 1
+                    )
+                if len(futures) == 1:
+                    logger.warning(f"⚠️ [{futures[future]}] 调用失败，切换 {order[1][0]}")
+                    pending.add(launch(1))
+        raise error
+
+    # ------------------------------------------------------------------
+    # 异步路径：任务竞速，落败者被取消
+    # ------------------------------------------------------------------
+    async def _acall(self, provider, target, messages, stop, hedged, kwargs) -> AIMessage:
+        t0 = time.perf_counter()
+        try:
+            message = await target.ainvoke(
+                messages, _DETACHED_CONFIG, stop=stop, **kwargs
+            )
+        except Exception as e:
+            self._record(provider, time.perf_counter() - t0, False, hedged, str(e))
+            raise
+        self._record(provider, time.perf_counter() - t0, True, hedged)
+        return message
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        order = self._order()
+        tasks: Dict[asyncio.Task, str] = {}
+
+        def launch(index: int) -> asyncio.Task:
+            provider, target = order[index]
+            task = asyncio.create_task(
+                self._acall(provider, target, messages, stop, index > 0, kwargs)
+            )
+            tasks[task] = provider
+            return task
+
+        pending = {launch(0)}
+        try:
+            done, _ = await asyncio.wait(
+                pending, timeout=self.hedge_delay(order[0][0])
+            )
+            if not done:
+                logger.info(f"⏱️ [{order[0][0]}] 超过对冲延迟，同时请求 {order[1][0]}")
+                pending.add(launch(1))
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        return self._to_result(
+                            task.result(), tasks[task], len(tasks) > 1
+                        )
+                    if len(tasks) == 1:
+                        logger.warning(
+                            f"⚠️ [{tasks[task]}] 调用失败，切换 {order[1][0]}"
+                        )
+                        pending.add(launch(1))
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
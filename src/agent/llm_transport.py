@@ -0,0 +1,390 @@
+# src/agent/llm_transport.py
+"""
+LLM 传输层：共享连接池 + 超时 + 重试退避 + 按供应商限流
+
+所有 OpenAI 兼容的 LLM 客户端 (Qwen / Zhipu) 通过这里获取进程级共享的
+httpx.Client / httpx.AsyncClient：
+- 连接池与 keep-alive 复用，避免每个请求重新握手 TLS；
+- 显式的连接 / 读取超时；
+- 429 / 5xx 及连接类错误按指数退避 (带抖动，优先遵循 Retry-After) 有限次重试；
+- 每个供应商的进程级并发请求数上限，同步客户端与所有事件循环的异步客户端共用
+  (流式响应在读取完毕 / 关闭后才释放名额)；
+- 异步客户端的连接池按事件循环隔离，可在多次 asyncio.run() 之间复用。
+
+SDK 自身的重试需关闭 (max_retries=0)，由本层统一处理。
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, AsyncIterator, Optional, Tuple
+
+import httpx
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+RETRY_EXCEPTIONS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadTimeout,
+    httpx.RemoteProtocolError,
+)
+
+
+def backoff_delay(
+    attempt: int, base: float, maximum: float, retry_after: Optional[str] = None
+) -> float:
+    """第 attempt 次重试前的等待时间：优先遵循 Retry-After，否则指数退避 + 抖动"""
+    if retry_after:
+        try:
+            return min(float(retry_after), maximum)
+        except ValueError:
+            pass
+    delay = min(maximum, base * (2**attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class _ReleaseOnClose(httpx.SyncByteStream):
+    """响应体读取完毕 / 关闭时释放并发名额 (流式响应同样适用)"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleaseOnClose(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class ProviderLimiter:
+    """
+    进程级并发名额 (线程安全，不绑定事件循环)。
+    同步与异步调用方在同一个 FIFO 队列中排队；释放名额时直接移交给队首等待者，
+    异步等待者通过 call_soon_threadsafe 在自己的事件循环中被唤醒，等待期间不阻塞循环。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        # threading.Event (同步) 或 (事件循环, Future) (异步)
+        self._waiters: Deque = deque()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        # 被唤醒时名额已经移交给当前线程
+        event.wait()
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # 名额已移交：结果已送达则由这里归还，否则由 _wake 归还
+            if not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(self._wake, future)
+                    return
+                except RuntimeError:
+                    # 等待者所在的事件循环已关闭，跳过
+                    continue
+            self.in_flight -= 1
+
+    def _wake(self, future: asyncio.Future) -> None:
+        if future.done():
+            # 等待者在名额送达前被取消，转交给下一个等待者
+            self.release()
+        else:
+            future.set_result(None)
+
+
+def _once(fn):
+    lock = threading.Lock()
+    done = False
+
+    def wrapper():
+        nonlocal done
+        with lock:
+            if done:
+                return
+            done = True
+        fn()
+
+    return wrapper
+
+
+class RetryTransport(httpx.BaseTransport):
+    def __init__(
+        self,
+        wrapped: httpx.BaseTransport,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_concurrency: int = 8,
+        name: str = "llm",
+        limiter: Optional[ProviderLimiter] = None,
+    ):
+        self.wrapped = wrapped
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.name = name
+        # 未指定共享名额时单独限流
+        self.limiter = limiter or ProviderLimiter(max_concurrency)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.limiter.acquire()
+            release = _once(self.limiter.release)
+            try:
+                response = self.wrapped.handle_request(request)
+            except RETRY_EXCEPTIONS as e:
+                release()
+                if last_attempt:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                logger.warning(f"⚠️ [{self.name}] {type(e).__name__}，{delay:.2f}s 后重试")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                release()
+                raise
+
+            # 响应体已在内存中 (已关闭) 时直接释放，否则等流关闭时释放
+            if response.is_closed:
+                release()
+            else:
+                response.stream = _ReleaseOnClose(response.stream, release)
+            if response.status_code in RETRY_STATUS_CODES and not last_attempt:
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                delay = backoff_delay(
+                    attempt, self.backoff_base, self.backoff_max, retry_after
+                )
+                logger.warning(
+                    f"⚠️ [{self.name}] HTTP {response.status_code}，{delay:.2f}s 后重试"
+                )
+                time.sleep(delay)
+                continue
+            return response
+
+    def close(self) -> None:
+        self.wrapped.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        wrapped: httpx.AsyncBaseTransport,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_concurrency: int = 8,
+        name: str = "llm",
+        limiter: Optional[ProviderLimiter] = None,
+    ):
+        self.wrapped = wrapped
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.name = name
+        self.limiter = limiter or ProviderLimiter(max_concurrency)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            await self.limiter.acquire_async()
+            release = _once(self.limiter.release)
+            try:
+                response = await self.wrapped.handle_async_request(request)
+            except RETRY_EXCEPTIONS as e:
+                release()
+                if last_attempt:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                logger.warning(f"⚠️ [{self.name}] {type(e).__name__}，{delay:.2f}s 后重试")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                release()
+                raise
+
+            # 响应体已在内存中 (已关闭) 时直接释放，否则等流关闭时释放
+            if response.is_closed:
+                release()
+            else:
+                response.stream = _AsyncReleaseOnClose(response.stream, release)
+            if response.status_code in RETRY_STATUS_CODES and not last_attempt:
+                retry_after = response.headers.get("Retry-After")
+                await response.aclose()
+                delay = backoff_delay(
+                    attempt, self.backoff_base, self.backoff_max, retry_after
+                )
+                logger.warning(
+                    f"⚠️ [{self.name}] HTTP {response.status_code}，{delay:.2f}s 后重试"
+                )
+                await asyncio.sleep(delay)
+                continue
+            return response
+
+    async def aclose(self) -> None:
+        await self.wrapped.aclose()
+
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    按事件循环隔离的异步传输层。
+    连接池中的连接绑定首次使用它们的事件循环，
+    进程级共享的 AsyncClient 在多次 asyncio.run() (批处理 / 压测) 之间复用时会报
+    "attached to a different loop" / "Event loop is closed"。
+    这里为每个事件循环创建独立的内层传输 (各自的连接池)，已关闭循环的传输随之丢弃；
+    并发名额由工厂传入的 ProviderLimiter 在所有事件循环之间共享。
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncBaseTransport]):
+        self.factory = factory
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def _current(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for stale in [l for l in self._transports if l.is_closed()]:
+                del self._transports[stale]
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = self.factory()
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+# --- 进程级共享客户端与并发名额 (按供应商缓存) ---
+_clients: Dict[Tuple[str, str], httpx.Client | httpx.AsyncClient] = {}
+_limiters: Dict[str, ProviderLimiter] = {}
+_clients_lock = threading.Lock()
+
+
+def get_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.LLM_READ_TIMEOUT,
+        connect=settings.LLM_CONNECT_TIMEOUT,
+        pool=settings.LLM_POOL_TIMEOUT,
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def _provider_limiter(provider: str) -> ProviderLimiter:
+    """供应商的进程级并发名额 (调用方需持有 _clients_lock)"""
+    if provider not in _limiters:
+        limit = settings.LLM_PROVIDER_CONCURRENCY.get(provider, 8)
+        _limiters[provider] = ProviderLimiter(limit)
+    return _limiters[provider]
+
+
+def _retry_options(provider: str) -> dict:
+    return {
+        "max_retries": settings.LLM_MAX_RETRIES,
+        "backoff_base": settings.LLM_BACKOFF_BASE,
+        "backoff_max": settings.LLM_BACKOFF_MAX,
+        # 同步 / 异步客户端及所有事件循环共用同一份名额
+        "limiter": _provider_limiter(provider),
+        "name": provider,
+    }
+
+
+def get_http_client(provider: str) -> httpx.Client:
+    """获取指定供应商的共享同步客户端"""
+    key = (provider, "sync")
+    with _clients_lock:
+        if key not in _clients:
+            transport = RetryTransport(
+                httpx.HTTPTransport(limits=_limits()), **_retry_options(provider)
+            )
+            _clients[key] = httpx.Client(transport=transport, timeout=get_timeout())
+        return _clients[key]
+
+
+def get_async_http_client(provider: str) -> httpx.AsyncClient:
+    """获取指定供应商的共享异步客户端 (连接池按事件循环隔离，并发名额与同步客户端共用)"""
+    key = (provider, "async")
+    with _clients_lock:
+        if key not in _clients:
+            options = _retry_options(provider)
+            transport = LoopLocalTransport(
+                lambda: AsyncRetryTransport(
+                    httpx.AsyncHTTPTransport(limits=_limits()), **options
+                )
+            )
+            _clients[key] = httpx.AsyncClient(transport=transport, timeout=get_timeout())
+        return _clients[key]
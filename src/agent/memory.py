@@ -0,0 +1,192 @@
+# src/agent/memory.py
+"""
+有界对话记忆 (Conversation Memory)
+
+每个会话一份，由调用方 (Streamlit session_state / CLI) 持有，执行器本身保持无状态：
+- 滑动窗口：保留最近 N 轮原文，以 chat_history 消息注入 Prompt；
+- 滚动摘要：滑出窗口的轮次压缩为一行抽取式摘要 (不额外调用 LLM)；
+- 实体表：会话中出现过的箱号 / 提单号 / 船名，追问时无需用户重复输入；
+- Token 预算：总量超出预算时优先淘汰最早的原文轮次，摘要过长时丢弃最早的摘要行。
+"""
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from src.config import settings
+from src.agent.prerouter import extract_entities
+
+# 摘要中每轮用户问题 / 回答结论的最大字符数
+SUMMARY_QUESTION_CHARS = 60
+SUMMARY_ANSWER_CHARS = 80
+# 实体表每类最多保留的条目数 (最近出现的优先)
+MAX_ENTITIES_PER_KIND = 10
+# 结论通常出现在这些标记之后
+CONCLUSION_MARKERS = ("结论", "💡", "行动建议", "🧠")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 Token 数：中文约 1 字 1 Token，其余约 4 字符 1 Token"""
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def _truncate(text: str, limit: int) -> str:
+    text = re.sub(r"\s+", " ", text).strip()
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def _conclusion(answer: str) -> str:
+    """抽取回答中的结论句：优先取结论标记后的第一行正文，否则取第一行正文"""
+    lines = [
+        line.strip(" -*#>") for line in answer.splitlines() if line.strip(" -*#>")
+    ]
+    for i, line in enumerate(lines):
+        if any(marker in line for marker in CONCLUSION_MARKERS):
+            # 标记单独成行 (如 "**💡 行动建议**") 时取下一行
+            body = re.sub(r"[*_`]|(结论|💡|行动建议|🧠|智能诊断)[:：]?", "", line).strip()
+            if body:
+                return body
+            if i + 1 < len(lines):
+                return lines[i + 1]
+    return lines[0] if lines else ""
+
+
+@dataclass
+class ConversationTurn:
+    user: str
+    assistant: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.user) + estimate_tokens(self.assistant)
+
+    def summarize(self) -> str:
+        return (
+            f"- 用户: {_truncate(self.user, SUMMARY_QUESTION_CHARS)}"
+            f"；结论: {_truncate(_conclusion(self.assistant), SUMMARY_ANSWER_CHARS)}"
+        )
+
+
+class ConversationMemory:
+    def __init__(
+        self,
+        window_turns: int = 3,
+        max_tokens: int = 1500,
+        summary_max_tokens: int = 300,
+    ):
+        self.window_turns = window_turns
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.turns: List[ConversationTurn] = []
+        self.summary_lines: List[str] = []
+        self.entities: Dict[str, List[str]] = {
+            "containers": [],
+            "bills": [],
+            "vessels": [],
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ConversationMemory":
+        return cls(
+            window_turns=settings.MEMORY_WINDOW_TURNS,
+            max_tokens=settings.MEMORY_MAX_TOKENS,
+            summary_max_tokens=settings.MEMORY_SUMMARY_MAX_TOKENS,
+        )
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def add_turn(self, user: str, assistant: str) -> None:
+        with self._lock:
+            # 只从用户输入抽取实体，回答中的字段名 (如 bill_of_lading) 容易误识别
+            self._remember_entities(user)
+            self.turns.append(ConversationTurn(user, assistant))
+            while len(self.turns) > self.window_turns:
+                self._evict_oldest()
+            # 至少保留最近一轮原文，其余按预算淘汰
+            while len(self.turns) > 1 and self.tokens > self.max_tokens:
+                self._evict_oldest()
+            self._trim_summary()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns.clear()
+            self.summary_lines.clear()
+            for values in self.entities.values():
+                values.clear()
+
+    def _remember_entities(self, text: str) -> None:
+        found = extract_entities(text)
+        for key in self.entities:
+            values = self.entities[key]
+            for value in getattr(found, key):
+                if value in values:
+                    values.remove(value)
+                values.append(value)
+            del values[:-MAX_ENTITIES_PER_KIND]
+
+    def _evict_oldest(self) -> None:
+        self.summary_lines.append(self.turns.pop(0).summarize())
+
+    def _trim_summary(self) -> None:
+        while (
+            len(self.summary_lines) > 1
+            and estimate_tokens("\n".join(self.summary_lines)) > self.summary_max_tokens
+        ):
+            self.summary_lines.pop(0)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    @property
+    def tokens(self) -> int:
+        return (
+            sum(turn.tokens for turn in self.turns)
+            + estimate_tokens(self.context_text())
+        )
+
+    def context_text(self) -> str:
+        """实体表 + 早前对话摘要，注入系统提示词；无记忆时返回空串"""
+        sections = []
+        labels = {"containers": "箱号", "bills": "提单号", "vessels": "船名"}
+        entity_lines = [
+            f"- {labels[key]}: {', '.join(values)}"
+            for key, values in self.entities.items()
+            if values
+        ]
+        if entity_lines:
+            sections.append("本会话已涉及的单证 (用户追问“这票货”等时指代这些)：")
+            sections.extend(entity_lines)
+        if self.summary_lines:
+            sections.append("早前对话摘要：")
+            sections.extend(self.summary_lines)
+        if not sections:
+            return ""
+        return "### 对话记忆：\n" + "\n".join(sections)
+
+    def to_messages(self) -> List[BaseMessage]:
+        messages: List[BaseMessage] = []
+        for turn in self.turns:
+            messages.append(HumanMessage(content=turn.user))
+            messages.append(AIMessage(content=turn.assistant))
+        return messages
+
+    def load_variables(self) -> Dict[str, Any]:
+        """返回注入执行器的 Prompt 变量"""
+        with self._lock:
+            return {
+                "chat_history": self.to_messages(),
+                "memory_context": self.context_text(),
+            }
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "turns": len(self.turns),
+                "summary_lines": len(self.summary_lines),
+                "tokens": self.tokens,
+            }
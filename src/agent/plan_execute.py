@@ -0,0 +1,316 @@
+# src/agent/plan_execute.py
+"""
+Plan-then-Execute 执行器 (AGENT_MODE=plan)
+
+ReAct 循环最多进行 max_iterations 轮串行 LLM 调用。本模式把每次查询限制在两次 LLM 调用内：
+1. 规划：一次 LLM 调用，返回全部工具调用 (箱号 / 提单 / 船期 / 知识库)；
+2. 执行：并行执行计划中的工具；报关异常但计划未覆盖知识库时，自动补充检索 (不调用 LLM)；
+3. 综合：一次 LLM 调用，输出 🔍/🧠/💡 结构化答案。
+
+规划前先执行预路由 (与 ReAct 模式共用)：纯状态查询直接走模板快速通道，不调用 LLM；
+否则预取结果注入规划 Prompt，规划阶段只需补充缺少的查询。
+
+计划不完整 (遗漏用户提到的单证号、引用未知工具) 或综合阶段仍要求调用工具时，
+携带已执行的结果回退到 ReAct 执行器，已完成的查询不会重复执行。
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain.chains.base import Chain
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import BaseTool
+
+from src.config import settings
+from src.agent.fast_path import apply_prefetch, template_output
+from src.agent.prerouter import (
+    EntityPrefetcher,
+    PrefetchedCall,
+    PrefetchResult,
+    extract_entities,
+    find_customs_exceptions,
+)
+from src.agent.prompts import (
+    PLANNING_INSTRUCTION,
+    SYNTHESIS_INSTRUCTION,
+    SYSTEM_PROMPT_TEMPLATE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_plan_prompts() -> Tuple[ChatPromptTemplate, ChatPromptTemplate]:
+    planning = ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM_PROMPT_TEMPLATE + PLANNING_INSTRUCTION),
+            ("placeholder", "{chat_history}"),
+            ("human", "{input}"),
+            # 预路由已查到的结果 (可选)，规划时无需重复查询
+            ("placeholder", "{prefetched_context}"),
+        ]
+    )
+    synthesis = ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM_PROMPT_TEMPLATE + SYNTHESIS_INSTRUCTION),
+            ("placeholder", "{chat_history}"),
+            ("human", "{input}"),
+            ("placeholder", "{plan_results}"),
+        ]
+    )
+    return planning, synthesis
+
+
+def missing_entities(text: str, tool_calls: List[Dict[str, Any]]) -> List[str]:
+    """用户提到但计划中没有任何工具调用覆盖的单证号 / 船名"""
+    entities = extract_entities(text)
+    planned = " ".join(str(tc.get("args", "")) for tc in tool_calls).upper()
+    return [
+        value
+        for value in entities.containers + entities.bills + entities.vessels
+        if value.upper() not in planned
+    ]
+
+
+class PlanExecuteExecutor(Chain):
+    llm: BaseChatModel
+    tools: List[BaseTool]
+    planning_prompt: ChatPromptTemplate
+    synthesis_prompt: ChatPromptTemplate
+    # 计划不完整时回退的 ReAct 执行器
+    fallback: Optional[Chain] = None
+    # 每次调用时生成的上下文变量 (current_time 等)
+    context_factory: Optional[Callable[[], Dict[str, Any]]] = None
+    # 工具结果写入 Prompt 前的投影 (工具名, 结果) -> 文本
+    observation_formatter: Optional[Callable[[str, Any], str]] = None
+    # 规划前的实体预路由 (与 PortAgentExecutor 相同)，为空时直接规划
+    prefetcher: Optional[EntityPrefetcher] = None
+    max_workers: int = 4
+
+    @property
+    def input_keys(self) -> List[str]:
+        return ["input"]
+
+    @property
+    def output_keys(self) -> List[str]:
+        return ["output"]
+
+    @property
+    def _chain_type(self) -> str:
+        return "plan_execute"
+
+    @property
+    def tool_map(self) -> Dict[str, BaseTool]:
+        return {t.name: t for t in self.tools}
+
+    def prep_inputs(self, inputs: Any) -> Dict[str, Any]:
+        inputs = super().prep_inputs(inputs)
+        return self._with_request_context(inputs)
+
+    async def aprep_inputs(self, inputs: Any) -> Dict[str, Any]:
+        inputs = await super().aprep_inputs(inputs)
+        # 预取中的工具调用与知识库检索放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self._with_request_context, inputs)
+
+    def _with_request_context(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = {**(self.context_factory() if self.context_factory else {}), **inputs}
+        return apply_prefetch(inputs, self.prefetcher, self.observation_formatter)
+
+    # ------------------------------------------------------------------
+    # 规划结果检查 / 补充检索
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _prefetched(inputs: Dict[str, Any]) -> List[BaseMessage]:
+        return list(inputs.get("prefetched_context") or [])
+
+    def _plan_problem(self, inputs: Dict[str, Any], plan: AIMessage) -> Optional[str]:
+        """返回计划不完整的原因，完整时返回 None (预路由已查询的实体视为已覆盖)"""
+        unknown = [tc["name"] for tc in plan.tool_calls if tc["name"] not in self.tool_map]
+        if unknown:
+            return f"未知工具 {unknown}"
+        prefetched_calls = [
+            tc
+            for m in self._prefetched(inputs)
+            if isinstance(m, AIMessage)
+            for tc in m.tool_calls
+        ]
+        missing = missing_entities(inputs["input"], plan.tool_calls + prefetched_calls)
+        if missing:
+            return f"计划遗漏 {missing}"
+        return None
+
+    def _to_calls(self, plan: AIMessage) -> List[PrefetchedCall]:
+        """计划中的可执行调用 (即使计划不完整也先执行，回退时复用结果)"""
+        return [
+            PrefetchedCall(tool=tc["name"], args=tc["args"], result=None, call_id=tc["id"])
+            for tc in plan.tool_calls
+            if tc["name"] in self.tool_map
+        ]
+
+    @staticmethod
+    def _supplementary_rag(calls: List[PrefetchedCall]) -> List[PrefetchedCall]:
+        """报关异常但计划未检索对应知识时，补充知识库查询"""
+        planned_queries = " ".join(
+            str(c.args) for c in calls if c.tool == settings.RETRIEVER_TOOL_NAME
+        )
+        return [
+            PrefetchedCall(
+                tool=settings.RETRIEVER_TOOL_NAME,
+                args={"query": f"{code} 含义、处理时效及应对策略"},
+                result=None,
+            )
+            for code in find_customs_exceptions(calls)
+            if code not in planned_queries
+        ]
+
+    def _results(
+        self, inputs: Dict[str, Any], calls: List[PrefetchedCall], start: float
+    ) -> PrefetchResult:
+        result = PrefetchResult(entities=extract_entities(inputs["input"]), calls=calls)
+        result.stages = len(result._calls_by_stage())
+        result.latency = time.perf_counter() - start
+        return result
+
+    def _fallback_inputs(
+        self, inputs: Dict[str, Any], messages: List[BaseMessage]
+    ) -> Dict[str, Any]:
+        fallback_inputs = dict(inputs)
+        # 没有任何已执行结果时交给 ReAct 执行器自己的预路由 (已预路由过则不会重复)
+        if messages:
+            fallback_inputs["prefetched_context"] = messages
+        return fallback_inputs
+
+    # ------------------------------------------------------------------
+    # 同步执行
+    # ------------------------------------------------------------------
+    def _invoke_tool(self, call: PrefetchedCall, callbacks) -> PrefetchedCall:
+        try:
+            call.result = self.tool_map[call.tool].invoke(
+                call.args, config={"callbacks": callbacks}
+            )
+        except Exception as e:
+            call.result = f"系统反馈：调用 {call.tool} 失败 ({e})"
+        return call
+
+    def _execute(self, calls: List[PrefetchedCall], callbacks) -> None:
+        if not calls:
+            return
+        workers = max(1, min(self.max_workers, len(calls)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda c: self._invoke_tool(c, callbacks), calls))
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        if inputs.get("fast_path_answer"):
+            return template_output(inputs)
+        callbacks = run_manager.get_child() if run_manager else None
+
+        # 1. 规划
+        plan = self.llm.bind_tools(self.tools).invoke(
+            self.planning_prompt.format_messages(**inputs),
+            config={"callbacks": callbacks, "run_name": "plan"},
+        )
+        problem = self._plan_problem(inputs, plan)
+        if not plan.tool_calls and not problem:
+            return {"output": plan.content}
+
+        # 2. 并行执行 (+ 补充知识库检索)
+        start = time.perf_counter()
+        calls = self._to_calls(plan)
+        self._execute(calls, callbacks)
+        extra = self._supplementary_rag(calls)
+        self._execute(extra, callbacks)
+        # 预路由结果在前，与计划执行结果一起交给综合阶段
+        messages = self._prefetched(inputs) + self._results(
+            inputs, calls + extra, start
+        ).to_messages(self.observation_formatter)
+
+        # 3. 综合
+        answer = None
+        if not problem:
+            answer = self.llm.invoke(
+                self.synthesis_prompt.format_messages(**inputs, plan_results=messages),
+                config={"callbacks": callbacks, "run_name": "synthesize"},
+            )
+            if answer.tool_calls:
+                problem = "综合阶段仍需调用工具"
+        if not problem:
+            return {"output": answer.content}
+
+        if not self.fallback:
+            raise ValueError(f"❌ 计划执行失败且未配置回退执行器: {problem}")
+        logger.info(f"↩️ {problem}，回退到 ReAct 模式")
+        response = self.fallback.invoke(
+            self._fallback_inputs(inputs, messages), config={"callbacks": callbacks}
+        )
+        return {"output": response["output"]}
+
+    # ------------------------------------------------------------------
+    # 异步执行
+    # ------------------------------------------------------------------
+    async def _ainvoke_tool(self, call: PrefetchedCall, callbacks) -> None:
+        try:
+            call.result = await self.tool_map[call.tool].ainvoke(
+                call.args, config={"callbacks": callbacks}
+            )
+        except Exception as e:
+            call.result = f"系统反馈：调用 {call.tool} 失败 ({e})"
+
+    async def _aexecute(self, calls: List[PrefetchedCall], callbacks) -> None:
+        await asyncio.gather(*(self._ainvoke_tool(c, callbacks) for c in calls))
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        if inputs.get("fast_path_answer"):
+            return template_output(inputs)
+        callbacks = run_manager.get_child() if run_manager else None
+
+        plan = await self.llm.bind_tools(self.tools).ainvoke(
+            self.planning_prompt.format_messages(**inputs),
+            config={"callbacks": callbacks, "run_name": "plan"},
+        )
+        problem = self._plan_problem(inputs, plan)
+        if not plan.tool_calls and not problem:
+            return {"output": plan.content}
+
+        start = time.perf_counter()
+        calls = self._to_calls(plan)
+        await self._aexecute(calls, callbacks)
+        extra = self._supplementary_rag(calls)
+        await self._aexecute(extra, callbacks)
+        # 预路由结果在前，与计划执行结果一起交给综合阶段
+        messages = self._prefetched(inputs) + self._results(
+            inputs, calls + extra, start
+        ).to_messages(self.observation_formatter)
+
+        answer = None
+        if not problem:
+            answer = await self.llm.ainvoke(
+                self.synthesis_prompt.format_messages(**inputs, plan_results=messages),
+                config={"callbacks": callbacks, "run_name": "synthesize"},
+            )
+            if answer.tool_calls:
+                problem = "综合阶段仍需调用工具"
+        if not problem:
+            return {"output": answer.content}
+
+        if not self.fallback:
+            raise ValueError(f"❌ 计划执行失败且未配置回退执行器: {problem}")
+        logger.info(f"↩️ {problem}，回退到 ReAct 模式")
+        response = await self.fallback.ainvoke(
+            self._fallback_inputs(inputs, messages), config={"callbacks": callbacks}
+        )
+        return {"output": response["output"]}
@@ -0,0 +1,217 @@
+# src/agent/prerouter.py
+"""
+实体抽取预路由 (Pre-router)
+
+在 AgentExecutor 调用 LLM 之前，先用正则从用户输入中抽取箱号、提单号和船名，
+并发调用对应的查询工具，把结果以"已完成的工具调用"形式注入首轮 Prompt。
+这样 LLM 不必再花一轮往返去决定调用哪些工具，多数诊断可在一次 LLM 调用内完成。
+"""
+import json
+import logging
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.tools import BaseTool
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 标准箱号为 4 位字母 + 7 位数字 (ISO 6346)，模拟数据中还有 URGENT001 这类演示箱号
+# 注意：中文字符也属于 \w，因此不能用 \b，改用字母数字边界的前后断言
+CONTAINER_ID_PATTERN = re.compile(r"(?<![A-Z0-9_])(?!BILL)[A-Z]{4,6}\d{3,7}(?![A-Z0-9_])")
+BILL_ID_PATTERN = re.compile(r"(?<![A-Z0-9_])BILL[A-Z0-9_]*(?![A-Z0-9])")
+QUOTED_PATTERN = re.compile(r"[‘“\"「《]([^’”\"」》]{2,20})[’”\"」》]")
+
+# 引号前出现这些词时，才把引号内容视为船名 (避免把 ‘人工查验’ 当成船名)
+VESSEL_CONTEXT_HINTS = ("船", "配", "赶上", "赶", "装")
+VESSEL_NAME_SUFFIXES = ("号", "轮")
+
+CONTAINER_TOOL_NAME = "get_container_status"
+CUSTOMS_TOOL_NAME = "get_customs_status"
+VESSEL_TOOL_NAME = "get_vessel_schedule"
+
+
+@dataclass
+class ExtractedEntities:
+    containers: List[str] = field(default_factory=list)
+    bills: List[str] = field(default_factory=list)
+    vessels: List[str] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.containers or self.bills or self.vessels)
+
+
+@dataclass
+class PrefetchedCall:
+    tool: str
+    args: Dict[str, Any]
+    result: Any
+    call_id: str = field(default_factory=lambda: f"prefetch_{uuid.uuid4().hex[:12]}")
+
+
+@dataclass
+class PrefetchResult:
+    entities: ExtractedEntities
+    calls: List[PrefetchedCall] = field(default_factory=list)
+    # 预取覆盖的工具轮次 (数据查询一轮 + 知识库查询一轮)，用于估算节省的 LLM 调用
+    stages: int = 0
+    latency: float = 0.0
+
+    def to_messages(
+        self, formatter: Optional[Callable[[str, Any], str]] = None
+    ) -> List[BaseMessage]:
+        """
+        转换为 (AIMessage(tool_calls) + ToolMessage) 序列，按轮次注入 Prompt
+        :param formatter: (工具名, 结果) -> 文本，默认原样序列化
+        """
+        formatter = formatter or (lambda tool, result: _stringify(result))
+        messages: List[BaseMessage] = []
+        for stage_calls in self._calls_by_stage():
+            messages.append(
+                AIMessage(
+                    content="",
+                    tool_calls=[
+                        {"name": c.tool, "args": c.args, "id": c.call_id}
+                        for c in stage_calls
+                    ],
+                )
+            )
+            for c in stage_calls:
+                messages.append(
+                    ToolMessage(
+                        content=formatter(c.tool, c.result), tool_call_id=c.call_id
+                    )
+                )
+        return messages
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": len(self.calls),
+            "stages": self.stages,
+            "latency": round(self.latency, 3),
+        }
+
+    def _calls_by_stage(self) -> List[List[PrefetchedCall]]:
+        data_calls = [c for c in self.calls if c.tool != settings.RETRIEVER_TOOL_NAME]
+        rag_calls = [c for c in self.calls if c.tool == settings.RETRIEVER_TOOL_NAME]
+        return [group for group in (data_calls, rag_calls) if group]
+
+
+def _stringify(result: Any) -> str:
+    if isinstance(result, str):
+        return result
+    return json.dumps(result, ensure_ascii=False)
+
+
+def _unique(items: Sequence[str]) -> List[str]:
+    return list(dict.fromkeys(items))
+
+
+def extract_entities(text: str) -> ExtractedEntities:
+    """从用户输入中抽取箱号、提单号和船名"""
+    if not text:
+        return ExtractedEntities()
+
+    upper_text = text.upper()
+    bills = _unique(BILL_ID_PATTERN.findall(upper_text))
+    containers = _unique(CONTAINER_ID_PATTERN.findall(upper_text))
+
+    vessels = []
+    for match in QUOTED_PATTERN.finditer(text):
+        name = match.group(1).strip().strip("*")
+        prefix = text[max(0, match.start() - 8) : match.start()]
+        if not name or name.upper() in bills or name.upper() in containers:
+            continue
+        if any(h in prefix for h in VESSEL_CONTEXT_HINTS) or name.endswith(
+            VESSEL_NAME_SUFFIXES
+        ):
+            vessels.append(name)
+
+    return ExtractedEntities(
+        containers=containers, bills=bills, vessels=_unique(vessels)
+    )
+
+
+def find_customs_exceptions(calls: Sequence[PrefetchedCall]) -> List[str]:
+    """返回报关结果中出现的异常代码 (如 H98 / 人工查验)"""
+    codes = []
+    for c in calls:
+        if c.tool != CUSTOMS_TOOL_NAME or not isinstance(c.result, dict):
+            continue
+        code = c.result.get("customs_code")
+        status = c.result.get("customs_status")
+        if code:
+            codes.append(code)
+        elif status and status != "放行":
+            codes.append(status)
+    return _unique(codes)
+
+
+class EntityPrefetcher:
+    """根据抽取出的实体并发调用查询工具"""
+
+    def __init__(self, tools: Sequence[BaseTool], max_workers: int = 4):
+        self.tool_map = {t.name: t for t in tools}
+        self.max_workers = max_workers
+
+    def prefetch(self, text: str) -> Optional[PrefetchResult]:
+        entities = extract_entities(text)
+        if entities.is_empty():
+            return None
+
+        start = time.perf_counter()
+        result = PrefetchResult(entities=entities)
+
+        # 第一轮：箱号 / 提单 / 船期并发查询
+        plan = (
+            [(CONTAINER_TOOL_NAME, "container_id", v) for v in entities.containers]
+            + [(CUSTOMS_TOOL_NAME, "bill_of_lading", v) for v in entities.bills]
+            + [(VESSEL_TOOL_NAME, "vessel_name", v) for v in entities.vessels]
+        )
+        data_calls = self._run_parallel(plan)
+        if data_calls:
+            result.calls.extend(data_calls)
+            result.stages += 1
+
+        # 第二轮：报关异常时，提前检索知识库 (对应 Prompt 中"必须调用知识库"的规则)
+        codes = find_customs_exceptions(data_calls)
+        if codes:
+            rag_plan = [
+                (settings.RETRIEVER_TOOL_NAME, "query", f"{code} 含义、处理时效及应对策略")
+                for code in codes
+            ]
+            rag_calls = self._run_parallel(rag_plan)
+            if rag_calls:
+                result.calls.extend(rag_calls)
+                result.stages += 1
+
+        result.latency = time.perf_counter() - start
+        logger.info(
+            f"⚡ 预路由完成: {len(result.calls)} 次工具调用, 耗时 {result.latency:.3f}s"
+        )
+        return result
+
+    def _run_parallel(self, plan) -> List[PrefetchedCall]:
+        plan = [(name, arg, value) for name, arg, value in plan if name in self.tool_map]
+        if not plan:
+            return []
+
+        def _invoke(item) -> PrefetchedCall:
+            name, arg, value = item
+            args = {arg: value}
+            try:
+                output = self.tool_map[name].invoke(args)
+            except Exception as e:
+                output = f"系统反馈：调用 {name} 失败 ({e})"
+            return PrefetchedCall(tool=name, args=args, result=output)
+
+        if len(plan) == 1:
+            return [_invoke(plan[0])]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(plan))) as pool:
+            return list(pool.map(_invoke, plan))
@@ -0,0 +1,200 @@
+# src/agent/scratchpad.py
+"""
+Agent Scratchpad 压缩 (Observation Compaction)
+
+工具返回值会写入 agent_scratchpad，并在之后每一轮 LLM 调用中重复发送，
+输入 Token 随迭代步数近似平方增长。本模块在格式化 scratchpad 时：
+- 投影：结构化结果只保留 Prompt 真正需要的字段，紧凑序列化；
+  "系统反馈：..." 类长文本只保留首句事实；知识库结果截断到上限；
+- 摘要：观测总量超过预算时，把较早轮次的观测替换为一行摘要 (最新一轮保持完整)。
+
+每次格式化通过自定义回调事件 (scratchpad_compaction) 上报节省的 Token，
+由 AgentMonitorCallback 累计并写入审计日志。
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.agents.output_parsers.tools import ToolAgentAction
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import dispatch_custom_event
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from src.config import settings
+from src.agent.memory import estimate_tokens
+from src.agent.prerouter import (
+    CONTAINER_TOOL_NAME,
+    CUSTOMS_TOOL_NAME,
+    VESSEL_TOOL_NAME,
+)
+
+COMPACTION_EVENT = "scratchpad_compaction"
+
+# 各工具结果中 Prompt 需要的字段 (顺序即摘要中的展示顺序)
+TOOL_FIELD_PROJECTIONS: Dict[str, Tuple[str, ...]] = {
+    CONTAINER_TOOL_NAME: ("container_id", "status", "vgm_status", "location"),
+    CUSTOMS_TOOL_NAME: (
+        "bill_of_lading",
+        "customs_status",
+        "customs_code",
+        # 放行的提单只有申报时间，CVT 对比需要它
+        "declaration_time",
+        "instruction_time",
+    ),
+    VESSEL_TOOL_NAME: (
+        "vessel_name",
+        "voyage",
+        "estimated_berthing_time",
+        "customs_clearance_deadline",
+    ),
+}
+SUMMARY_MAX_CHARS = 80
+FEEDBACK_PREFIX = re.compile(r"^\s*系统反馈[:：]\s*")
+
+
+def _to_text(observation: Any) -> str:
+    if isinstance(observation, str):
+        return observation
+    try:
+        return json.dumps(observation, ensure_ascii=False)
+    except TypeError:
+        return str(observation)
+
+
+def _parse(observation: Any) -> Any:
+    if isinstance(observation, str) and observation.lstrip().startswith("{"):
+        try:
+            return json.loads(observation)
+        except ValueError:
+            return observation
+    return observation
+
+
+def project_observation(
+    tool: str, observation: Any, rag_max_chars: Optional[int] = None
+) -> str:
+    """把单个工具结果投影为 Prompt 所需的紧凑文本"""
+    observation = _parse(observation)
+    if isinstance(observation, dict):
+        fields = TOOL_FIELD_PROJECTIONS.get(tool)
+        if fields:
+            observation = {k: observation[k] for k in fields if k in observation}
+        return json.dumps(observation, ensure_ascii=False, separators=(",", ":"))
+
+    text = _to_text(observation).strip()
+    if tool == settings.RETRIEVER_TOOL_NAME:
+        limit = rag_max_chars or settings.SCRATCHPAD_RAG_MAX_CHARS
+        return text if len(text) <= limit else text[:limit] + "…"
+    if FEEDBACK_PREFIX.match(text):
+        # 未找到 / 多条匹配等反馈：只保留首句事实，处理方式已在系统提示词中约定
+        return FEEDBACK_PREFIX.sub("", text).split("。")[0]
+    return text
+
+
+def summarize_observation(tool: str, content: str) -> str:
+    """较早轮次观测的一行摘要"""
+    data = _parse(content)
+    if isinstance(data, dict):
+        text = "/".join(str(v) for v in data.values())
+    else:
+        text = re.sub(r"\s+", " ", str(data))
+    if len(text) > SUMMARY_MAX_CHARS:
+        text = text[:SUMMARY_MAX_CHARS] + "…"
+    return f"[已压缩] {text}"
+
+
+class ScratchpadCompactor:
+    """
+    create_tool_calling_agent 的 message_formatter：
+    与默认的 format_to_tool_messages 输出相同的消息结构 (tool_call_id 一一对应)，
+    只替换 ToolMessage 的内容。
+    """
+
+    def __init__(self, max_tokens: int = 800, rag_max_chars: int = 600):
+        self.max_tokens = max_tokens
+        self.rag_max_chars = rag_max_chars
+
+    @classmethod
+    def from_settings(cls) -> "ScratchpadCompactor":
+        return cls(
+            max_tokens=settings.SCRATCHPAD_MAX_TOKENS,
+            rag_max_chars=settings.SCRATCHPAD_RAG_MAX_CHARS,
+        )
+
+    def __call__(
+        self, intermediate_steps: Sequence[Tuple[AgentAction, Any]]
+    ) -> List[BaseMessage]:
+        messages, stats = self.format(intermediate_steps)
+        if intermediate_steps:
+            try:
+                dispatch_custom_event(COMPACTION_EVENT, stats)
+            except RuntimeError:
+                # 不在 Runnable 上下文中 (例如直接调用) 时无法上报，忽略
+                pass
+        return messages
+
+    def format(
+        self, intermediate_steps: Sequence[Tuple[AgentAction, Any]]
+    ) -> Tuple[List[BaseMessage], Dict[str, int]]:
+        messages: List[BaseMessage] = []
+        # (ToolMessage 在 messages 中的下标, 工具名, 所属 LLM 轮次)
+        observations: List[Tuple[int, str, int]] = []
+        raw_tokens = 0
+        rounds: List[int] = []
+
+        for action, observation in intermediate_steps:
+            if not isinstance(action, ToolAgentAction):
+                messages.append(AIMessage(content=action.log))
+                continue
+            # 同一轮 LLM 调用产生的并行工具调用共享 message_log
+            if action.message_log and action.message_log[-1] not in messages:
+                messages.extend(action.message_log)
+                rounds.append(len(rounds))
+            raw = _to_text(observation)
+            raw_tokens += estimate_tokens(raw)
+            content = project_observation(action.tool, observation, self.rag_max_chars)
+            observations.append((len(messages), action.tool, rounds[-1] if rounds else 0))
+            messages.append(
+                ToolMessage(
+                    tool_call_id=action.tool_call_id,
+                    content=content,
+                    additional_kwargs={"name": action.tool},
+                )
+            )
+
+        summarized = self._enforce_budget(messages, observations)
+        compacted_tokens = sum(
+            estimate_tokens(messages[i].content) for i, _, _ in observations
+        )
+        return messages, {
+            "observations": len(observations),
+            "summarized": summarized,
+            "raw_tokens": raw_tokens,
+            "compacted_tokens": compacted_tokens,
+            "saved_tokens": max(0, raw_tokens - compacted_tokens),
+        }
+
+    def _enforce_budget(
+        self, messages: List[BaseMessage], observations: List[Tuple[int, str, int]]
+    ) -> int:
+        """超出预算时从最早的轮次开始摘要，最新一轮的观测保持完整"""
+        total = sum(estimate_tokens(messages[i].content) for i, _, _ in observations)
+        if total <= self.max_tokens or not observations:
+            return 0
+        latest_round = observations[-1][2]
+        summarized = 0
+        for index, tool, round_no in observations:
+            if total <= self.max_tokens or round_no == latest_round:
+                break
+            message = messages[index]
+            summary = summarize_observation(tool, message.content)
+            if estimate_tokens(summary) >= estimate_tokens(message.content):
+                continue
+            total -= estimate_tokens(message.content) - estimate_tokens(summary)
+            messages[index] = ToolMessage(
+                tool_call_id=message.tool_call_id,
+                content=summary,
+                additional_kwargs=message.additional_kwargs,
+            )
+            summarized += 1
+        return summarized
@@ -0,0 +1,70 @@
+# src/agent/streaming.py
+"""
+Token 级流式输出回调
+
+AgentExecutor 一次回答可能包含多轮 LLM 调用：中间轮次产生工具调用，最后一轮生成答案。
+本模块的回调在每轮 LLM 开始时重置缓冲区，若该轮以工具调用结束则丢弃已输出内容，
+从而让前端在最终 LLM 步骤产出第一个 Token 时立即开始显示答案。
+"""
+from typing import Any, Dict, List
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+def _has_tool_calls(response: LLMResult) -> bool:
+    for gen_list in response.generations:
+        for gen in gen_list:
+            message = getattr(gen, "message", None)
+            if message is not None and getattr(message, "tool_calls", None):
+                return True
+    return False
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """
+    通用流式回调基类。子类实现 on_text / on_discard 以适配不同前端 (终端、Streamlit)。
+    """
+
+    def __init__(self):
+        self.text = ""
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    ) -> None:
+        self.text = ""
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any
+    ) -> None:
+        self.text = ""
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if not token:
+            return
+        self.text += token
+        self.on_text(token)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        # 中间轮次 (工具调用) 的文本不是最终答案
+        if self.text and _has_tool_calls(response):
+            self.on_discard(self.text)
+            self.text = ""
+
+    def on_text(self, token: str) -> None:
+        """收到新的答案 Token"""
+
+    def on_discard(self, text: str) -> None:
+        """已输出的文本属于中间步骤，需要撤回"""
+
+
+class ConsoleStreamHandler(TokenStreamHandler):
+    """命令行流式输出"""
+
+    def on_text(self, token: str) -> None:
+        print(token, end="", flush=True)
+
+    def on_discard(self, text: str) -> None:
+        # 终端无法撤回已打印内容，换行后继续输出最终答案
+        print("\n", flush=True)
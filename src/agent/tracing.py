@@ -0,0 +1,420 @@
+# src/agent/tracing.py
+"""
+Span 级链路追踪 (Span Tracing)
+
+SpanRecorder 通过回调钩子把一次请求拆成层级 Span：
+    agent (根 Chain)
+    ├─ prefetch        实体预路由 (在根 Chain 开始前执行，按预取耗时补记)
+    ├─ llm             每轮 LLM 调用
+    └─ tool            工具调用
+       └─ retriever    知识库检索
+          └─ embedding 查询向量化 (RAG 层通过 src.observability.spans.span() 上报；
+                       检索 Span 的 self_ms 即 FAISS 检索耗时)
+
+计时统一使用单调高精度时钟 (perf_counter_ns)，保存为相对请求开始的纳秒偏移；
+导出时再结合请求开始的墙钟时间换算为 OpenTelemetry (OTLP/JSON) 格式。
+"""
+import json
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.outputs import LLMResult
+
+from src.observability.spans import SPAN_EVENT
+
+# 单次请求最多记录的 Span 数 (防止异常循环撑大审计行)
+MAX_SPANS = 200
+ATTRIBUTE_MAX_CHARS = 200
+
+# OTLP SpanKind / StatusCode
+_OTLP_KINDS = {"chain": 1, "internal": 1, "llm": 3, "tool": 1, "retriever": 3}
+_OTLP_STATUS = {"ok": 1, "error": 2}
+
+
+def _short(value: Any) -> str:
+    text = value if isinstance(value, str) else str(value)
+    return text if len(text) <= ATTRIBUTE_MAX_CHARS else text[:ATTRIBUTE_MAX_CHARS] + "…"
+
+
+def _new_span_id() -> str:
+    return secrets.token_hex(8)
+
+
+class SpanRecorder(BaseCallbackHandler):
+    """
+    记录层级 Span 的回调。每个请求使用一个新实例。
+    只有根 Chain 记录为 Span，中间 Chain (RunnableSequence 等) 仅用于解析父子关系。
+    """
+
+    def __init__(self, max_spans: int = MAX_SPANS):
+        self.max_spans = max_spans
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Dict[str, Any]] = []
+        # 请求开始的单调时钟 / 墙钟时间 (纳秒)
+        self.origin_ns: Optional[int] = None
+        self.origin_unix_ns: Optional[int] = None
+        self.dropped_spans = 0
+        self._span_by_run: Dict[UUID, Dict[str, Any]] = {}
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._trace_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 内部工具
+    # ------------------------------------------------------------------
+    def _offset(self, ns: int) -> int:
+        return ns - self.origin_ns
+
+    def _ensure_origin(self, now: int) -> None:
+        if self.origin_ns is None:
+            self.origin_ns = now
+            self.origin_unix_ns = time.time_ns()
+
+    def _append(self, record: Dict[str, Any]) -> bool:
+        """追加 Span (调用方需持有 _trace_lock)；超过 max_spans 时丢弃并计数"""
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return False
+        self.spans.append(record)
+        return True
+
+    def _resolve_parent(self, run_id: Optional[UUID]) -> Optional[Dict[str, Any]]:
+        """沿运行树向上查找最近的已记录 Span"""
+        while run_id is not None:
+            if run_id in self._span_by_run:
+                return self._span_by_run[run_id]
+            run_id = self._parents.get(run_id)
+        return None
+
+    def _start(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        name: str,
+        kind: str,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        now = time.perf_counter_ns()
+        with self._trace_lock:
+            self._ensure_origin(now)
+            self._parents[run_id] = parent_run_id
+            parent = self._resolve_parent(parent_run_id)
+            record = {
+                "span_id": _new_span_id(),
+                "parent_id": parent["span_id"] if parent else None,
+                "name": name,
+                "kind": kind,
+                "start_ns": self._offset(now),
+                "end_ns": None,
+                "status": "ok",
+                "attributes": attributes or {},
+            }
+            if self._append(record):
+                self._span_by_run[run_id] = record
+
+    def _end(
+        self,
+        run_id: UUID,
+        status: str = "ok",
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        now = time.perf_counter_ns()
+        with self._trace_lock:
+            record = self._span_by_run.get(run_id)
+            if record is None or record["end_ns"] is not None:
+                return
+            record["end_ns"] = self._offset(now)
+            record["status"] = status
+            if attributes:
+                record["attributes"].update(attributes)
+
+    # ------------------------------------------------------------------
+    # 回调钩子
+    # ------------------------------------------------------------------
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        if parent_run_id is not None:
+            with self._trace_lock:
+                self._parents[run_id] = parent_run_id
+            return
+        if run_id in self._span_by_run:
+            return
+        # 预路由在根 Chain 开始前完成 (prep_inputs)，按预取耗时补记 Span
+        prefetch = inputs.get("prefetch_stats") if isinstance(inputs, dict) else None
+        prefetch_ns = int((prefetch or {}).get("latency", 0) * 1e9)
+        now = time.perf_counter_ns()
+        with self._trace_lock:
+            self._ensure_origin(now - prefetch_ns)
+        self._start(run_id, None, kwargs.get("name") or "agent", "chain")
+        root = self._span_by_run.get(run_id)
+        if prefetch_ns and root:
+            with self._trace_lock:
+                root["start_ns"] = 0
+                self._append(
+                    {
+                        "span_id": _new_span_id(),
+                        "parent_id": root["span_id"],
+                        "name": "prefetch",
+                        "kind": "internal",
+                        "start_ns": 0,
+                        "end_ns": prefetch_ns,
+                        "status": "ok",
+                        "attributes": {
+                            "calls": prefetch.get("calls", 0),
+                            "stages": prefetch.get("stages", 0),
+                        },
+                    }
+                )
+
+    def on_chain_end(
+        self, outputs: Dict[str, Any], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id)
+
+    def on_chain_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, "error", {"error": _short(error)})
+
+    def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or params.get("_type")
+        self._start(
+            run_id, parent_run_id, "llm", "llm", {"model": model} if model else None
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        attributes: Dict[str, Any] = {}
+        for gen_list in response.generations:
+            for gen in gen_list:
+                message = getattr(gen, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    attributes["input_tokens"] = usage.get("input_tokens", 0)
+                    attributes["output_tokens"] = usage.get("output_tokens", 0)
+                if message is not None and getattr(message, "tool_calls", None):
+                    attributes["tool_calls"] = len(message.tool_calls)
+        provider = (response.llm_output or {}).get("provider")
+        if provider:
+            attributes["provider"] = provider
+        self._end(run_id, "ok", attributes)
+
+    def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, "error", {"error": _short(error)})
+
+    def on_tool_start(
+        self,
+        serialized: Dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start(
+            run_id, parent_run_id, name, "tool", {"input": _short(input_str)}
+        )
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, "error", {"error": _short(error)})
+
+    def on_retriever_start(
+        self,
+        serialized: Dict[str, Any],
+        query: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(
+            run_id, parent_run_id, "retriever", "retriever", {"query": _short(query)}
+        )
+
+    def on_retriever_end(
+        self, documents: List[Document], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, "ok", {"documents": len(documents)})
+
+    def on_retriever_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, "error", {"error": _short(error)})
+
+    def on_custom_event(
+        self, name: str, data: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if name != SPAN_EVENT or self.origin_ns is None:
+            return
+        with self._trace_lock:
+            start = self._offset(data["start_ns"])
+            end = self._offset(data["end_ns"])
+            parent = self._innermost_open(run_id, start)
+            self._append(
+                {
+                    "span_id": _new_span_id(),
+                    "parent_id": parent["span_id"] if parent else None,
+                    "name": data["name"],
+                    "kind": "internal",
+                    "start_ns": start,
+                    "end_ns": end,
+                    "status": data.get("status", "ok"),
+                    "attributes": {
+                        k: v if isinstance(v, (int, float, bool)) else _short(v)
+                        for k, v in (data.get("attributes") or {}).items()
+                    },
+                }
+            )
+
+    def _innermost_open(self, run_id: UUID, start: int) -> Optional[Dict[str, Any]]:
+        """
+        自定义事件只携带其所在运行 (通常是工具) 的 run_id；
+        检索器内部不会切换运行上下文，因此改挂到该运行下仍未结束的最内层 Span。
+        """
+        parent = self._resolve_parent(run_id)
+        if parent is None:
+            return None
+        candidate = parent
+        for record in self.spans:
+            if (
+                record["parent_id"] == candidate["span_id"]
+                and record["start_ns"] <= start
+                and record["end_ns"] is None
+            ):
+                candidate = record
+        return candidate
+
+    # ------------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------------
+    def trace(self) -> Dict[str, Any]:
+        """可 JSON 序列化的追踪记录 (写入 ChatLog.spans)；未结束的 Span 以当前时间截止"""
+        with self._trace_lock:
+            if self.origin_ns is None:
+                return {}
+            now = self._offset(time.perf_counter_ns())
+            spans = []
+            for record in self.spans:
+                item = dict(record)
+                if item["end_ns"] is None:
+                    item["end_ns"] = now
+                spans.append(item)
+            _fill_self_time(spans)
+            return {
+                "trace_id": self.trace_id,
+                "start_unix_nano": self.origin_unix_ns,
+                "dropped_spans": self.dropped_spans,
+                "spans": spans,
+            }
+
+
+def _fill_self_time(spans: List[Dict[str, Any]]) -> None:
+    """self_ms：扣除直接子 Span 后的耗时 (例如检索 Span 扣除 Embedding 即 FAISS 检索)"""
+    children: Dict[str, int] = {}
+    for item in spans:
+        if item["parent_id"]:
+            children[item["parent_id"]] = children.get(item["parent_id"], 0) + (
+                item["end_ns"] - item["start_ns"]
+            )
+    for item in spans:
+        duration = item["end_ns"] - item["start_ns"]
+        item["duration_ms"] = round(duration / 1e6, 3)
+        item["self_ms"] = round(max(0, duration - children.get(item["span_id"], 0)) / 1e6, 3)
+
+
+def span_depths(spans: List[Dict[str, Any]]) -> Dict[str, int]:
+    """每个 Span 的层级深度 (根为 0)，用于瀑布图缩进"""
+    parents = {s["span_id"]: s["parent_id"] for s in spans}
+    depths: Dict[str, int] = {}
+    for span_id in parents:
+        depth, current = 0, parents[span_id]
+        while current and depth < len(parents):
+            depth += 1
+            current = parents.get(current)
+        depths[span_id] = depth
+    return depths
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": _short(value)}
+
+
+def to_otlp(trace: Dict[str, Any], service_name: str = "smart-port-agent") -> Dict[str, Any]:
+    """转换为 OTLP/JSON (ExportTraceServiceRequest)，可直接 POST 到 Collector 的 /v1/traces"""
+    base = trace.get("start_unix_nano") or 0
+    spans = []
+    for item in trace.get("spans", []):
+        otlp_span = {
+            "traceId": trace["trace_id"],
+            "spanId": item["span_id"],
+            "name": item["name"],
+            "kind": _OTLP_KINDS.get(item["kind"], 1),
+            "startTimeUnixNano": str(base + item["start_ns"]),
+            "endTimeUnixNano": str(base + item["end_ns"]),
+            "attributes": [
+                {"key": "span.kind", "value": _otlp_value(item["kind"])}
+            ]
+            + [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in item.get("attributes", {}).items()
+                if value is not None
+            ],
+            "status": {"code": _OTLP_STATUS.get(item.get("status"), 0)},
+        }
+        if item.get("parent_id"):
+            otlp_span["parentSpanId"] = item["parent_id"]
+        spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service_name}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+
+def to_otlp_json(traces: List[Dict[str, Any]], **kwargs: Any) -> str:
+    """把多条追踪记录合并导出为一个 OTLP/JSON 文件内容"""
+    resource_spans = []
+    for trace in traces:
+        if trace and trace.get("spans"):
+            resource_spans.extend(to_otlp(trace, **kwargs)["resourceSpans"])
+    return json.dumps({"resourceSpans": resource_spans}, ensure_ascii=False, indent=2)
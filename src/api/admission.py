@@ -0,0 +1,76 @@
+# src/api/admission.py
+"""
+并发准入控制 (Admission Control)
+
+使用信号量限制同时执行的 Agent 请求数 (即并发 LLM 调用)，超出部分进入有界等待队列；
+队列已满或排队超时时立即拒绝，由上层返回 429，避免请求无限堆积拖垮整个进程。
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class QueueFullError(Exception):
+    """等待队列已满或排队超时"""
+
+    def __init__(self, queue_depth: int, max_queue: int, reason: str = "queue_full"):
+        self.queue_depth = queue_depth
+        self.max_queue = max_queue
+        self.reason = reason
+        super().__init__(f"{reason}: {queue_depth}/{max_queue}")
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.max_concurrency and self.waiting >= self.max_queue
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+        }
+
+    async def acquire(self) -> int:
+        """
+        获取执行槽位，返回入队时的排队位置 (0 表示无需排队)。
+        队列已满或等待超时抛出 QueueFullError。
+        """
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise QueueFullError(self.waiting, self.max_queue)
+            position = self.waiting + 1
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise QueueFullError(self.waiting, self.max_queue, reason="queue_timeout")
+            finally:
+                self.waiting -= 1
+        else:
+            position = 0
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return position
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[int]:
+        position = await self.acquire()
+        try:
+            yield position
+        finally:
+            self.release()
@@ -0,0 +1,256 @@
+# src/api/server.py
+"""
+异步 HTTP 服务入口
+
+所有请求共享同一个 Agent 执行器 (及其 LLM 客户端)，通过 AdmissionController
+限制并发 LLM 调用，饱和时返回 429 与当前排队情况。
+
+    uv run python -m src.api.server
+
+接口：
+    POST /v1/diagnose   {"query": "...", "session_id": "...", "stream": false}
+                        同一 session_id 的请求共享会话记忆
+                        stream=true 时以 SSE 推送 token / reset / done / error 事件
+    GET  /healthz       存活探针
+    GET  /readyz        就绪探针 (Agent 初始化完成且未饱和)
+    GET  /metrics       Prometheus 指标 (请求耗时、Token、工具 / 检索耗时、缓存命中、审计队列)
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from src.config import settings
+from src.agent.agent_creator import create_port_agent
+from src.agent.memory import ConversationMemory
+from src.api.admission import AdmissionController, QueueFullError
+from src.database.audit_writer import get_audit_writer, get_provider_stat_writer
+from src.observability.metrics import CONTENT_TYPE, REGISTRY
+from src.web.callbacks import AgentMonitorCallback
+
+logger = logging.getLogger(__name__)
+
+
+class DiagnoseRequest(BaseModel):
+    query: str = Field(..., min_length=1, description="用户问题")
+    session_id: Optional[str] = Field(None, max_length=50)
+    stream: bool = False
+
+
+class AgentService:
+    """持有共享执行器与准入控制器"""
+
+    def __init__(self):
+        self.executor = None
+        self.init_error: Optional[str] = None
+        self.admission = AdmissionController(
+            max_concurrency=settings.API_MAX_CONCURRENCY,
+            max_queue=settings.API_MAX_QUEUE,
+            queue_timeout=settings.API_QUEUE_TIMEOUT,
+        )
+        # 按 session_id 保存会话记忆，超过上限时淘汰最久未使用的会话
+        self.memories: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+
+    @property
+    def ready(self) -> bool:
+        return self.executor is not None
+
+    def memory_for(self, session_id: Optional[str]) -> Optional[ConversationMemory]:
+        if not session_id:
+            return None
+        memory = self.memories.pop(session_id, None) or ConversationMemory.from_settings()
+        self.memories[session_id] = memory
+        while len(self.memories) > settings.API_MAX_SESSIONS:
+            self.memories.popitem(last=False)
+        return memory
+
+    async def start(self) -> None:
+        # Embedding 模型与向量库加载较慢，放到线程中执行，启动期间 /readyz 返回 503
+        try:
+            executor = await asyncio.to_thread(create_port_agent)
+            executor.verbose = False
+            self.executor = executor
+            logger.info("✅ Agent 执行器初始化完成")
+        except Exception as e:
+            self.init_error = str(e)
+            logger.error(f"❌ Agent 初始化失败: {e}")
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    持有执行槽位的流式响应。
+    槽位在响应结束时释放，不依赖生成器开始迭代：客户端在首个字节前断开或发送失败时，
+    生成器可能从未执行，此时也不会泄漏槽位。
+    """
+
+    def __init__(self, content: AsyncIterator[str], release: Callable[[], None], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+def _metrics(monitor: AgentMonitorCallback) -> Dict[str, Any]:
+    return {
+        "latency": monitor.latency,
+        "ttft": monitor.ttft,
+        "tokens": monitor.token_usage,
+        "llm_calls": monitor.llm_calls,
+        "llm_calls_saved": monitor.llm_calls_saved,
+        "tokens_saved": monitor.tokens_saved,
+        "route": monitor.route,
+    }
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _too_many_requests(e: QueueFullError, service: AgentService) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={
+            "error": "服务繁忙，请稍后重试",
+            "reason": e.reason,
+            **service.admission.snapshot(),
+        },
+        headers={"Retry-After": str(settings.API_RETRY_AFTER)},
+    )
+
+
+def create_app(service: Optional[AgentService] = None) -> FastAPI:
+    service = service or AgentService()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        init_task = asyncio.create_task(service.start())
+        yield
+        init_task.cancel()
+        # 关闭前把队列中的审计日志与供应商统计写完
+        await asyncio.to_thread(get_audit_writer().close)
+        await asyncio.to_thread(get_provider_stat_writer().close)
+
+    app = FastAPI(title="SmartPortAgent API", version="0.2.0", lifespan=lifespan)
+    app.state.service = service
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    async def readyz():
+        body = {"ready": service.ready, **service.admission.snapshot()}
+        if service.init_error:
+            body["error"] = service.init_error
+        body["audit"] = get_audit_writer().stats()
+        if not service.ready or service.admission.saturated:
+            return JSONResponse(status_code=503, content=body)
+        return body
+
+    @app.get("/metrics")
+    async def metrics():
+        get_audit_writer()  # 确保审计队列指标已注册
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    @app.post("/v1/diagnose")
+    async def diagnose(req: DiagnoseRequest):
+        if not service.ready:
+            return JSONResponse(
+                status_code=503, content={"error": "Agent 尚未就绪", "ready": False}
+            )
+
+        monitor = AgentMonitorCallback(session_id=req.session_id)
+        memory = service.memory_for(req.session_id)
+        inputs = {"input": req.query, **(memory.load_variables() if memory else {})}
+
+        # 先拿到执行槽位再返回流式响应，才能在饱和时返回 429
+        try:
+            position = await service.admission.acquire()
+        except QueueFullError as e:
+            return _too_many_requests(e, service)
+
+        if req.stream:
+            return AdmittedStreamingResponse(
+                _stream_diagnosis(service, req, inputs, memory, monitor, position),
+                release=service.admission.release,
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        try:
+            response = await service.executor.ainvoke(
+                inputs, config={"callbacks": [monitor]}
+            )
+        except Exception as e:
+            logger.exception("诊断请求失败")
+            return JSONResponse(status_code=500, content={"error": str(e)})
+        finally:
+            service.admission.release()
+
+        if memory:
+            memory.add_turn(req.query, response["output"])
+        return {
+            "output": response["output"],
+            "queue_position": position,
+            "metrics": _metrics(monitor),
+        }
+
+    return app
+
+
+async def _stream_diagnosis(
+    service: AgentService,
+    req: DiagnoseRequest,
+    inputs: Dict[str, Any],
+    memory: Optional[ConversationMemory],
+    monitor: AgentMonitorCallback,
+    position: int,
+) -> AsyncIterator[str]:
+    """将 astream_events 转换为 SSE；中间轮次以工具调用结束时发送 reset"""
+    try:
+        yield _sse("start", {"queue_position": position})
+        output = None
+        async for event in service.executor.astream_events(
+            inputs,
+            config={"callbacks": [monitor]},
+            version="v2",
+        ):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                text = event["data"]["chunk"].content
+                if text:
+                    yield _sse("token", {"text": text})
+            elif kind == "on_chat_model_end":
+                message = event["data"].get("output")
+                if getattr(message, "tool_calls", None):
+                    yield _sse("reset", {})
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = event["data"]["output"].get("output")
+        if memory and output:
+            memory.add_turn(req.query, output)
+        yield _sse("done", {"output": output, "metrics": _metrics(monitor)})
+    except Exception as e:
+        logger.exception("流式诊断请求失败")
+        yield _sse("error", {"error": str(e)})
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m src.api.server
+    """
+    import uvicorn
+
+    uvicorn.run(app, host=settings.API_HOST, port=settings.API_PORT)
@@ -46,24 +46,90 @@ RETRIEVER_TOOL_DESCRIPTION = (
 
 VECTOR_STORE_PATH: Path = Path("data/vector_store_index")
 
-# 数据库路径
-DB_PATH = BASE_DIR / "data" / "port_agent.db"
+# =======================================================
+# --- Agent 执行配置 ---
+# =======================================================
+
+# 实体预路由：调用 LLM 前先用正则抽取箱号/提单/船名并发查询，节省首轮 LLM 往返
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", "4"))
+# 模板快速通道：纯状态查询且无异常时直接用预取结果渲染答案，不调用 LLM (依赖预路由)
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
+# 流式输出：开启后最终答案逐 Token 推送到 CLI / Web 界面
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+
+# =======================================================
+# --- HTTP API 服务配置 (src/api/server.py) ---
+# =======================================================
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))  # 同时执行的 Agent 请求数
+API_MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", "32"))  # 等待队列长度，超出返回 429
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "30"))  # 最长排队时间(秒)
+API_MAX_SESSIONS = int(os.getenv("API_MAX_SESSIONS", "1000"))  # 内存中保留的会话记忆数
+API_RETRY_AFTER = int(os.getenv("API_RETRY_AFTER", "5"))  # 429 响应的 Retry-After(秒)
+
+# Prometheus 指标：API 服务固定提供 GET /metrics；
+# Streamlit / CLI 进程设置 METRICS_PORT > 0 时另起独立端点 (0 表示不启动)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# 监控回调埋点级别：
+#   off     只计算耗时，不写审计日志、不上报指标
+#   metrics 审计日志摘要列 + Prometheus 指标，不记录 Span / 工具结果 / RAG 片段
+#   full    完整链路追踪；按 MONITOR_TRACE_SAMPLE_RATE 抽样，未抽中的请求按 metrics 级别记录
+MONITOR_LEVEL = os.getenv("MONITOR_LEVEL", "full").lower()
+MONITOR_TRACE_SAMPLE_RATE = float(os.getenv("MONITOR_TRACE_SAMPLE_RATE", "1.0"))
+# Web 界面是否展示思考过程面板 (用户可见功能，与遥测抽样无关)
+WEB_SHOW_THINKING = os.getenv("WEB_SHOW_THINKING", "true").lower() == "true"
+
+# 数据库路径 (可通过环境变量覆盖，便于压测 / 测试使用独立文件)
+DB_PATH = BASE_DIR / os.getenv("DB_PATH", "data/port_agent.db")  # 绝对路径时按原样使用
 # 自动创建 data 目录（防止因目录不存在导致 SQLite 报错）
 if not os.path.exists(DB_PATH.parent):
     os.makedirs(DB_PATH.parent, exist_ok=True)
 
+# SQLite 连接参数 (每个新连接执行 PRAGMA)
+# WAL 模式下读写互不阻塞：监控页查询时聊天请求仍可写入审计日志
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # WAL 下 NORMAL 足够安全
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # 等锁而非立即报错
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # 字节
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))  # 每连接页缓存
+# 连接池 (QueuePool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# 审计日志异步批量写入：回调只入队，后台线程按批次 (一批一个事务) 落库
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "true").lower() == "true"
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "1000"))  # 队列上限，满时丢弃
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "50"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))  # 秒
+
+# 审计日志保留与归档：超过保留天数的日志按日期分区写入 Parquet 后从 SQLite 删除
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))
+ARCHIVE_DIR = BASE_DIR / os.getenv("ARCHIVE_DIR", "data/archive")
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "1000"))  # 每个删除事务的行数
+
+# 日志大字段 (工具调用链 / RAG 片段 / Span) 压缩算法：zstd / zlib (未安装 zstandard 时自动用 zlib)
+LOG_PAYLOAD_CODEC = os.getenv("LOG_PAYLOAD_CODEC", "zstd")
+
 # =======================================================
 # --- 大模型 (LLM) 配置 ---
 # =======================================================
 
 # 🟢 选择你的 LLM 提供商
-# 可选值: "zhipu" (智谱GLM) 或 "qwen" (阿里通义千问)
+# 可选值: "zhipu" (智谱GLM)、"qwen" (阿里通义千问) 或 "fake" (离线模拟模型，用于压测)
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "qwen").lower()
 
 # --- 1. 智谱 AI (ChatGLM) 配置 ---
 ZHIPUAI_API_KEY = os.getenv("ZHIPUAI_API_KEY")
 # 模型选项: "glm-4", "glm-4-plus", "glm-4-flash"
 ZHIPU_MODEL_NAME = "glm-4"
+# OpenAI 兼容端点 (可指向本地替身服务做测试)
+ZHIPU_BASE_URL = os.getenv("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/")
 
 # --- 2. 阿里通义千问 (Qwen) 配置 ---
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
@@ -71,6 +137,61 @@ DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
 # QWEN_MODEL_NAME = "qwen-turbo"
 # QWEN_MODEL_NAME = "qwen-max"
 QWEN_MODEL_NAME = "qwen-plus"
+QWEN_BASE_URL = os.getenv(
+    "QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
+)
+
+# --- LLM 传输层 (共享连接池 / 超时 / 重试) ---
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))  # 建连超时(秒)
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))  # 读取超时(秒)
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))  # 等待空闲连接超时(秒)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))  # 429/5xx 最大重试次数
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # 指数退避基数(秒)
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))  # 单次退避上限(秒)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# 每个供应商同时在途的请求数上限 (进程级，同步与所有事件循环的异步客户端共用)
+LLM_PROVIDER_CONCURRENCY = {
+    "qwen": int(os.getenv("QWEN_MAX_CONCURRENCY", "8")),
+    "zhipu": int(os.getenv("ZHIPU_MAX_CONCURRENCY", "4")),
+}
+
+# --- Agent 执行模式 ---
+# react: 工具调用循环 (最多 5 轮 LLM)；plan: 一次规划 + 并行执行 + 一次综合 (最多 2 轮 LLM)
+AGENT_MODE = os.getenv("AGENT_MODE", "react").lower()
+
+# --- Scratchpad 压缩 ---
+# 工具结果只保留所需字段，超出预算时摘要较早轮次的观测
+SCRATCHPAD_COMPACTION = os.getenv("SCRATCHPAD_COMPACTION", "true").lower() == "true"
+SCRATCHPAD_MAX_TOKENS = int(os.getenv("SCRATCHPAD_MAX_TOKENS", "800"))
+SCRATCHPAD_RAG_MAX_CHARS = int(os.getenv("SCRATCHPAD_RAG_MAX_CHARS", "600"))
+
+# --- 会话记忆 ---
+MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", "3"))  # 保留原文的最近轮数
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1500"))  # 记忆总 Token 预算
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "300"))
+
+# --- 对冲请求与故障转移 (Hedging / Failover) ---
+# 开启后主供应商超过 p95 延迟仍未返回时，向备用供应商发送同一请求，先返回者胜出
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_SECONDARY_PROVIDER = os.getenv("LLM_SECONDARY_PROVIDER", "zhipu").lower()
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "3"))  # 样本不足时的对冲延迟(秒)
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "15"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))  # 滚动统计窗口(次)
+# 错误率超过阈值 (且样本足够) 时熔断该供应商，冷却期内优先使用另一家
+FAILOVER_ERROR_RATE = float(os.getenv("FAILOVER_ERROR_RATE", "0.5"))
+FAILOVER_MIN_SAMPLES = int(os.getenv("FAILOVER_MIN_SAMPLES", "5"))
+FAILOVER_COOLDOWN = float(os.getenv("FAILOVER_COOLDOWN", "30"))
+
+# --- 3. 离线 Fake 模型配置 (LLM_PROVIDER=fake) ---
+# 按规则或脚本生成工具调用与答案，无需 API Key
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))  # 每次调用模拟延迟(秒)
+FAKE_LLM_LATENCY_JITTER = float(os.getenv("FAKE_LLM_LATENCY_JITTER", "0.2"))
+FAKE_LLM_SCRIPT_PATH = os.getenv("FAKE_LLM_SCRIPT_PATH")  # 可选：脚本化回复 (JSON)
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "42"))
 
 # --- 配置检查 (仅在直接运行此文件或初始化时提示) ---
 if __name__ != "__main__":
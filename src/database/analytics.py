@@ -0,0 +1,124 @@
+# src/database/analytics.py
+"""
+延迟分位数与成本分布 (SQL 窗口函数计算)
+
+SQLite 没有 percentile 聚合函数，这里在子查询中按 (时间桶, 分组) 分区对每个指标做
+ROW_NUMBER() 排序，外层用最近秩法 (nearest-rank) 取分位：
+    pXX = 分区内排名 >= XX% * n 的最小值
+整个计算在数据库内一次扫描完成，不需要把日志行加载到 pandas。
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func, literal, select
+from sqlalchemy.orm import Session
+
+from src.database.models import ChatLog, ProviderStat
+
+PERCENTILES = (50, 90, 99)
+BUCKET_FORMATS = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+ALL_GROUPS = "全部"
+
+
+def _distributions(
+    db: Session,
+    timestamp_col,
+    group_col,
+    metrics: Dict[str, Any],
+    since: Optional[datetime],
+    granularity: str,
+    extra: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    按 (时间桶, 分组) 计算每个指标的 p50/p90/p99 与均值。
+    metrics: 指标名 -> 列表达式；extra: 指标名 -> 0/1 表达式，输出其均值 (<name>_rate)
+    """
+    bucket = func.strftime(BUCKET_FORMATS[granularity], timestamp_col)
+    partition = [bucket, group_col]
+    columns = [bucket.label("bucket"), group_col.label("grp")]
+    for name, col in metrics.items():
+        columns.append(col.label(name))
+        columns.append(
+            func.row_number().over(partition_by=partition, order_by=col).label(f"rn_{name}")
+        )
+    columns.append(func.count().over(partition_by=partition).label("n"))
+    for name, col in (extra or {}).items():
+        columns.append(col.label(name))
+
+    query = select(*columns)
+    if since:
+        query = query.where(timestamp_col >= since)
+    ranked = query.subquery()
+
+    outer = [ranked.c.bucket, ranked.c.grp, func.count().label("count")]
+    for name in metrics:
+        value, rank = ranked.c[name], ranked.c[f"rn_{name}"]
+        outer.append(func.avg(value).label(f"{name}_avg"))
+        for p in PERCENTILES:
+            outer.append(
+                func.min(case((rank >= p / 100.0 * ranked.c.n, value))).label(f"{name}_p{p}")
+            )
+    for name in extra or {}:
+        outer.append(func.avg(ranked.c[name]).label(f"{name}_rate"))
+
+    rows = db.execute(
+        select(*outer)
+        .group_by(ranked.c.bucket, ranked.c.grp)
+        .order_by(ranked.c.bucket, ranked.c.grp)
+    ).mappings()
+    result = []
+    for row in rows:
+        item = dict(row)
+        item["bucket"] = datetime.strptime(item["bucket"], "%Y-%m-%d %H:%M:%S")
+        item["group"] = item.pop("grp")
+        result.append(item)
+    return result
+
+
+def log_distributions(
+    db: Session,
+    since: Optional[datetime] = None,
+    granularity: str = "hour",
+    by_model: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    每个时间桶 (及模型) 的请求耗时、单次 Token、单次 LLM 调用次数分布：
+    latency_p50/p90/p99/avg, tokens_*, llm_calls_*, count, error_rate
+    """
+    group = (
+        func.coalesce(ChatLog.model_name, "unknown") if by_model else literal(ALL_GROUPS)
+    )
+    rows = _distributions(
+        db,
+        ChatLog.timestamp,
+        group,
+        {
+            "latency": func.coalesce(ChatLog.latency, 0.0),
+            "tokens": func.coalesce(ChatLog.total_tokens, 0),
+            "llm_calls": func.coalesce(ChatLog.llm_calls, 0),
+        },
+        since,
+        granularity,
+        extra={"error": case((ChatLog.status == "error", 1.0), else_=0.0)},
+    )
+    for row in rows:
+        row["error_rate"] = row.pop("error_rate") * 100
+    return rows
+
+
+def provider_latency(
+    db: Session, since: Optional[datetime] = None, granularity: str = "hour"
+) -> List[Dict[str, Any]]:
+    """每个时间桶、每个供应商的单次 LLM 调用耗时分布与失败率 (来自 provider_stats)"""
+    rows = _distributions(
+        db,
+        ProviderStat.timestamp,
+        ProviderStat.provider,
+        {"latency": func.coalesce(ProviderStat.latency, 0.0)},
+        since,
+        granularity,
+        extra={"error": case((ProviderStat.success.is_(False), 1.0), else_=0.0)},
+    )
+    for row in rows:
+        row["error_rate"] = row.pop("error_rate") * 100
+    return rows
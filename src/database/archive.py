@@ -0,0 +1,217 @@
+# src/database/archive.py
+"""
+审计日志冷数据归档 (Retention)
+
+超过保留期的 chat_logs 行按日期分区写入 Parquet (zstd 压缩、列式存储)，再从 SQLite 删除：
+
+    data/archive/chat_logs/date=2025-01-06/part-00000123-00000456.parquet
+
+- 按 id 分块处理，每块 "写文件 -> 删除行 -> 提交" 一个事务，不会长时间占用写锁；
+- 文件先写临时名再原子改名，删除失败时重跑会覆盖写同名分块，读取时按 id 去重；
+- 大字段从 log_payloads 还原后内联写入归档文件，归档完成后清理不再被引用的 blob；
+- 预聚合表 (metrics_hourly / metrics_daily) 不受影响，监控页长周期 KPI 仍然完整。
+
+监控页通过 read_archive() 按日期分区裁剪读取，只加载需要的列。
+"""
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import JSON, DateTime, Float, Integer, text
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.database.models import ChatLog, engine
+from src.database.payloads import hydrate_payloads, prune_payloads
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEY = "date"
+COMPRESSION = "zstd"
+JSON_COLUMNS = [c.name for c in ChatLog.__table__.columns if isinstance(c.type, JSON)]
+
+
+def _arrow_type(column) -> pa.DataType:
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    # 文本与 JSON 列 (JSON 以字符串保存，避免各分区推断出不同的嵌套 schema)
+    return pa.string()
+
+
+# 所有分区文件共用同一 schema
+ARCHIVE_SCHEMA = pa.schema(
+    [pa.field(c.name, _arrow_type(c)) for c in ChatLog.__table__.columns]
+)
+
+
+def archive_root(archive_dir: Optional[Path] = None) -> Path:
+    return Path(archive_dir or settings.ARCHIVE_DIR) / ChatLog.__tablename__
+
+
+def _to_record(log: ChatLog) -> Dict[str, Any]:
+    record = {c.name: getattr(log, c.name) for c in ChatLog.__table__.columns}
+    # 大字段已还原为内联值，归档文件不依赖 log_payloads
+    record["payload_refs"] = None
+    for name in JSON_COLUMNS:
+        if record[name] is not None:
+            record[name] = json.dumps(record[name], ensure_ascii=False)
+    return record
+
+
+def _write_partition(root: Path, day: date, records: List[Dict[str, Any]]) -> int:
+    """写入一个日期分区的分块文件，返回文件字节数"""
+    part_dir = root / f"{PARTITION_KEY}={day.isoformat()}"
+    part_dir.mkdir(parents=True, exist_ok=True)
+    ids = [r["id"] for r in records]
+    path = part_dir / f"part-{min(ids):08d}-{max(ids):08d}.parquet"
+    tmp_path = path.with_suffix(".parquet.tmp")
+    table = pa.Table.from_pylist(records, schema=ARCHIVE_SCHEMA)
+    pq.write_table(table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+    return path.stat().st_size
+
+
+def archive_logs(
+    db: Session,
+    cutoff: datetime,
+    archive_dir: Optional[Path] = None,
+    chunk_size: int = 1000,
+) -> Dict[str, int]:
+    """
+    把 timestamp < cutoff 的日志写入归档并从数据库删除 (每块一个事务)。
+    返回 {"archived": 行数, "files": 文件数, "bytes": 文件总字节数, "pruned_payloads": 清理的 blob 数}
+    """
+    root = archive_root(archive_dir)
+    stats = {"archived": 0, "files": 0, "bytes": 0, "pruned_payloads": 0}
+    while True:
+        chunk = (
+            db.query(ChatLog)
+            .filter(ChatLog.timestamp < cutoff)
+            .order_by(ChatLog.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not chunk:
+            break
+        ids = [log.id for log in chunk]
+        hydrate_payloads(db, chunk)
+
+        by_day: Dict[date, List[Dict[str, Any]]] = {}
+        for log in chunk:
+            by_day.setdefault(log.timestamp.date(), []).append(_to_record(log))
+        try:
+            for day, records in sorted(by_day.items()):
+                stats["bytes"] += _write_partition(root, day, records)
+                stats["files"] += 1
+            db.query(ChatLog).filter(ChatLog.id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        db.expunge_all()
+        stats["archived"] += len(chunk)
+    if stats["archived"]:
+        stats["pruned_payloads"] = prune_payloads(db)
+    return stats
+
+
+def run_retention(
+    retention_days: Optional[int] = None,
+    archive_dir: Optional[Path] = None,
+    chunk_size: Optional[int] = None,
+    vacuum: bool = False,
+) -> Dict[str, int]:
+    """按保留天数归档旧日志；vacuum=True 时归档后回收数据库文件空间"""
+    from src.database.repository import bump_log_version, get_db
+
+    days = settings.LOG_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = datetime.now() - timedelta(days=days)
+    with get_db() as db:
+        stats = archive_logs(
+            db, cutoff, archive_dir, chunk_size or settings.ARCHIVE_CHUNK_SIZE
+        )
+    if stats["archived"]:
+        bump_log_version()
+    if vacuum and stats["archived"]:
+        # 删除只会留下空闲页，VACUUM 才会缩小文件 (需要独占写锁，适合低峰期执行)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+            # WAL 模式下 VACUUM 的结果先写入 -wal 文件，checkpoint 后主文件才会缩小
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    logger.info(f"📦 已归档 {stats['archived']} 条 {days} 天前的审计日志")
+    return stats
+
+
+# ----------------------------------------------------------------------
+# 读取侧
+# ----------------------------------------------------------------------
+def list_partitions(archive_dir: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """归档分区概览：日期、文件数、字节数"""
+    root = archive_root(archive_dir)
+    if not root.exists():
+        return []
+    partitions = []
+    for part_dir in sorted(root.glob(f"{PARTITION_KEY}=*")):
+        files = list(part_dir.glob("*.parquet"))
+        partitions.append(
+            {
+                "date": part_dir.name.split("=", 1)[1],
+                "files": len(files),
+                "bytes": sum(f.stat().st_size for f in files),
+            }
+        )
+    return partitions
+
+
+def read_archive(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    columns: Optional[Sequence[str]] = None,
+    archive_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    """
+    读取 [since, until] 日期 (含两端) 的归档日志。
+    分区裁剪只打开命中日期的文件，columns 只读取需要的列；JSON 列解析回对象。
+    """
+    root = archive_root(archive_dir)
+    columns = list(columns) if columns else ARCHIVE_SCHEMA.names
+    if "id" not in columns:
+        columns = ["id"] + columns
+    if not root.exists():
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(
+        root,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive"
+        ),
+        exclude_invalid_files=True,
+    )
+    expr = None
+    if since:
+        expr = ds.field(PARTITION_KEY) >= since.isoformat()
+    if until:
+        upper = ds.field(PARTITION_KEY) <= until.isoformat()
+        expr = upper if expr is None else expr & upper
+    df = dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+    # 中断重跑可能留下重复分块，按 id 去重
+    df = df.drop_duplicates(subset="id").sort_values("id").reset_index(drop=True)
+    for name in JSON_COLUMNS:
+        if name in df.columns:
+            df[name] = df[name].map(lambda v: json.loads(v) if isinstance(v, str) else v)
+    return df
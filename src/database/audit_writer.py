@@ -0,0 +1,248 @@
+# src/database/audit_writer.py
+"""
+异步批量审计日志写入器 (Audit Log Writer)
+
+回调在请求路径上只把日志记录放入有界队列，由单个后台线程批量落库：
+- 攒够 batch_size 条或距上次写入超过 flush_interval 秒时写一批，一批一个事务；
+- 队列满时丢弃新记录并计数 (不阻塞请求)，写入失败的批次同样计数；
+- 进程退出时 (atexit) 把队列中剩余的记录全部写完；
+- 每批落库后递增日志版本号，监控页缓存据此失效。
+
+供应商调用统计 (对冲 / 故障转移) 使用同一写入器类的另一个实例，
+每次底层 LLM 调用只入队，不在请求路径 (及事件循环) 上提交 SQLite。
+
+AUDIT_ASYNC=false 时退化为同步写入 (每条一个事务)。
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import settings
+from src.database.repository import (
+    ChatLogRepository,
+    ProviderStatRepository,
+    bump_log_version,
+)
+from src.observability.metrics import AUDIT_DROPPED, AUDIT_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# 队列中的控制消息：要求写入线程立即刷盘并通知等待方
+_FlushRequest = threading.Event
+
+
+class AuditLogWriter:
+    def __init__(
+        self,
+        sink: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+        max_queue: int = 1000,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        on_written: Optional[Callable[[], Any]] = bump_log_version,
+        name: str = "audit-writer",
+    ):
+        """
+        :param sink: 批量写入函数，接收一批日志记录 (默认 ChatLogRepository.save_logs)
+        :param on_written: 每批成功落库后的回调 (默认递增日志版本号)
+        :param name: 写入线程名
+        """
+        self.sink = sink or ChatLogRepository.save_logs
+        self.on_written = on_written
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+
+    @classmethod
+    def from_settings(cls, **kwargs: Any) -> "AuditLogWriter":
+        return cls(
+            max_queue=settings.AUDIT_QUEUE_SIZE,
+            batch_size=settings.AUDIT_BATCH_SIZE,
+            flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+            **kwargs,
+        )
+
+    # ------------------------------------------------------------------
+    # 请求路径
+    # ------------------------------------------------------------------
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """放入队列 (不阻塞)；队列已满或写入器已关闭时丢弃并返回 False"""
+        if self._closed:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            logger.warning(f"⚠️ {self.name} 队列已满，丢弃一条记录")
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return True
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """等待此前提交的记录全部落库，返回是否在超时前完成"""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        done = _FlushRequest()
+        # 控制消息不受容量限制丢弃，队列满时阻塞等待；超时仍未入队视为未完成
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """停止接收新记录，写完队列中剩余的记录"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+            }
+
+    # ------------------------------------------------------------------
+    # 写入线程
+    # ------------------------------------------------------------------
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _FlushRequest):
+                self._write(batch)
+                batch, deadline = [], None
+                item.set()
+                continue
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (
+                len(batch) >= self.batch_size or time.monotonic() >= deadline
+            ):
+                self._write(batch)
+                batch, deadline = [], None
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        try:
+            self.sink(batch)
+        except Exception as e:
+            with self._stats_lock:
+                self.failed += len(batch)
+            logger.error(f"❌ {self.name} 批量写入失败 ({len(batch)} 条): {e}")
+            return
+        with self._stats_lock:
+            self.written += len(batch)
+            self.batches += 1
+        # 审计写入器：新日志已落库，监控页缓存失效
+        if self.on_written:
+            self.on_written()
+
+
+# --- 进程级共享写入器 ---
+_writer: Optional[AuditLogWriter] = None
+_stat_writer: Optional[AuditLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer() -> AuditLogWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditLogWriter.from_settings()
+                atexit.register(_writer.close)
+                # 抓取 /metrics 时读取当前写入器状态
+                AUDIT_QUEUE_DEPTH.set_function(lambda: _writer.stats()["queue_depth"])
+                AUDIT_DROPPED.set_function(lambda: _writer.stats()["dropped"])
+    return _writer
+
+
+def write_audit_log(record: Dict[str, Any]) -> None:
+    """写入一条审计日志：默认进入异步批量队列，AUDIT_ASYNC=false 时同步写入"""
+    if settings.AUDIT_ASYNC:
+        get_audit_writer().submit(record)
+    else:
+        ChatLogRepository.save_log(**record)
+        bump_log_version()
+
+
+def get_provider_stat_writer() -> AuditLogWriter:
+    """供应商调用统计的写入器 (不影响日志版本号)"""
+    global _stat_writer
+    if _stat_writer is None:
+        with _writer_lock:
+            if _stat_writer is None:
+                _stat_writer = AuditLogWriter.from_settings(
+                    sink=ProviderStatRepository.save_stats,
+                    on_written=None,
+                    name="provider-stat-writer",
+                )
+                atexit.register(_stat_writer.close)
+    return _stat_writer
+
+
+def write_provider_stat(
+    provider: str,
+    latency: float,
+    success: bool,
+    hedged: bool = False,
+    error_msg: str = None,
+) -> None:
+    """记录一次底层 LLM 调用 (HedgedChatModel 的 stats_sink)：默认入队批量写入"""
+    record = dict(
+        provider=provider,
+        latency=latency,
+        success=success,
+        hedged=hedged,
+        error_msg=error_msg,
+    )
+    if settings.AUDIT_ASYNC:
+        get_provider_stat_writer().submit(record)
+    else:
+        ProviderStatRepository.save_stat(**record)
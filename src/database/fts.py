@@ -0,0 +1,151 @@
+# src/database/fts.py
+"""
+审计日志全文检索 (SQLite FTS5)
+
+chat_logs_fts 是以 chat_logs 为外部内容 (content=chat_logs) 的 FTS5 虚拟表，只保存倒排索引，
+由触发器在 INSERT / UPDATE / DELETE 时同步 (归档删除、清空数据库时同样生效)。
+
+分词器使用 trigram：按 3 字符滑窗建索引，中文无需分词即可做子串匹配，
+提单号 / 箱号 / 海关指令代码 (BILL002、NBCT1234567、H98) 同样适用，且不区分大小写。
+不足 3 个字符的检索词无法走索引，退化为 LIKE 过滤 (与其他词组合时仍先走索引缩小范围)。
+"""
+import logging
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "chat_logs_fts"
+# bm25 列权重：提问命中比回答命中更相关
+BM25_WEIGHTS = (2.0, 1.0)
+MIN_TRIGRAM_CHARS = 3
+
+_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        user_input, ai_output,
+        content='chat_logs', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS chat_logs_fts_ai AFTER INSERT ON chat_logs BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, user_input, ai_output)
+        VALUES (new.id, new.user_input, new.ai_output);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS chat_logs_fts_ad AFTER DELETE ON chat_logs BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, user_input, ai_output)
+        VALUES ('delete', old.id, old.user_input, old.ai_output);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS chat_logs_fts_au
+    AFTER UPDATE OF user_input, ai_output ON chat_logs BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, user_input, ai_output)
+        VALUES ('delete', old.id, old.user_input, old.ai_output);
+        INSERT INTO {FTS_TABLE}(rowid, user_input, ai_output)
+        VALUES (new.id, new.user_input, new.ai_output);
+    END
+    """,
+]
+
+
+def install_fts(engine: Engine) -> bool:
+    """创建 FTS 表与同步触发器；首次创建时为已有日志回填索引。返回是否可用"""
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                {"name": FTS_TABLE},
+            ).first()
+            for ddl in _DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    except OperationalError as e:
+        # 旧版 SQLite (< 3.34) 没有 trigram 分词器，检索退化为 LIKE
+        logger.warning(f"⚠️ 全文检索不可用，退化为 LIKE 查询: {e}")
+        return False
+    return True
+
+
+def has_fts(db: Session) -> bool:
+    return (
+        db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+            {"name": FTS_TABLE},
+        ).first()
+        is not None
+    )
+
+
+def _phrase(term: str) -> str:
+    """用户输入转为 FTS5 短语 (双引号转义)，避免 AND / OR / * 等被当作语法"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_logs(
+    db: Session, query: str, limit: int = 20, offset: int = 0
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    全文检索日志，多个词 (空格分隔) 为 AND 关系。
+    按 bm25 相关度排序 (同分时新日志在前)，返回 (本页结果, 命中总数)。
+    """
+    terms = [t for t in query.split() if t]
+    if not terms:
+        return [], 0
+
+    indexed = [t for t in terms if len(t) >= MIN_TRIGRAM_CHARS]
+    short = [t for t in terms if len(t) < MIN_TRIGRAM_CHARS]
+    use_fts = bool(indexed) and has_fts(db)
+    if not use_fts:
+        short = terms
+
+    params: Dict[str, Any] = {"limit": limit, "offset": offset}
+    where = []
+    for i, term in enumerate(short):
+        params[f"like{i}"] = _like(term)
+        where.append(
+            f"(l.user_input LIKE :like{i} ESCAPE '\\' OR l.ai_output LIKE :like{i} ESCAPE '\\')"
+        )
+
+    if use_fts:
+        params["match"] = " AND ".join(_phrase(t) for t in indexed)
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        source = f"{FTS_TABLE} f JOIN chat_logs l ON l.id = f.rowid"
+        where.insert(0, f"{FTS_TABLE} MATCH :match")
+        rank = f"bm25({FTS_TABLE}, {weights})"
+        snippet = f"snippet({FTS_TABLE}, -1, '**', '**', '…', 24)"
+    else:
+        source = "chat_logs l"
+        rank = "0.0"
+        snippet = "substr(l.ai_output, 1, 120)"
+
+    condition = " AND ".join(where)
+    total = db.execute(
+        text(f"SELECT count(*) FROM {source} WHERE {condition}"), params
+    ).scalar()
+    rows = db.execute(
+        text(
+            f"""
+            SELECT l.id, l.timestamp, l.user_input, l.status, l.latency, l.route,
+                   {snippet} AS snippet, {rank} AS score
+            FROM {source}
+            WHERE {condition}
+            ORDER BY score, l.id DESC
+            LIMIT :limit OFFSET :offset
+            """
+        ).columns(timestamp=DateTime),
+        params,
+    ).mappings().all()
+    return [dict(row) for row in rows], total
@@ -1,7 +1,6 @@
 # src/database/models.py
 from datetime import datetime
 from sqlalchemy import (
-    create_engine,
     Column,
     Integer,
     String,
@@ -9,13 +8,17 @@ from sqlalchemy import (
     Float,
     DateTime,
     JSON,
+    Boolean,
+    LargeBinary,
+    UniqueConstraint,
+    inspect,
+    text,
 )
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from src.config import settings
-
-# 假设在 settings 中增加了 DB_PATH，如果没有，默认用 local.db
-DB_URL = f"sqlite:///{settings.DB_PATH}"
+from src.database.engine import create_sqlite_engine
+from src.database.fts import install_fts
 
 Base = declarative_base()
 
@@ -37,14 +40,23 @@ class ChatLog(Base):
     ai_output = Column(Text, nullable=True, comment="AI回答")
 
     # 诊断与审计信息
-    intermediate_steps = Column(JSON, nullable=True, comment="工具调用链详情")
-    rag_sources = Column(JSON, nullable=True, comment="RAG引用文档")
+    # none_as_null: 空值存为 SQL NULL 而不是 JSON 'null'
+    intermediate_steps = Column(JSON(none_as_null=True), nullable=True, comment="工具调用链详情")
+    rag_sources = Column(JSON(none_as_null=True), nullable=True, comment="RAG引用文档")
+    spans = Column(JSON(none_as_null=True), nullable=True, comment="链路追踪 Span (LLM/工具/检索耗时)")
+    # 新日志的以上大字段存入 log_payloads (压缩 + 去重)，此处只保存内容哈希
+    payload_refs = Column(JSON(none_as_null=True), nullable=True, comment="大字段在 log_payloads 中的内容哈希")
 
     # 性能指标
     latency = Column(Float, comment="总耗时(秒)")
+    ttft = Column(Float, nullable=True, comment="首Token耗时(秒)")
     total_tokens = Column(Integer, default=0)
     input_tokens = Column(Integer, default=0)
     output_tokens = Column(Integer, default=0)
+    llm_calls = Column(Integer, default=0, comment="LLM 调用次数")
+    llm_calls_saved = Column(Integer, default=0, comment="预路由节省的 LLM 调用次数")
+    tokens_saved = Column(Integer, default=0, comment="Scratchpad 压缩节省的输入 Token")
+    route = Column(String(20), nullable=True, comment="执行路径 template/agent")
 
     # 元数据
     model_name = Column(String(50), nullable=True)
@@ -52,11 +64,100 @@ class ChatLog(Base):
     error_message = Column(Text, nullable=True)
 
 
-# 初始化数据库连接
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+class LogPayload(Base):
+    """
+    审计日志大字段存储表
+    工具调用链 / RAG 片段 / 链路追踪以压缩 blob 保存，按内容哈希去重 (同一 RAG 片段只存一份)
+    """
+
+    __tablename__ = "log_payloads"
+    # 以哈希为聚簇主键，避免 rowid 表 + 唯一索引重复保存 64 字节哈希
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    hash = Column(String(64), primary_key=True, comment="原始 JSON 的 SHA-256")
+    codec = Column(String(10), nullable=False, comment="zstd/zlib/raw")
+    size = Column(Integer, nullable=False, comment="原始 JSON 字节数")
+    data = Column(LargeBinary, nullable=False)
+    last_used = Column(DateTime, default=datetime.now, comment="最近一次被引用的时间")
+
+
+class ProviderStat(Base):
+    """
+    LLM 供应商调用统计表
+    记录每次底层 LLM 调用的延迟与成败，用于对冲延迟预热与故障分析
+    """
+
+    __tablename__ = "provider_stats"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, default=datetime.now, index=True, comment="记录时间")
+    provider = Column(String(20), index=True, nullable=False, comment="供应商")
+    latency = Column(Float, comment="调用耗时(秒)")
+    success = Column(Boolean, default=True)
+    hedged = Column(Boolean, default=False, comment="是否为对冲 / 故障转移请求")
+    error_message = Column(Text, nullable=True)
+
+
+class _MetricsRollupMixin:
+    """
+    审计指标预聚合 (按时间桶)
+    写入日志时在同一事务内增量更新，监控页只需读取少量聚合行即可计算长周期 KPI
+    """
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket = Column(DateTime, nullable=False, comment="时间桶起点")
+    count = Column(Integer, default=0, comment="调用次数")
+    error_count = Column(Integer, default=0)
+    template_count = Column(Integer, default=0, comment="模板快速通道次数")
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    tokens_saved = Column(Integer, default=0)
+    llm_calls = Column(Integer, default=0)
+    latency_sum = Column(Float, default=0.0, comment="耗时总和(秒)")
+    latency_max = Column(Float, default=0.0)
+    latency_hist = Column(JSON, comment="耗时直方图 (桶边界见 src/database/rollup.py)")
+
+
+class MetricsHourly(_MetricsRollupMixin, Base):
+    __tablename__ = "metrics_hourly"
+    __table_args__ = (UniqueConstraint("bucket", name="uq_metrics_hourly_bucket"),)
+
+
+class MetricsDaily(_MetricsRollupMixin, Base):
+    __tablename__ = "metrics_daily"
+    __table_args__ = (UniqueConstraint("bucket", name="uq_metrics_daily_bucket"),)
+
+
+# 初始化数据库连接 (WAL + PRAGMA + 连接池，见 src/database/engine.py)
+engine = create_sqlite_engine(settings.DB_PATH)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _add_missing_columns():
+    """
+    轻量级迁移：为已存在的旧表补齐新增的列。
+    create_all 只会创建缺失的表，不会修改已有表结构。
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=engine.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"
+            if column.default is not None and column.default.is_scalar:
+                ddl += f" DEFAULT {column.default.arg!r}"
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+
+
 def init_db():
     """初始化数据库表结构"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # 全文检索虚拟表与同步触发器
+    install_fts(engine)
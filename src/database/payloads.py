@@ -0,0 +1,272 @@
+# src/database/payloads.py
+"""
+审计日志大字段的压缩去重存储 (log_payloads 侧表)
+
+intermediate_steps / rag_sources / spans 不再内联在 chat_logs 行内，而是：
+- 序列化为规范 JSON 后按 SHA-256 去重，压缩 (zstd，未安装 zstandard 时用 zlib) 存入 log_payloads；
+- 列表字段逐元素存储：同一 RAG 片段、同一工具结果在不同日志间只保存一份；
+- chat_logs.payload_refs 只记录哈希，主表行变小，KPI / 列表查询扫描的页更少。
+
+读取详情时 hydrate_payloads() 按哈希批量取回并还原到 ChatLog 对象上。
+未迁移的旧行 (payload_refs 为空) 仍直接使用内联列，见 migrate_inline_payloads()。
+"""
+import hashlib
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.database.models import ChatLog, LogPayload
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PAYLOAD_FIELDS = ("intermediate_steps", "rag_sources", "spans")
+# 逐元素去重的列表字段；spans 每次请求都不同，整体存储
+LIST_FIELDS = ("intermediate_steps", "rag_sources")
+ZSTD_LEVEL = 3
+# 单条 INSERT 的行数上限 (SQLite 绑定参数数量有限制)
+INSERT_BATCH = 500
+
+
+def default_codec() -> str:
+    codec = settings.LOG_PAYLOAD_CODEC
+    if codec == "zstd" and zstandard is None:
+        return "zlib"
+    return codec
+
+
+def encode(value: Any) -> bytes:
+    """规范化 JSON (键排序、紧凑分隔符)，相同内容得到相同哈希"""
+    return json.dumps(
+        value, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == "zlib":
+        return zlib.compress(raw, 6)
+    return raw
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的日志需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+# ----------------------------------------------------------------------
+# 写入
+# ----------------------------------------------------------------------
+def store_payloads(db: Session, logs: Sequence[ChatLog], codec: Optional[str] = None) -> None:
+    """
+    在调用方事务内把日志大字段写入 log_payloads，并改写为 payload_refs (不提交)。
+    已存在的内容只刷新 last_used，不重复压缩与写入。
+    """
+    codec = codec or default_codec()
+    raw_by_hash: Dict[str, bytes] = {}
+
+    def put(value: Any) -> str:
+        raw = encode(value)
+        digest = hashlib.sha256(raw).hexdigest()
+        raw_by_hash.setdefault(digest, raw)
+        return digest
+
+    for log in logs:
+        if log.payload_refs is not None:
+            continue
+        refs: Dict[str, Any] = {}
+        for field in PAYLOAD_FIELDS:
+            value = getattr(log, field)
+            if value is None:
+                continue
+            if field in LIST_FIELDS and isinstance(value, list):
+                refs[field] = [put(item) for item in value]
+            else:
+                refs[field] = put(value)
+            setattr(log, field, None)
+        log.payload_refs = refs
+
+    if not raw_by_hash:
+        return
+    now = datetime.now()
+    hashes = list(raw_by_hash)
+    # 先 UPDATE 取得写锁，之后的存在性检查与清理任务 (prune_payloads) 不会交错
+    for i in range(0, len(hashes), INSERT_BATCH):
+        db.query(LogPayload).filter(
+            LogPayload.hash.in_(hashes[i : i + INSERT_BATCH])
+        ).update({LogPayload.last_used: now}, synchronize_session=False)
+    existing = set()
+    for i in range(0, len(hashes), INSERT_BATCH):
+        existing.update(
+            h for (h,) in db.query(LogPayload.hash).filter(
+                LogPayload.hash.in_(hashes[i : i + INSERT_BATCH])
+            )
+        )
+
+    rows = []
+    for digest in hashes:
+        if digest in existing:
+            continue
+        raw = raw_by_hash[digest]
+        data = compress(raw, codec)
+        row_codec = codec
+        if len(data) >= len(raw):
+            # 很短的内容压缩后反而变大，原样保存
+            data, row_codec = raw, "raw"
+        rows.append(
+            {"hash": digest, "codec": row_codec, "size": len(raw), "data": data, "last_used": now}
+        )
+    for i in range(0, len(rows), INSERT_BATCH):
+        db.execute(
+            insert(LogPayload)
+            .values(rows[i : i + INSERT_BATCH])
+            .on_conflict_do_nothing(index_elements=["hash"])
+        )
+
+
+# ----------------------------------------------------------------------
+# 读取
+# ----------------------------------------------------------------------
+def _iter_hashes(refs: Dict[str, Any]) -> Iterable[str]:
+    for ref in refs.values():
+        if isinstance(ref, list):
+            yield from ref
+        elif ref:
+            yield ref
+
+
+def load_payloads(db: Session, hashes: Iterable[str]) -> Dict[str, Any]:
+    hashes = list(set(hashes))
+    values: Dict[str, Any] = {}
+    for i in range(0, len(hashes), INSERT_BATCH):
+        rows = db.query(LogPayload.hash, LogPayload.codec, LogPayload.data).filter(
+            LogPayload.hash.in_(hashes[i : i + INSERT_BATCH])
+        )
+        for digest, codec, data in rows:
+            values[digest] = json.loads(decompress(data, codec))
+    return values
+
+
+def resolve_refs(refs: Dict[str, Any], values: Dict[str, Any]) -> Dict[str, Any]:
+    """哈希引用还原为字段值 (缺失的 blob 跳过)"""
+    resolved = {}
+    for field, ref in refs.items():
+        if isinstance(ref, list):
+            resolved[field] = [values[h] for h in ref if h in values]
+        else:
+            resolved[field] = values.get(ref)
+    return resolved
+
+
+def hydrate_payloads(db: Session, logs: Sequence[ChatLog]) -> List[ChatLog]:
+    """
+    批量取回日志的大字段并填充到对象上。
+    对象会先脱离 Session，填充的值不会被当作修改写回数据库。
+    """
+    with_refs = [log for log in logs if log.payload_refs]
+    values = load_payloads(
+        db, (h for log in with_refs for h in _iter_hashes(log.payload_refs))
+    )
+    for log in with_refs:
+        db.expunge(log)
+        for field, value in resolve_refs(log.payload_refs, values).items():
+            setattr(log, field, value)
+    return list(logs)
+
+
+def prune_payloads(db: Session) -> int:
+    """删除不再被任何日志引用的 blob (归档 / 删除日志之后执行)，返回删除数"""
+    result = db.execute(
+        text(
+            """
+            DELETE FROM log_payloads WHERE hash NOT IN (
+                SELECT j.value FROM chat_logs c, json_tree(c.payload_refs) j
+                WHERE c.payload_refs IS NOT NULL AND j.atom IS NOT NULL
+            )
+            """
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+# ----------------------------------------------------------------------
+# 迁移与空间报告
+# ----------------------------------------------------------------------
+def migrate_inline_payloads(db: Session, chunk_size: int = 500) -> int:
+    """把旧行的内联大字段迁入 log_payloads (按 id 分块，每块一个事务)，返回迁移行数"""
+    migrated, last_id = 0, 0
+    while True:
+        chunk = (
+            db.query(ChatLog)
+            .filter(ChatLog.id > last_id, ChatLog.payload_refs.is_(None))
+            .order_by(ChatLog.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not chunk:
+            break
+        try:
+            store_payloads(db, chunk)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        migrated += len(chunk)
+        last_id = chunk[-1].id
+        db.expunge_all()
+    return migrated
+
+
+def payload_report(db: Session) -> Dict[str, int]:
+    """
+    大字段存储空间统计 (字节)：
+    inline: 仍内联在 chat_logs 中的 JSON；logical: 所有引用展开后的原始大小；
+    unique: 去重后的原始大小；stored: 压缩后实际存储的大小
+    """
+    inline = db.query(
+        func.coalesce(
+            func.sum(
+                func.coalesce(func.length(ChatLog.intermediate_steps), 0)
+                + func.coalesce(func.length(ChatLog.rag_sources), 0)
+                + func.coalesce(func.length(ChatLog.spans), 0)
+            ),
+            0,
+        )
+    ).scalar()
+    logical = db.execute(
+        text(
+            """
+            SELECT coalesce(sum(p.size), 0)
+            FROM chat_logs c, json_tree(c.payload_refs) j
+            JOIN log_payloads p ON p.hash = j.value
+            WHERE c.payload_refs IS NOT NULL AND j.atom IS NOT NULL
+            """
+        )
+    ).scalar()
+    blobs, unique, stored = db.query(
+        func.count(LogPayload.hash),
+        func.coalesce(func.sum(LogPayload.size), 0),
+        func.coalesce(func.sum(func.length(LogPayload.data)), 0),
+    ).one()
+    return {
+        "inline": inline,
+        "logical": logical,
+        "unique": unique,
+        "stored": stored,
+        "blobs": blobs,
+    }
@@ -1,13 +1,69 @@
 # src/database/repository.py
 import json
+import threading
+from datetime import datetime
 from contextlib import contextmanager
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
-from src.database.models import ChatLog, SessionLocal, init_db
+from src.database.models import (
+    ChatLog,
+    MetricsDaily,
+    MetricsHourly,
+    ProviderStat,
+    SessionLocal,
+    LogPayload,
+    init_db,
+)
+from src.database.analytics import log_distributions, provider_latency
+from src.database.fts import search_logs
+from src.database.payloads import (
+    hydrate_payloads,
+    load_payloads,
+    resolve_refs,
+    store_payloads,
+)
+from src.database.rollup import (
+    ROLLUP_MODELS,
+    apply_rollups,
+    rebuild_rollups,
+    rows_by_bucket,
+)
 
 # 确保启动时初始化表
 init_db()
 
+# 列表视图只读取的摘要列 (大字段 ai_output / intermediate_steps / rag_sources / spans 按 id 懒加载)
+PREVIEW_CHARS = 120
+LOG_SUMMARY_COLUMNS = (
+    ChatLog.id,
+    ChatLog.timestamp,
+    ChatLog.session_id,
+    func.substr(ChatLog.user_input, 1, PREVIEW_CHARS).label("user_input"),
+    ChatLog.latency,
+    ChatLog.total_tokens,
+    ChatLog.llm_calls,
+    ChatLog.llm_calls_saved,
+    ChatLog.tokens_saved,
+    ChatLog.route,
+    ChatLog.status,
+)
+
+# 翻页游标：上一页最后一行的 (timestamp, id)
+LogCursor = Tuple[datetime, int]
+
+# 日志表版本号：审计写入器落库、清空 / 归档日志后递增，监控页缓存以此为键
+_log_version = 0
+_log_version_lock = threading.Lock()
+
+
+def bump_log_version() -> int:
+    """日志数据发生变化 (写入 / 删除) 后调用，使监控页缓存失效"""
+    global _log_version
+    with _log_version_lock:
+        _log_version += 1
+        return _log_version
+
 
 @contextmanager
 def get_db():
@@ -21,7 +77,17 @@ def get_db():
 
 class ChatLogRepository:
     @staticmethod
-    def save_log(
+    def log_version() -> Tuple[int, int]:
+        """
+        当前日志数据版本：(进程内写入计数, 最大日志 id)。
+        最大 id 走主键索引，同时能感知其他进程 (如 API 服务) 写入的新日志。
+        """
+        with get_db() as db:
+            max_id = db.query(func.max(ChatLog.id)).scalar() or 0
+        return _log_version, max_id
+
+    @staticmethod
+    def build_log(
         user_input: str,
         ai_output: str,
         latency: float,
@@ -30,25 +96,67 @@ class ChatLogRepository:
         rag_sources: List[str],
         status: str = "success",
         error_msg: str = None,
-    ):
-        """保存单次对话日志"""
-        with get_db() as db:
-            log_entry = ChatLog(
-                user_input=user_input,
-                ai_output=ai_output,
-                latency=latency,
-                input_tokens=token_usage.get("input", 0),
-                output_tokens=token_usage.get("output", 0),
-                total_tokens=token_usage.get("total", 0),
-                intermediate_steps=intermediate_steps,  # SQLAlchemy处理JSON序列化
-                rag_sources=rag_sources,
-                status=status,
-                error_message=error_msg,
-            )
+        llm_calls: int = 0,
+        llm_calls_saved: int = 0,
+        ttft: float = None,
+        session_id: str = None,
+        tokens_saved: int = 0,
+        spans: Dict[str, Any] = None,
+        route: str = None,
+        model_name: str = None,
+        timestamp: datetime = None,
+    ) -> ChatLog:
+        """由日志字段构造 ChatLog 行 (未入库)"""
+        return ChatLog(
+            session_id=session_id,
+            timestamp=timestamp or datetime.now(),
+            user_input=user_input,
+            ai_output=ai_output,
+            latency=latency,
+            input_tokens=token_usage.get("input", 0),
+            output_tokens=token_usage.get("output", 0),
+            total_tokens=token_usage.get("total", 0),
+            intermediate_steps=intermediate_steps,  # SQLAlchemy处理JSON序列化
+            rag_sources=rag_sources,
+            status=status,
+            error_message=error_msg,
+            llm_calls=llm_calls,
+            llm_calls_saved=llm_calls_saved,
+            ttft=ttft,
+            tokens_saved=tokens_saved,
+            spans=spans,
+            route=route,
+            model_name=model_name,
+        )
+
+    @staticmethod
+    def save_log(**fields):
+        """保存单次对话日志 (字段见 build_log)"""
+        with get_db() as db:
+            log_entry = ChatLogRepository.build_log(**fields)
+            store_payloads(db, [log_entry])
             db.add(log_entry)
+            apply_rollups(db, [log_entry])
             db.commit()
             return log_entry.id
 
+    @staticmethod
+    def save_logs(records: List[Dict[str, Any]]) -> int:
+        """批量保存日志，一批一个事务 (供异步写入器调用)"""
+        with get_db() as db:
+            try:
+                entries = [ChatLogRepository.build_log(**r) for r in records]
+                # 大字段压缩去重后写入 log_payloads
+                store_payloads(db, entries)
+                db.add_all(entries)
+                # 同一事务内累加小时 / 天聚合
+                apply_rollups(db, entries)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            return len(records)
+
     @staticmethod
     def get_recent_logs(limit: int = 50):
         """获取最近的日志记录"""
@@ -57,6 +165,78 @@ class ChatLogRepository:
                 db.query(ChatLog).order_by(ChatLog.timestamp.desc()).limit(limit).all()
             )
 
+    @staticmethod
+    def list_logs(
+        limit: int = 50,
+        cursor: Optional[LogCursor] = None,
+        status: str = None,
+        since: datetime = None,
+        until: datetime = None,
+        min_latency: float = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[LogCursor]]:
+        """
+        按 (timestamp, id) 倒序键集分页读取日志摘要，返回 (本页行, 下一页游标)。
+        过滤条件在 SQL 中执行；until 为开区间。timestamp 索引隐含 rowid (即 id)，
+        翻页条件可直接走索引，不随页码增加而变慢。
+        """
+        with get_db() as db:
+            query = db.query(*LOG_SUMMARY_COLUMNS)
+            if status:
+                query = query.filter(ChatLog.status == status)
+            if since:
+                query = query.filter(ChatLog.timestamp >= since)
+            if until:
+                query = query.filter(ChatLog.timestamp < until)
+            if min_latency is not None:
+                query = query.filter(ChatLog.latency >= min_latency)
+            if cursor:
+                query = query.filter(tuple_(ChatLog.timestamp, ChatLog.id) < tuple_(*cursor))
+            rows = (
+                query.order_by(ChatLog.timestamp.desc(), ChatLog.id.desc())
+                .limit(limit + 1)
+                .all()
+            )
+        page = [dict(row._mapping) for row in rows[:limit]]
+        next_cursor = (page[-1]["timestamp"], page[-1]["id"]) if len(rows) > limit else None
+        return page, next_cursor
+
+    @staticmethod
+    def search_logs(
+        query: str, limit: int = 20, offset: int = 0
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """全文检索提问与回答 (FTS5 + bm25 排序)，返回 (本页结果, 命中总数)"""
+        with get_db() as db:
+            return search_logs(db, query, limit, offset)
+
+    @staticmethod
+    def get_log(log_id: int) -> Optional[ChatLog]:
+        """按 id 读取完整日志 (详情页使用，大字段从 log_payloads 还原)"""
+        with get_db() as db:
+            log = db.get(ChatLog, log_id)
+            if log is not None:
+                hydrate_payloads(db, [log])
+            return log
+
+    @staticmethod
+    def get_spans(log_ids: List[int]) -> List[Dict[str, Any]]:
+        """只读取指定日志的 spans 列 (批量导出链路追踪)"""
+        if not log_ids:
+            return []
+        with get_db() as db:
+            rows = (
+                db.query(ChatLog.spans, ChatLog.payload_refs)
+                .filter(ChatLog.id.in_(log_ids))
+                .order_by(ChatLog.id)
+                .all()
+            )
+            refs = [(row.payload_refs or {}).get("spans") for row in rows]
+            values = load_payloads(db, (h for h in refs if h))
+        spans = [
+            row.spans if row.spans is not None else resolve_refs({"spans": ref}, values)["spans"]
+            for row, ref in zip(rows, refs)
+        ]
+        return [s for s in spans if s]
+
     @staticmethod
     def clear_logs():
         """清空所有审计日志"""
@@ -64,9 +244,107 @@ class ChatLogRepository:
             try:
                 # 批量删除所有记录
                 num_deleted = db.query(ChatLog).delete()
+                for model in (LogPayload, MetricsHourly, MetricsDaily):
+                    db.query(model).delete()
                 db.commit()
+                bump_log_version()
                 return num_deleted
             except Exception as e:
                 db.rollback()
                 print(f"❌ 清空数据库失败: {e}")
                 return 0
+
+
+class MetricsRollupRepository:
+    @staticmethod
+    def get_rollups(granularity: str = "day", since: datetime = None) -> List[Dict[str, Any]]:
+        """按时间顺序返回聚合行 (granularity: hour / day)"""
+        model = ROLLUP_MODELS[granularity]
+        with get_db() as db:
+            query = db.query(model)
+            if since:
+                query = query.filter(model.bucket >= since)
+            return rows_by_bucket(query.order_by(model.bucket).all())
+
+    @staticmethod
+    def rebuild(since: datetime = None) -> int:
+        """从日志表重算聚合 (回填历史数据 / 修复)，返回处理的日志行数"""
+        with get_db() as db:
+            try:
+                processed = rebuild_rollups(db, since)
+            except Exception:
+                db.rollback()
+                raise
+        bump_log_version()
+        return processed
+
+
+class AnalyticsRepository:
+    @staticmethod
+    def log_distributions(
+        since: datetime = None, granularity: str = "hour", by_model: bool = True
+    ) -> List[Dict[str, Any]]:
+        """按时间桶 (及模型) 的耗时 / Token / LLM 调用次数分位数"""
+        with get_db() as db:
+            return log_distributions(db, since, granularity, by_model)
+
+    @staticmethod
+    def provider_latency(since: datetime = None, granularity: str = "hour") -> List[Dict[str, Any]]:
+        """按时间桶、供应商的单次 LLM 调用耗时分位数"""
+        with get_db() as db:
+            return provider_latency(db, since, granularity)
+
+
+class ProviderStatRepository:
+    @staticmethod
+    def save_stat(
+        provider: str,
+        latency: float,
+        success: bool,
+        hedged: bool = False,
+        error_msg: str = None,
+    ):
+        """保存单次底层 LLM 调用统计"""
+        with get_db() as db:
+            db.add(
+                ProviderStat(
+                    provider=provider,
+                    latency=latency,
+                    success=success,
+                    hedged=hedged,
+                    error_message=error_msg,
+                )
+            )
+            db.commit()
+
+    @staticmethod
+    def save_stats(records: List[Dict[str, Any]]) -> int:
+        """批量保存调用统计，一批一个事务 (供异步写入器调用)"""
+        with get_db() as db:
+            db.add_all(
+                [
+                    ProviderStat(
+                        provider=r["provider"],
+                        latency=r["latency"],
+                        success=r["success"],
+                        hedged=r.get("hedged", False),
+                        error_message=r.get("error_msg"),
+                    )
+                    for r in records
+                ]
+            )
+            db.commit()
+            return len(records)
+
+    @staticmethod
+    def get_recent_latencies(provider: str, limit: int = 200) -> List[float]:
+        """获取某供应商最近的成功调用延迟 (用于预热 p95)"""
+        with get_db() as db:
+            rows = (
+                db.query(ProviderStat.latency)
+                .filter(ProviderStat.provider == provider, ProviderStat.success.is_(True))
+                .order_by(ProviderStat.id.desc())
+                .limit(limit)
+                .all()
+            )
+            return [row.latency for row in rows]
@@ -0,0 +1,205 @@
+# src/database/rollup.py
+"""
+审计指标预聚合 (Metrics Rollup)
+
+ChatLog 写入时在同一事务内把指标累加到 metrics_hourly / metrics_daily：
+使用 SQLite UPSERT (INSERT ... ON CONFLICT DO UPDATE) 原子累加，多个写者并发也不会丢计数；
+耗时直方图以 JSON 数组保存，逐桶相加合并。
+
+监控页读取这些聚合行 (一年也只有 365 个日桶) 计算 KPI、趋势与近似分位数，
+不再加载完整日志行。rebuild_rollups() 用于历史数据回填或修复。
+"""
+import bisect
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from src.database.models import ChatLog, MetricsDaily, MetricsHourly
+
+# 耗时直方图桶上界 (秒)，最后一个桶为 > 60s
+LATENCY_BUCKETS: List[float] = [0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60]
+ROLLUP_MODELS = {"hour": MetricsHourly, "day": MetricsDaily}
+SUM_FIELDS = (
+    "count",
+    "error_count",
+    "template_count",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "tokens_saved",
+    "llm_calls",
+    "latency_sum",
+)
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_bucket(latency: float) -> int:
+    return bisect.bisect_left(LATENCY_BUCKETS, latency)
+
+
+def _empty(bucket: datetime) -> Dict[str, Any]:
+    row = {field: 0 for field in SUM_FIELDS}
+    row.update(
+        bucket=bucket,
+        latency_sum=0.0,
+        latency_max=0.0,
+        latency_hist=[0] * (len(LATENCY_BUCKETS) + 1),
+    )
+    return row
+
+
+def aggregate(logs: Iterable[ChatLog], granularity: str) -> List[Dict[str, Any]]:
+    """把一批日志按时间桶聚合为增量行"""
+    rows: Dict[datetime, Dict[str, Any]] = {}
+    for log in logs:
+        ts = log.timestamp or datetime.now()
+        bucket = bucket_start(ts, granularity)
+        if bucket not in rows:
+            rows[bucket] = _empty(bucket)
+        row = rows[bucket]
+        latency = log.latency or 0.0
+        row["count"] += 1
+        row["error_count"] += int(log.status == "error")
+        row["template_count"] += int(log.route == "template")
+        row["input_tokens"] += log.input_tokens or 0
+        row["output_tokens"] += log.output_tokens or 0
+        row["total_tokens"] += log.total_tokens or 0
+        row["tokens_saved"] += log.tokens_saved or 0
+        row["llm_calls"] += log.llm_calls or 0
+        row["latency_sum"] += latency
+        row["latency_max"] = max(row["latency_max"], latency)
+        row["latency_hist"][latency_bucket(latency)] += 1
+    return list(rows.values())
+
+
+def apply_rollups(db: Session, logs: Sequence[ChatLog]) -> None:
+    """在调用方事务内把日志增量累加到小时 / 天聚合表 (不提交)"""
+    if not logs:
+        return
+    for granularity, model in ROLLUP_MODELS.items():
+        rows = aggregate(logs, granularity)
+        table = model.__table__
+        stmt = insert(table).values(rows)
+        excluded = stmt.excluded
+        updates = {field: table.c[field] + excluded[field] for field in SUM_FIELDS}
+        updates["latency_max"] = func.max(table.c.latency_max, excluded.latency_max)
+        updates["latency_hist"] = func.json_array(
+            *[
+                func.json_extract(table.c.latency_hist, f"$[{i}]")
+                + func.json_extract(excluded.latency_hist, f"$[{i}]")
+                for i in range(len(LATENCY_BUCKETS) + 1)
+            ]
+        )
+        db.execute(stmt.on_conflict_do_update(index_elements=["bucket"], set_=updates))
+
+
+def rebuild_rollups(
+    db: Session, since: Optional[datetime] = None, chunk_size: int = 5000
+) -> int:
+    """
+    从 chat_logs 重新计算聚合 (since 之后的桶)。按 id 分块读取，只加载指标列。
+    返回处理的日志行数。
+    """
+    if since:
+        # 对齐到天桶起点，小时桶与天桶删除、重算的范围一致
+        since = bucket_start(since, "day")
+    for model in ROLLUP_MODELS.values():
+        query = db.query(model)
+        if since:
+            query = query.filter(model.bucket >= since)
+        query.delete(synchronize_session=False)
+
+    columns = (
+        ChatLog.id,
+        ChatLog.timestamp,
+        ChatLog.status,
+        ChatLog.route,
+        ChatLog.latency,
+        ChatLog.input_tokens,
+        ChatLog.output_tokens,
+        ChatLog.total_tokens,
+        ChatLog.tokens_saved,
+        ChatLog.llm_calls,
+    )
+    processed, last_id = 0, 0
+    while True:
+        query = db.query(*columns).filter(ChatLog.id > last_id)
+        if since:
+            query = query.filter(ChatLog.timestamp >= since)
+        chunk = query.order_by(ChatLog.id).limit(chunk_size).all()
+        if not chunk:
+            break
+        apply_rollups(db, chunk)
+        processed += len(chunk)
+        last_id = chunk[-1].id
+    db.commit()
+    return processed
+
+
+# ----------------------------------------------------------------------
+# 读取侧：KPI 汇总与近似分位数
+# ----------------------------------------------------------------------
+def histogram_percentile(hist: Sequence[int], p: float, latency_max: float = 0.0) -> float:
+    """由直方图估算分位数 (桶内线性插值)，落在最后一个桶时以最大耗时为上界"""
+    total = sum(hist)
+    if not total:
+        return 0.0
+    target = p / 100 * total
+    cumulative = 0
+    for i, n in enumerate(hist):
+        if n and cumulative + n >= target:
+            lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+            upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else max(latency_max, lower)
+            return lower + (upper - lower) * (target - cumulative) / n
+        cumulative += n
+    return latency_max
+
+
+def summarize(rows: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并多个聚合行，返回 KPI"""
+    merged = _empty(None)
+    for row in rows:
+        for field in SUM_FIELDS:
+            merged[field] += row.get(field) or 0
+        merged["latency_max"] = max(merged["latency_max"], row.get("latency_max") or 0)
+        for i, n in enumerate(row.get("latency_hist") or []):
+            merged["latency_hist"][i] += n
+    count = merged["count"]
+    return {
+        "count": count,
+        "error_rate": merged["error_count"] / count * 100 if count else 0.0,
+        "avg_latency": merged["latency_sum"] / count if count else 0.0,
+        "p95_latency": histogram_percentile(merged["latency_hist"], 95, merged["latency_max"]),
+        "total_tokens": merged["total_tokens"],
+        "tokens_saved": merged["tokens_saved"],
+        "template_rate": merged["template_count"] / count * 100 if count else 0.0,
+    }
+
+
+def window_start(days: Optional[int], granularity: str = "hour") -> Optional[datetime]:
+    """最近 days 天的起始桶 (None 表示全部)"""
+    if days is None:
+        return None
+    return bucket_start(datetime.now() - timedelta(days=days), granularity)
+
+
+def rows_by_bucket(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """ORM 聚合行转字典 (脱离 Session 使用)"""
+    result = []
+    for row in rows:
+        item = {field: getattr(row, field) for field in SUM_FIELDS}
+        item.update(
+            bucket=row.bucket,
+            latency_max=row.latency_max,
+            latency_hist=list(row.latency_hist or []),
+        )
+        result.append(item)
+    return result
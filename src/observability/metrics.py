@@ -0,0 +1,371 @@
+# src/observability/metrics.py
+"""
+进程内指标注册表 (Prometheus 文本格式)
+
+提供 Counter / Gauge / Histogram 三种指标，支持标签，线程安全；
+render() 输出 Prometheus text exposition format 0.0.4，由以下入口暴露：
+- HTTP API 服务：GET /metrics (src/api/server.py)；
+- Streamlit / CLI：METRICS_PORT > 0 时 start_metrics_server() 启动独立的 /metrics 端口。
+
+各层直接使用本模块中的模块级指标对象打点 (见文件末尾)，无需依赖 prometheus_client。
+"""
+import bisect
+import contextlib
+import functools
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+NAMESPACE = "smartport"
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Counter 只能增加")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(_Metric):
+    """瞬时值；set_function() 注册的取值函数在每次抓取时调用"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def value(self, **labels: str) -> float:
+        if self._function is not None:
+            return float(self._function())
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(float(self._function()))}"]
+            except Exception as e:
+                logger.warning(f"⚠️ 指标 {self.name} 取值失败: {e}")
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets)
+        # 每组标签：[各桶计数..., +Inf 计数], 总和
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """with histogram.time(): ... 记录代码块耗时 (秒)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), []))
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v), self._sums[k]) for k, v in self._counts.items())
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + [math.inf], counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            label_str = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs) -> _Metric:
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = cls(full_name, *args, **kwargs)
+                self._metrics[full_name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {full_name} 已注册为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = (),
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """清空所有取值 (测试用)，保留指标定义"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+LATENCY_BUCKETS = (0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+FAST_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# --- 请求 (AgentMonitorCallback) ---
+REQUESTS = REGISTRY.counter("requests_total", "Agent 请求数", ("route", "status"))
+REQUEST_LATENCY = REGISTRY.histogram(
+    "request_latency_seconds", "Agent 请求端到端耗时", ("route",), LATENCY_BUCKETS
+)
+LLM_CALLS_PER_REQUEST = REGISTRY.histogram(
+    "llm_calls_per_request", "每个请求的 LLM 调用次数", (), (0, 1, 2, 3, 4, 5, 8)
+)
+TOKENS = REGISTRY.counter("tokens_total", "LLM Token 消耗", ("type",))
+TOKENS_PER_REQUEST = REGISTRY.histogram(
+    "tokens_per_request", "每个请求的 Token 总数", (), (250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+# --- 工具与检索 (tools / rag 层) ---
+TOOL_LATENCY = REGISTRY.histogram(
+    "tool_latency_seconds", "工具调用耗时", ("tool",), FAST_LATENCY_BUCKETS
+)
+TOOL_ERRORS = REGISTRY.counter("tool_errors_total", "工具调用异常次数", ("tool",))
+RETRIEVER_LATENCY = REGISTRY.histogram(
+    "retriever_latency_seconds", "知识库检索耗时", (), FAST_LATENCY_BUCKETS
+)
+# --- 缓存 ---
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "缓存访问次数 (命中率 = hit / (hit + miss))", ("cache", "result")
+)
+# --- 审计日志写入器 (抓取时读取) ---
+AUDIT_QUEUE_DEPTH = REGISTRY.gauge("audit_queue_depth", "审计日志写入队列长度")
+AUDIT_DROPPED = REGISTRY.gauge("audit_dropped", "审计日志因队列满被丢弃的累计条数")
+
+
+def cache_hit_rate(cache: str) -> float:
+    hits = CACHE_REQUESTS.value(cache=cache, result="hit")
+    misses = CACHE_REQUESTS.value(cache=cache, result="miss")
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+# ----------------------------------------------------------------------
+# 独立 /metrics 端口 (Streamlit / CLI 等没有 HTTP 服务的进程)
+# ----------------------------------------------------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求很频繁，不打印访问日志
+        pass
+
+
+def start_metrics_server(
+    port: int, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY
+) -> ThreadingHTTPServer:
+    """在后台线程启动 /metrics HTTP 端点，返回 server (调用 shutdown() 停止)"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"📈 Prometheus 指标端点: http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def timed_tool(func: Callable) -> Callable:
+    """
+    工具函数计时装饰器 (放在 @tool 之下)：记录耗时与异常次数，标签为函数名。
+    预路由直接调用 tool.invoke() 不经过回调，因此在工具层而非 Callback 中计时。
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            TOOL_ERRORS.inc(tool=func.__name__)
+            raise
+        finally:
+            TOOL_LATENCY.observe(time.perf_counter() - start, tool=func.__name__)
+
+    return wrapper
+
+
+def counted_cache(cache: str, cache_decorator: Callable[[Callable], Callable]) -> Callable:
+    """
+    为已有的缓存装饰器 (如 st.cache_data) 记录命中率：被缓存的函数体实际执行即为未命中。
+    缓存通常在调用线程中计算，用线程局部标记区分并发会话。
+    """
+    local = threading.local()
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            local.miss = True
+            return func(*args, **kwargs)
+
+        cached = cache_decorator(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            local.miss = False
+            result = cached(*args, **kwargs)
+            CACHE_REQUESTS.inc(cache=cache, result="miss" if local.miss else "hit")
+            return result
+
+        wrapper.clear = getattr(cached, "clear", None)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,43 @@
+# src/observability/spans.py
+"""
+手动 Span 上报
+
+span() 在回调钩子覆盖不到的代码段 (如 RAG 层的 Embedding 计算) 内记录子 Span，
+通过 LangChain 自定义回调事件 (SPAN_EVENT) 上报，由 src.agent.tracing.SpanRecorder 接收。
+放在 observability 层，使 rag 等底层模块无需依赖 agent 层。
+"""
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from langchain_core.callbacks import dispatch_custom_event
+
+SPAN_EVENT = "span"
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    在回调钩子覆盖不到的代码段 (如 Embedding 计算) 内记录子 Span。
+    通过自定义回调事件上报，挂到当前运行 (工具 / 检索) 之下；
+    不在 Runnable 上下文中时静默跳过。yield 的字典可追加属性。
+    """
+    start = time.perf_counter_ns()
+    status = "ok"
+    try:
+        yield attributes
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        payload = {
+            "name": name,
+            "start_ns": start,
+            "end_ns": time.perf_counter_ns(),
+            "status": status,
+            "attributes": attributes,
+        }
+        try:
+            dispatch_custom_event(SPAN_EVENT, payload)
+        except RuntimeError:
+            pass
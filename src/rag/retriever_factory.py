@@ -7,16 +7,36 @@ import logging
 from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.tools import tool, BaseTool
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
 
 from src.config import settings
+from src.observability.spans import span
+from src.observability.metrics import RETRIEVER_LATENCY, timed_tool
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 
+class TracedEmbeddings(Embeddings):
+    """
+    为查询向量化记录 embedding Span，
+    使瀑布图中检索耗时可以拆分为 Embedding 与 FAISS 检索两部分
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("embedding", chars=len(text)):
+            return self.embeddings.embed_query(text)
+
+
 class RAGRetrieverFactory:
     """
     RAG 检索器工厂类 (单例模式)
@@ -43,7 +63,9 @@ class RAGRetrieverFactory:
         }
 
         # 1. 初始化 Embedding (必须，无论是加载还是构建都需要)
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.config["embedding"])
+        self.embeddings = TracedEmbeddings(
+            HuggingFaceEmbeddings(model_name=self.config["embedding"])
+        )
 
         # 2. 获取向量库 (优先加载本地)
         self.vectorstore = self._get_vectorstore()
@@ -107,7 +129,8 @@ class RAGRetrieverFactory:
     def retrieve(self, query: str) -> str:
         """核心检索逻辑"""
         try:
-            docs = self.retriever.invoke(query)
+            with RETRIEVER_LATENCY.time():
+                docs = self.retriever.invoke(query)
             if not docs:
                 return "未在知识库中找到相关信息。"
             return "\n\n".join(doc.page_content for doc in docs)
@@ -119,7 +142,8 @@ class RAGRetrieverFactory:
 rag_retriever_factory = RAGRetrieverFactory()
 
 
-@tool
+@tool(settings.RETRIEVER_TOOL_NAME)
+@timed_tool
 def search_port_regulations(query: str) -> str:
     """
     查询宁波口岸的海关查验流程、H98指令含义、人工查验时效及应对策略等法规知识。
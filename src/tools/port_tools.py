@@ -5,6 +5,7 @@ from langchain_core.tools import tool
 from typing import Dict, Any, Union
 
 from src.config import settings
+from src.observability.metrics import timed_tool
 
 MOCK_FILENAME = "mock_api_data.json"
 
@@ -28,6 +29,7 @@ def _load_mock_data() -> Dict[str, Any]:
 
 
 @tool
+@timed_tool
 def get_container_status(container_id: str) -> Union[dict, str]:
     """
     根据集装箱号查询集装箱的在港状态。
@@ -53,6 +55,7 @@ def get_container_status(container_id: str) -> Union[dict, str]:
 
 
 @tool
+@timed_tool
 def get_customs_status(bill_of_lading: str) -> Union[dict, str]:
     """
     根据提单号查询货物的报关状态。
@@ -75,6 +78,7 @@ def get_customs_status(bill_of_lading: str) -> Union[dict, str]:
 
 
 @tool
+@timed_tool
 def get_vessel_schedule(vessel_name: str) -> Union[dict, str]:
     """
     根据船名查询船舶的预计靠泊时间和截关时间(CVT)。
@@ -14,10 +14,13 @@ sys.path.append(str(root_dir))
 
 from langchain_core.messages import AIMessage, HumanMessage
 from src.agent.agent_creator import create_port_agent
-from src.web.utils import load_css, typewriter_effect
+from src.agent.memory import ConversationMemory
+from src.config import settings
+from src.observability.metrics import start_metrics_server
+from src.web.utils import load_css
 from src.web.sidebar import render_sidebar
 from src.web.admin import render_admin_panel
-from src.web.callbacks import AgentMonitorCallback  # 导入回调
+from src.web.callbacks import AgentMonitorCallback, StreamlitTokenCallback
 from src.web.monitor import render_monitor_page
 from langchain_community.callbacks import StreamlitCallbackHandler
 
@@ -40,6 +43,7 @@ st.set_page_config(
 
 
 # --- 2. 资源初始化 ---
+# 执行器在所有会话间共享：current_time 等请求级上下文在每次 invoke 时注入
 @st.cache_resource
 def get_agent_engine():
     try:
@@ -49,22 +53,46 @@ def get_agent_engine():
         return None
 
 
+# Streamlit 每次交互都会重跑脚本，指标端点只在进程内启动一次
+@st.cache_resource
+def start_metrics_endpoint():
+    if settings.METRICS_PORT <= 0:
+        return None
+    try:
+        return start_metrics_server(settings.METRICS_PORT, settings.METRICS_HOST)
+    except OSError as e:
+        st.warning(f"⚠️ 指标端点启动失败 (端口 {settings.METRICS_PORT}): {e}")
+        return None
+
+
 # --- 3. 辅助函数：渲染监控面板 ---
 def render_monitor_metrics(metrics: dict):
     """渲染监控数据 (Token, 耗时, RAG来源)"""
     with st.expander("📊 诊断监控面板 (Trace & Metrics)", expanded=False):
         # 1. 基础指标
         c1, c2, c3, c4 = st.columns(4)
-        c1.metric("⏱️ 耗时", f"{metrics['latency']}s")
+        c1.metric(
+            "⏱️ 耗时",
+            f"{metrics['latency']}s",
+            help=f"首 Token 耗时: {metrics.get('ttft', '-')}s",
+        )
         c2.metric("📥 Input Tokens", metrics["tokens"]["input"])
         c3.metric("📤 Output Tokens", metrics["tokens"]["output"])
         c4.metric("∑ Total Tokens", metrics["tokens"]["total"])
 
+        if metrics.get("route") == "template":
+            st.caption("⚡ 纯状态查询，已由模板快速通道直接回答 (未调用 LLM)")
+        if metrics.get("llm_calls"):
+            c5, c6, c7 = st.columns(3)
+            c5.metric("🔁 LLM 调用次数", metrics["llm_calls"])
+            c6.metric("⚡ 预路由节省调用", metrics.get("llm_calls_saved", 0))
+            c7.metric("🗜️ 压缩节省 Tokens", metrics.get("tokens_saved", 0))
+
         # 2. RAG 召回内容
         st.markdown("#### 📖 RAG 知识库召回")
-        if metrics["rag_docs"]:
-            for i, doc in enumerate(metrics["rag_docs"]):
-                st.info(f"**Source {i+1}**: {doc.page_content}")
+        if metrics["rag_sources"]:
+            for i, text in enumerate(metrics["rag_sources"]):
+                st.info(f"**Source {i+1}**: {text}")
         else:
             st.caption("本次回答未使用 RAG 检索或未命中知识库。")
 
@@ -87,6 +115,10 @@ def render_chat_view(agent_executor):
                 "metrics": None,
             }
         ]
+    # 会话记忆：滑动窗口 + 滚动摘要 + 实体表，随每次调用注入 Prompt
+    if "memory" not in st.session_state:
+        st.session_state.memory = ConversationMemory.from_settings()
+    memory = st.session_state.memory
 
     # 渲染历史
     for msg in st.session_state.chat_history:
@@ -116,29 +148,39 @@ def render_chat_view(agent_executor):
                 # 创建状态容器
                 with st.status("🔍 小宁正在分析...", expanded=True) as status_container:
 
-                    # 2. 初始化 Streamlit 专用回调，指定父容器为 status_container
-                    # 这样中间步骤就会打印在“分析完成”这个折叠框里
-                    st_callback = StreamlitCallbackHandler(
-                        parent_container=status_container
-                    )
-
                     # 初始化原本的监控回调 (用于后台记录数据)
                     monitor_callback = AgentMonitorCallback()
+                    # 最终答案的 Token 实时写入消息占位符
+                    token_callback = StreamlitTokenCallback(msg_placeholder)
+                    callbacks = [monitor_callback, token_callback]
+
+                    # 2. 渲染思考过程 (Streamlit 专用回调，指定父容器为 status_container)
+                    # 这样中间步骤就会打印在“分析完成”这个折叠框里；
+                    # 由 WEB_SHOW_THINKING 控制，与监控埋点的抽样无关，避免面板随机出现 / 消失
+                    if settings.WEB_SHOW_THINKING:
+                        callbacks.append(
+                            StreamlitCallbackHandler(parent_container=status_container)
+                        )
 
                     try:
-                        # 3. 执行 Agent，同时传入两个回调：
-                        # st_callback 用于前端展示思考过程
+                        # 3. 执行 Agent，同时传入回调：
                         # monitor_callback 用于后台统计 Token 和日志
+                        # token_callback 用于流式输出最终答案
+                        # StreamlitCallbackHandler (可选) 用于前端展示思考过程
                         response = agent_executor.invoke(
-                            {"input": prompt},
-                            config={"callbacks": [monitor_callback, st_callback]},
+                            {"input": prompt, **memory.load_variables()},
+                            config={"callbacks": callbacks},
                         )
 
                         result_text = response["output"]
 
                         # 更新状态栏为完成
                         status_container.update(
-                            label="✅ 分析完成 (点击查看思考过程)",
+                            label=(
+                                "✅ 分析完成 (点击查看思考过程)"
+                                if settings.WEB_SHOW_THINKING
+                                else "✅ 分析完成"
+                            ),
                             state="complete",
                             expanded=False,
                         )
@@ -150,15 +192,21 @@ def render_chat_view(agent_executor):
 
                 # --- 修改结束 ---
 
-                # 打字机输出最终结果
-                msg_placeholder.write_stream(typewriter_effect(result_text))
+                # 流式输出结束 (或模型不支持流式)，渲染完整结果
+                msg_placeholder.markdown(result_text)
+                memory.add_turn(prompt, result_text)
 
                 # 整理监控数据
                 metrics_data = {
                     "latency": monitor_callback.latency,
+                    "ttft": monitor_callback.ttft,
                     "tokens": monitor_callback.token_usage,
-                    "rag_docs": monitor_callback.rag_documents,
+                    "rag_sources": monitor_callback.rag_sources,
                     "tool_calls": monitor_callback.tool_calls,
+                    "llm_calls": monitor_callback.llm_calls,
+                    "llm_calls_saved": monitor_callback.llm_calls_saved,
+                    "tokens_saved": monitor_callback.tokens_saved,
+                    "route": monitor_callback.route,
                 }
 
                 # 显示本次监控面板
@@ -180,6 +228,7 @@ def render_chat_view(agent_executor):
 # --- 5. 主入口 ---
 def main():
     load_css()
+    start_metrics_endpoint()
     current_page = render_sidebar()
 
     if current_page == "💬 智能对话":
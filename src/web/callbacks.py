@@ -1,82 +1,192 @@
 # src/web/callbacks.py
+import random
 import time
-from typing import Any, Dict, List
-from langchain_core.callbacks import BaseCallbackHandler
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
 from langchain_core.outputs import LLMResult
 from langchain_core.documents import Document
-from src.database.repository import ChatLogRepository
+from src.config import settings
+from src.database.audit_writer import write_audit_log
+from src.agent.streaming import TokenStreamHandler
+from src.agent.scratchpad import COMPACTION_EVENT
+from src.agent.fast_path import ROUTE_AGENT, ROUTE_TEMPLATE
+from src.agent.tracing import SpanRecorder
+from src.observability import metrics
 
+MONITOR_LEVELS = ("off", "metrics", "full")
+# 单次请求保留的数据上限：只保存截断后的字符串，不持有 Document / 完整工具输出
+MAX_TOOL_STEPS = 50
+TOOL_RESULT_CHARS = 500
+MAX_RAG_SOURCES = 20
+RAG_SNIPPET_CHARS = 200
 
-class AgentMonitorCallback(BaseCallbackHandler):
+
+class AgentMonitorCallback(SpanRecorder):
     """
     监控 Agent 运行指标并持久化到 SQLite
+    继承 SpanRecorder：同时记录 LLM / 工具 / 检索的层级 Span，随日志一并保存
+
+    埋点级别 (MONITOR_LEVEL)：
+    - off:     只计算耗时，LangChain 不再分发 LLM / 工具 / 检索事件到本回调
+    - metrics: Token / LLM 调用次数等摘要写入审计日志与 Prometheus 指标，不记录 Span 与大字段
+    - full:    完整链路追踪；按 sample_rate 抽样，未抽中的请求按 metrics 级别处理
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        session_id: Optional[str] = None,
+        level: Optional[str] = None,
+        sample_rate: Optional[float] = None,
+    ):
+        super().__init__()
+        self.session_id = session_id
+        level = level or settings.MONITOR_LEVEL
+        if level not in MONITOR_LEVELS:
+            raise ValueError(f"未知的监控级别: {level} (可选 {MONITOR_LEVELS})")
+        if sample_rate is None:
+            sample_rate = settings.MONITOR_TRACE_SAMPLE_RATE
+        # 每个请求一个实例，创建时决定是否抽中完整追踪
+        if level == "full" and random.random() >= sample_rate:
+            level = "metrics"
+        self.level = level
+        self.tracing = level == "full"
         self.start_time = 0.0
         self.end_time = 0.0
-        self.rag_documents: List[Document] = []
+        # RAG 召回片段 (已截断的文本)
+        self.rag_sources: List[str] = []
         # 初始化为 0，确保能够进行累加
         self.token_usage = {"input": 0, "output": 0, "total": 0}
         self.tool_calls = []
         self.user_input = ""
         self.error_message = None
+        # LLM 调用次数 & 预路由统计 (用于计算节省的 LLM 调用)
+        self.llm_calls = 0
+        self.prefetch_stats: Dict[str, Any] = {}
+        # 执行路径：template (模板快速通道) / agent (LLM Agent)
+        self.route: Optional[str] = None
+        # 实际应答的模型 (最后一轮 LLM 调用；对冲 / 故障转移时为实际胜出的供应商)
+        self.model_name: Optional[str] = None
+        # 首 Token 时间：记录每轮 LLM 的首个 Token，最终取最后一轮 (即答案轮)
+        self._last_llm_run_id: Optional[UUID] = None
+        self._first_token_times: Dict[UUID, float] = {}
+        # Scratchpad 压缩统计：只累计次数与节省的 Token
+        self.compactions = 0
+        self._tokens_saved = 0
+
+    # off 级别跳过 LLM / 工具 / 检索 / 自定义事件的分发；metrics 级别不需要检索事件
+    @property
+    def ignore_llm(self) -> bool:
+        return self.level == "off"
+
+    @property
+    def ignore_agent(self) -> bool:
+        return self.level == "off"
+
+    @property
+    def ignore_custom_event(self) -> bool:
+        return self.level == "off"
+
+    @property
+    def ignore_retriever(self) -> bool:
+        return not self.tracing
 
     def on_chain_start(
         self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any
     ) -> None:
+        if self.tracing:
+            super().on_chain_start(serialized, inputs, **kwargs)
         if not self.start_time:
             self.start_time = time.time()
             if isinstance(inputs, dict):
                 self.user_input = inputs.get("input", str(inputs))
+                self.prefetch_stats = inputs.get("prefetch_stats") or {}
             else:
                 self.user_input = str(inputs)
 
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    ) -> None:
+        if self.tracing:
+            super().on_llm_start(serialized, prompts, **kwargs)
+        self.llm_calls += 1
+        self._last_llm_run_id = kwargs.get("run_id")
+        params = kwargs.get("invocation_params") or {}
+        self.model_name = params.get("model_name") or params.get("model") or self.model_name
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if token and run_id not in self._first_token_times:
+            self._first_token_times[run_id] = time.time()
+
+    def on_custom_event(
+        self, name: str, data: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if self.tracing:
+            super().on_custom_event(name, data, run_id=run_id, **kwargs)
+        if name == COMPACTION_EVENT:
+            self.compactions += 1
+            self._tokens_saved += data.get("saved_tokens", 0)
+
     def on_retriever_end(self, documents: List[Document], **kwargs: Any) -> None:
-        self.rag_documents.extend(documents)
+        super().on_retriever_end(documents, **kwargs)
+        room = MAX_RAG_SOURCES - len(self.rag_sources)
+        self.rag_sources.extend(doc.page_content[:RAG_SNIPPET_CHARS] for doc in documents[:room])
+
+    def on_tool_start(
+        self, serialized: Dict[str, Any], input_str: str, **kwargs: Any
+    ) -> None:
+        if self.tracing:
+            super().on_tool_start(serialized, input_str, **kwargs)
 
     def on_tool_end(self, output: str, name: str, **kwargs: Any) -> None:
-        self.tool_calls.append(
-            {
-                "tool": name,
-                "result": str(output)[:500],
-                "timestamp": time.strftime("%H:%M:%S"),
-            }
-        )
+        if len(self.tool_calls) >= MAX_TOOL_STEPS:
+            return
+        step = {
+            "tool": name,
+            "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3],
+        }
+        if self.tracing:
+            super().on_tool_end(output, **kwargs)
+            step["result"] = str(output)[:TOOL_RESULT_CHARS]
+            record = self._span_by_run.get(kwargs.get("run_id")) or {}
+            if record.get("end_ns") is not None:
+                step["duration_ms"] = round((record["end_ns"] - record["start_ns"]) / 1e6, 3)
+        self.tool_calls.append(step)
+
+    def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        if self.tracing:
+            super().on_tool_error(error, **kwargs)
 
     def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
         """
-        核心修复：解析并累加 Token。
+        解析并累加 Token，同时取实际应答的模型名 (一次遍历)。
         Agent 可能多次调用 LLM，必须累加每一轮的消耗。
         """
-        print(f"DEBUG: response.llm_output = {response.llm_output}")
-
-        # 1. 尝试从标准化 metadata 获取 (LangChain 0.2.2+ 推荐)
-        # 这是目前最稳妥的方法
-        if response.generations:
-            for gen_list in response.generations:
-                for gen in gen_list:
-                    # 检查是否存在标准化的 usage_metadata
-                    if hasattr(gen, "message") and hasattr(
-                        gen.message, "usage_metadata"
-                    ):
-                        if gen.message.usage_metadata:
-                            self._update_usage(gen.message.usage_metadata)
-                            continue  # 如果拿到了就跳过当前 gen 的后续检查
-
-                    # 2. 备选：尝试从 generation_info 获取
-                    if gen.generation_info and (
-                        "token_usage" in gen.generation_info
-                        or "usage" in gen.generation_info
-                    ):
-                        usage = gen.generation_info.get(
-                            "token_usage"
-                        ) or gen.generation_info.get("usage")
-                        self._update_usage(usage)
-
-        # 3. 备选：从全局 llm_output 获取 (部分旧版适配器)
-        if response.llm_output and "token_usage" in response.llm_output:
-            self._update_usage(response.llm_output["token_usage"])
+        if self.tracing:
+            super().on_llm_end(response, **kwargs)
+
+        found_usage = False
+        for gen_list in response.generations:
+            for gen in gen_list:
+                message = getattr(gen, "message", None)
+                # 优先使用响应元数据中的模型名 (实际应答方)，其次是供应商名
+                metadata = getattr(message, "response_metadata", None)
+                if metadata:
+                    name = metadata.get("model_name") or metadata.get("model") or metadata.get("provider")
+                    if name:
+                        self.model_name = name
+                # 1. 标准化 usage_metadata (LangChain 0.2.2+)；2. 备选 generation_info
+                usage = getattr(message, "usage_metadata", None)
+                if not usage and gen.generation_info:
+                    usage = gen.generation_info.get("token_usage") or gen.generation_info.get("usage")
+                if usage:
+                    self._update_usage(usage)
+                    found_usage = True
+
+        # 3. 备选：全局 llm_output (部分旧版适配器)。
+        # 与逐条用量是同一份数据，两者都有时只取前者，避免重复累加
+        if not found_usage and response.llm_output:
+            self._update_usage(response.llm_output.get("token_usage"))
 
     def _update_usage(self, usage: dict):
         """解析不同的字段名并执行累加"""
@@ -104,31 +214,119 @@ class AgentMonitorCallback(BaseCallbackHandler):
         self.token_usage["total"] += input_tokens + output_tokens
 
     def on_chain_error(self, error: BaseException, **kwargs: Any) -> None:
+        if self.tracing:
+            super().on_chain_error(error, **kwargs)
         self.error_message = str(error)
 
-    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any) -> None:
-        # 只在最外层 Chain 结束时记录时间（避免被子 Chain 重置）
-        if "output" in outputs:
+    def on_chain_end(
+        self,
+        outputs: Dict[str, Any],
+        *,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        if self.tracing:
+            super().on_chain_end(outputs, **kwargs)
+        # 只在最外层 Chain 结束时记录（Plan 模式回退时内层 ReAct 执行器同样输出 output）
+        if parent_run_id is None and "output" in outputs:
             self.end_time = time.time()
-            final_output = outputs.get("output", "")
-            rag_texts = [doc.page_content[:200] for doc in self.rag_documents]
+            # 只有模板实际作答时输出才带 route，其余均为 LLM Agent
+            self.route = outputs.get("route") or ROUTE_AGENT
+            if self.level == "off":
+                return
+            self._record_metrics()
 
             try:
-                ChatLogRepository.save_log(
-                    user_input=self.user_input,
-                    ai_output=final_output,
-                    latency=self.latency,
-                    token_usage=self.token_usage,
-                    intermediate_steps=self.tool_calls,
-                    rag_sources=rag_texts,
-                    status="error" if self.error_message else "success",
-                    error_msg=self.error_message,
+                # 异步批量写入：请求路径上只入队，不等待 SQLite 提交
+                write_audit_log(
+                    dict(
+                        session_id=self.session_id,
+                        user_input=self.user_input,
+                        ai_output=outputs.get("output", ""),
+                        latency=self.latency,
+                        token_usage=dict(self.token_usage),
+                        intermediate_steps=self.tool_calls,
+                        rag_sources=self.rag_sources,
+                        status="error" if self.error_message else "success",
+                        error_msg=self.error_message,
+                        llm_calls=self.llm_calls,
+                        llm_calls_saved=self.llm_calls_saved,
+                        ttft=self.ttft,
+                        tokens_saved=self.tokens_saved,
+                        spans=self.trace() if self.tracing else None,
+                        route=self.route,
+                        model_name=(self.model_name or "")[:50] or None,
+                        timestamp=datetime.now(),
+                    )
                 )
             except Exception as e:
                 print(f"❌ 日志保存失败: {e}")
 
+    def _record_metrics(self) -> None:
+        """请求级指标写入进程内注册表 (Prometheus /metrics)"""
+        route = self.route
+        status = "error" if self.error_message else "success"
+        metrics.REQUESTS.inc(route=route, status=status)
+        metrics.REQUEST_LATENCY.observe(self.end_time - self.start_time, route=route)
+        metrics.LLM_CALLS_PER_REQUEST.observe(self.llm_calls)
+        metrics.TOKENS.inc(self.token_usage["input"], type="input")
+        metrics.TOKENS.inc(self.token_usage["output"], type="output")
+        metrics.TOKENS_PER_REQUEST.observe(self.token_usage["total"])
+
+    @property
+    def llm_calls_saved(self) -> int:
+        """
+        预路由节省的 LLM 调用次数：
+        预取覆盖的工具轮次 - Agent 实际仍然发起的工具轮次 (LLM 调用数 - 1 次最终回答)
+        模板快速通道连最终回答的 LLM 调用也省去了
+        """
+        stages = self.prefetch_stats.get("stages", 0)
+        if self.route == ROUTE_TEMPLATE:
+            return stages + 1
+        if not stages or not self.llm_calls:
+            return 0
+        return max(0, stages - (self.llm_calls - 1))
+
+    @property
+    def tokens_saved(self) -> int:
+        """Scratchpad 压缩在所有 LLM 调用中累计节省的输入 Token (估算)"""
+        return self._tokens_saved
+
+    @property
+    def ttft(self) -> float:
+        """
+        首 Token 耗时 (秒)：从请求开始到最终回答的第一个 Token。
+        非流式模型没有 Token 事件，此时等于总耗时。
+        """
+        first_token_time = self._first_token_times.get(self._last_llm_run_id)
+        if first_token_time:
+            return round(first_token_time - self.start_time, 2)
+        return self.latency
+
     @property
     def latency(self) -> float:
         if self.end_time > 0:
             return round(self.end_time - self.start_time, 2)
         return 0.0
+
+
+class StreamlitTokenCallback(TokenStreamHandler):
+    """
+    将最终答案的 Token 实时写入 Streamlit 占位符。
+    Streamlit 每次更新都会向前端推送消息，因此按时间间隔节流刷新。
+    """
+
+    def __init__(self, placeholder, refresh_interval: float = 0.05):
+        super().__init__()
+        self.placeholder = placeholder
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+
+    def on_text(self, token: str) -> None:
+        now = time.monotonic()
+        if now - self._last_refresh >= self.refresh_interval:
+            self.placeholder.markdown(self.text + "▌")
+            self._last_refresh = now
+
+    def on_discard(self, text: str) -> None:
+        self.placeholder.empty()
@@ -1,8 +1,407 @@
 # src/web/monitor.py
 import streamlit as st
 import pandas as pd
+import altair as alt
 import time
-from src.database.repository import ChatLogRepository
+from datetime import datetime, timedelta
+from src.database.repository import (
+    AnalyticsRepository,
+    ChatLogRepository,
+    MetricsRollupRepository,
+)
+from src.database.rollup import summarize, window_start
+from src.database.archive import list_partitions, read_archive, run_retention
+from src.config import settings
+from src.agent.tracing import span_depths, to_otlp_json
+from src.observability.metrics import counted_cache
+
+
+def render_span_waterfall(trace: dict):
+    """按 Span 起止时间绘制瀑布图 (层级缩进，颜色区分类型)"""
+    spans = (trace or {}).get("spans") or []
+    if not spans:
+        st.caption("无链路追踪记录")
+        return
+    depths = span_depths(spans)
+    rows = []
+    for order, item in enumerate(sorted(spans, key=lambda s: s["start_ns"])):
+        rows.append(
+            {
+                "order": order,
+                "label": f"{order:02d} " + "　" * depths[item["span_id"]] + item["name"],
+                "kind": item["kind"],
+                "start_ms": item["start_ns"] / 1e6,
+                "end_ms": item["end_ns"] / 1e6,
+                "duration_ms": item.get("duration_ms", 0),
+                "self_ms": item.get("self_ms", 0),
+                "status": item.get("status", "ok"),
+                "attributes": str(item.get("attributes", {})),
+            }
+        )
+    df = pd.DataFrame(rows)
+    chart = (
+        alt.Chart(df)
+        .mark_bar(cornerRadius=2)
+        .encode(
+            x=alt.X("start_ms:Q", title="相对请求开始 (ms)"),
+            x2="end_ms:Q",
+            y=alt.Y("label:N", sort=alt.SortField("order"), title=None),
+            color=alt.Color("kind:N", title="类型"),
+            tooltip=[
+                "label",
+                "kind",
+                alt.Tooltip("duration_ms:Q", format=".1f", title="耗时(ms)"),
+                alt.Tooltip("self_ms:Q", format=".1f", title="自身耗时(ms)"),
+                "status",
+                "attributes",
+            ],
+        )
+        .properties(height=max(120, 24 * len(df)))
+    )
+    st.altair_chart(chart, use_container_width=True)
+    if trace.get("dropped_spans"):
+        st.caption(f"⚠️ 超出上限未记录的 Span: {trace['dropped_spans']}")
+
+
+# 监控页数据缓存：以日志版本号 (ChatLogRepository.log_version) 为键，
+# 没有新日志时，切换选项等交互触发的重跑直接复用查询结果；
+# 版本号只能感知其他进程新增的日志，TTL 兜底其他进程的删除 / 归档；命中率计入 /metrics
+DASHBOARD_CACHE_TTL = 600
+dashboard_cache = counted_cache(
+    "dashboard",
+    st.cache_data(ttl=DASHBOARD_CACHE_TTL, max_entries=64, show_spinner=False),
+)
+
+
+# KPI 时间范围 -> (天数, 趋势图粒度)
+KPI_RANGES = {
+    "最近 24 小时": (1, "hour"),
+    "最近 7 天": (7, "hour"),
+    "最近 30 天": (30, "day"),
+    "全部": (None, "day"),
+}
+
+
+@dashboard_cache
+def load_rollups(version, granularity: str, since):
+    rows = MetricsRollupRepository.get_rollups(granularity, since=since)
+    return rows, summarize(rows)
+
+
+def render_rollup_kpis(version):
+    """基于小时 / 天预聚合表渲染 KPI 与趋势 (不加载日志明细)，返回所选 (起始桶, 粒度)"""
+    label = st.radio("统计范围", list(KPI_RANGES), index=1, horizontal=True, key="kpi_range")
+    days, granularity = KPI_RANGES[label]
+    # 起始时间按桶对齐，同一小时 / 天内的重跑命中同一缓存
+    since = window_start(days, granularity)
+    rows, kpi = load_rollups(version, granularity, since)
+
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    col1.metric("总调用次数", f"{kpi['count']:,}")
+    col2.metric("平均响应耗时", f"{kpi['avg_latency']:.2f} s")
+    col3.metric("P95 耗时", f"{kpi['p95_latency']:.2f} s", help="由耗时直方图估算")
+    col4.metric("总 Token 消耗", f"{kpi['total_tokens']:,}")
+    col5.metric("错误率", f"{kpi['error_rate']:.1f}%")
+    col6.metric("模板通道命中率", f"{kpi['template_rate']:.1f}%", help="无需 LLM 的纯状态查询占比")
+
+    if rows:
+        trend = pd.DataFrame(
+            {
+                "时间": [r["bucket"] for r in rows],
+                "调用次数": [r["count"] for r in rows],
+                "错误数": [r["error_count"] for r in rows],
+                "平均耗时(s)": [r["latency_sum"] / r["count"] if r["count"] else 0 for r in rows],
+                "Total Tokens": [r["total_tokens"] for r in rows],
+            }
+        ).set_index("时间")
+        c_calls, c_latency = st.columns(2)
+        with c_calls:
+            st.caption(f"调用量趋势 (按{'小时' if granularity == 'hour' else '天'})")
+            st.bar_chart(trend[["调用次数", "错误数"]])
+        with c_latency:
+            st.caption("平均耗时趋势")
+            st.line_chart(trend[["平均耗时(s)"]])
+    return since, granularity
+
+
+DISTRIBUTION_METRICS = {
+    "请求耗时 (s)": "latency",
+    "单次 Token": "tokens",
+    "单次 LLM 调用数": "llm_calls",
+}
+
+
+@dashboard_cache
+def load_log_distributions(version, since, granularity: str, by_model: bool):
+    return AnalyticsRepository.log_distributions(since, granularity, by_model)
+
+
+@dashboard_cache
+def load_provider_latency(version, since, granularity: str):
+    return AnalyticsRepository.provider_latency(since, granularity)
+
+
+def _percentile_chart(rows: list, metric: str, title: str):
+    """p50/p90/p99 时间序列：颜色区分分组，线型区分分位"""
+    data = pd.DataFrame(
+        [
+            {"时间": r["bucket"], "分组": r["group"], "分位": f"p{p}", "值": r[f"{metric}_p{p}"]}
+            for r in rows
+            for p in (50, 90, 99)
+        ]
+    )
+    chart = (
+        alt.Chart(data)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("时间:T", title=None),
+            y=alt.Y("值:Q", title=title),
+            color=alt.Color("分组:N", title="模型 / 供应商"),
+            strokeDash=alt.StrokeDash("分位:N", title="分位"),
+            tooltip=["时间:T", "分组:N", "分位:N", alt.Tooltip("值:Q", format=".2f")],
+        )
+        .properties(height=260)
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+
+def render_latency_analytics(version, since, granularity: str):
+    """尾延迟与成本分布 (SQL 窗口函数计算分位数)"""
+    st.subheader("📈 尾延迟与成本分布")
+    c_metric, c_group = st.columns([2, 1])
+    with c_metric:
+        label = st.radio("指标", list(DISTRIBUTION_METRICS), horizontal=True, key="dist_metric")
+    with c_group:
+        by_model = st.toggle("按模型拆分", value=True, key="dist_by_model")
+    metric = DISTRIBUTION_METRICS[label]
+
+    rows = load_log_distributions(version, since, granularity, by_model)
+    if not rows:
+        st.caption("所选范围内暂无数据。")
+        return
+    _percentile_chart(rows, metric, label)
+
+    # 各分组在整个范围内最近一个时间桶的分位数一览
+    latest = {}
+    for r in rows:
+        latest[r["group"]] = r
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {
+                    "模型": g,
+                    "调用次数": r["count"],
+                    "p50": r[f"{metric}_p50"],
+                    "p90": r[f"{metric}_p90"],
+                    "p99": r[f"{metric}_p99"],
+                    "均值": r[f"{metric}_avg"],
+                    "错误率(%)": r["error_rate"],
+                }
+                for g, r in latest.items()
+            ]
+        ),
+        use_container_width=True,
+        hide_index=True,
+    )
+    st.caption("表格为各模型最近一个时间桶的分布。")
+
+    provider_rows = load_provider_latency(version, since, granularity)
+    if provider_rows:
+        st.caption("底层 LLM 单次调用耗时 (按供应商，含对冲 / 故障转移请求)")
+        _percentile_chart(provider_rows, "latency", "单次调用耗时 (s)")
+
+
+STATUS_OPTIONS = {"全部": None, "✅ 成功": "success", "❌ 失败": "error"}
+
+
+def render_log_filters() -> dict:
+    """日志列表过滤条件；条件变化时回到第一页"""
+    c_status, c_dates, c_latency, c_size = st.columns([1, 2, 1, 1])
+    with c_status:
+        status = STATUS_OPTIONS[st.selectbox("状态", list(STATUS_OPTIONS), key="log_status")]
+    with c_dates:
+        dates = st.date_input("日期范围", value=(), key="log_dates")
+    with c_latency:
+        min_latency = st.number_input("最小耗时(s)", min_value=0.0, value=0.0, step=0.5, key="log_min_latency")
+    with c_size:
+        page_size = st.selectbox("每页条数", [20, 50, 100], index=1, key="log_page_size")
+
+    since = until = None
+    if len(dates) >= 1:
+        since = datetime.combine(dates[0], datetime.min.time())
+        # 结束日期包含当天
+        until = datetime.combine(dates[-1], datetime.min.time()) + timedelta(days=1)
+    filters = {
+        "status": status,
+        "since": since,
+        "until": until,
+        "min_latency": min_latency or None,
+        "limit": page_size,
+    }
+    if st.session_state.get("log_filters") != filters:
+        st.session_state["log_filters"] = filters
+        # 每一页的起始游标，第一页为 None
+        st.session_state["log_cursors"] = [None]
+    return filters
+
+
+@dashboard_cache
+def load_log_page(version, filters: dict, cursor):
+    """一页日志摘要转为表格，返回 (DataFrame, 下一页游标)"""
+    logs, next_cursor = ChatLogRepository.list_logs(cursor=cursor, **filters)
+    df = pd.DataFrame(
+        [
+            {
+                "ID": log["id"],
+                "时间": log["timestamp"],
+                "用户提问": log["user_input"],
+                "耗时(s)": log["latency"],
+                "Total Tokens": log["total_tokens"],
+                "LLM调用": log["llm_calls"] or 0,
+                "节省调用": log["llm_calls_saved"] or 0,
+                "压缩节省Token": log["tokens_saved"] or 0,
+                "路径": log["route"] or "-",
+                "状态": "✅" if log["status"] == "success" else "❌",
+            }
+            for log in logs
+        ]
+    )
+    return df, next_cursor
+
+
+@dashboard_cache
+def load_otlp_export(version, log_ids: tuple) -> str:
+    return to_otlp_json(ChatLogRepository.get_spans(list(log_ids)))
+
+
+def render_otlp_export(version, log_ids: tuple):
+    """本页链路追踪导出：点击生成后才读取 spans 并序列化，不在每次渲染时构建"""
+    export_key = (version, log_ids)
+    export = st.session_state.get("otlp_export")
+    if export and export[0] == export_key:
+        st.download_button(
+            "📥 导出本页链路追踪 (OTLP JSON)",
+            data=export[1],
+            file_name="traces.otlp.json",
+            mime="application/json",
+            key="btn_otlp_all",
+        )
+    elif st.button("📦 生成本页链路追踪导出", key="btn_otlp_build"):
+        st.session_state["otlp_export"] = (export_key, load_otlp_export(version, log_ids))
+        st.rerun()
+
+
+def render_page_controls(next_cursor):
+    cursors = st.session_state["log_cursors"]
+    c_prev, c_page, c_next = st.columns([1, 3, 1])
+    with c_prev:
+        if st.button("⬅️ 上一页", disabled=len(cursors) <= 1, key="btn_log_prev"):
+            cursors.pop()
+            st.rerun()
+    with c_page:
+        st.caption(f"第 {len(cursors)} 页")
+    with c_next:
+        if st.button("下一页 ➡️", disabled=next_cursor is None, key="btn_log_next"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+
+ARCHIVE_COLUMNS = ["timestamp", "user_input", "latency", "total_tokens", "route", "status"]
+
+
+@dashboard_cache
+def load_partitions(version):
+    return list_partitions()
+
+
+@dashboard_cache
+def load_archive(version, since, until):
+    return read_archive(since, until, columns=ARCHIVE_COLUMNS)
+
+
+def render_archive_view(version):
+    """查询 Parquet 归档中的历史日志 (按日期分区裁剪，只读取摘要列)"""
+    partitions = load_partitions(version)
+    if not partitions:
+        st.caption(f"暂无归档数据 (超过 {settings.LOG_RETENTION_DAYS} 天的日志会被归档)。")
+        return
+    total = sum(p["bytes"] for p in partitions)
+    st.caption(
+        f"共 {len(partitions)} 个日期分区 ({partitions[0]['date']} ~ {partitions[-1]['date']}), "
+        f"{total / 1024 / 1024:.2f} MB"
+    )
+    first = datetime.fromisoformat(partitions[0]["date"]).date()
+    last = datetime.fromisoformat(partitions[-1]["date"]).date()
+    dates = st.date_input(
+        "归档日期范围", value=(max(first, last - timedelta(days=6)), last),
+        min_value=first, max_value=last, key="archive_dates",
+    )
+    if not st.toggle("加载归档数据", key="archive_load"):
+        return
+
+    df = load_archive(version, dates[0], dates[-1])
+    if df.empty:
+        st.info("📭 所选日期没有归档日志。")
+        return
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("归档调用次数", f"{len(df):,}")
+    c2.metric("平均响应耗时", f"{df['latency'].mean():.2f} s")
+    c3.metric("P95 耗时", f"{df['latency'].quantile(0.95):.2f} s")
+    c4.metric("错误率", f"{(df['status'] == 'error').mean() * 100:.1f}%")
+    st.dataframe(
+        df.sort_values("timestamp", ascending=False),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
+SEARCH_PAGE_SIZE = 10
+
+
+@dashboard_cache
+def load_search(version, query: str, offset: int):
+    return ChatLogRepository.search_logs(query, limit=SEARCH_PAGE_SIZE, offset=offset)
+
+
+def render_log_search(version):
+    """全文检索提问 / 回答 (FTS5)，按相关度排序分页"""
+    query = st.text_input(
+        "🔎 全文检索",
+        placeholder="提单号 / 箱号 / 海关指令，如 BILL002 H98 (空格分隔表示同时包含)",
+        key="log_search",
+    ).strip()
+    if not query:
+        return
+    if st.session_state.get("log_search_query") != query:
+        st.session_state["log_search_query"] = query
+        st.session_state["log_search_page"] = 0
+
+    page = st.session_state["log_search_page"]
+    results, total = load_search(version, query, page * SEARCH_PAGE_SIZE)
+    if not total:
+        st.info("📭 没有匹配的日志。")
+        return
+
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    st.caption(f"共 {total} 条匹配，第 {page + 1}/{pages} 页 (按相关度排序)")
+    for row in results:
+        status = "✅" if row["status"] == "success" else "❌"
+        with st.container(border=True):
+            st.markdown(
+                f"{status} **Log #{row['id']}** · {row['timestamp']:%m-%d %H:%M} · "
+                f"{row['latency'] or 0:.2f}s · {row['user_input'][:80]}"
+            )
+            st.caption(row["snippet"] or "")
+
+    c_prev, _, c_next = st.columns([1, 3, 1])
+    with c_prev:
+        if st.button("⬅️ 上一页", disabled=page == 0, key="btn_search_prev"):
+            st.session_state["log_search_page"] -= 1
+            st.rerun()
+    with c_next:
+        if st.button("下一页 ➡️", disabled=page + 1 >= pages, key="btn_search_next"):
+            st.session_state["log_search_page"] += 1
+            st.rerun()
 
 
 def render_monitor_page():
@@ -34,49 +433,38 @@ def render_monitor_page():
                 else:
                     st.error("清空失败，请检查后台日志。")
 
+        st.markdown(
+            f"**归档旧日志：** 把 {settings.LOG_RETENTION_DAYS} 天前的日志移入 Parquet 归档 "
+            "(按日期分区压缩存储，可在下方历史归档中查询)。"
+        )
+        if st.button("📦 立即归档", key="btn_archive_logs"):
+            with st.spinner("正在归档..."):
+                stats = run_retention()
+            st.toast(f"✅ 已归档 {stats['archived']} 条日志", icon="📦")
+
     st.caption("实时监控 Agent 的对话历史、Token 消耗及工具调用链路。")
 
-    # 1. 数据获取
-    logs = ChatLogRepository.get_recent_logs(limit=100)
+    # 每次重跑只查询一次版本号，下方各区块的数据按版本号缓存
+    version = ChatLogRepository.log_version()
 
-    if not logs:
-        st.info("📭 暂无审计日志数据。")
-        # 如果没有数据，直接返回，不再渲染下面的图表
-        return
+    # 1. 顶部关键指标 (KPIs)：读取预聚合表，统计范围不受明细条数限制
+    since, granularity = render_rollup_kpis(version)
+    render_latency_analytics(version, since, granularity)
 
-    # 2. 转换数据为 DataFrame 用于统计
-    data = []
-    for log in logs:
-        data.append(
-            {
-                "ID": log.id,
-                "时间": log.timestamp,
-                "用户提问": log.user_input,
-                "耗时(s)": log.latency,
-                "Total Tokens": log.total_tokens,
-                "状态": "✅" if log.status == "success" else "❌",
-            }
-        )
-    df = pd.DataFrame(data)
-
-    # 3. 顶部关键指标 (KPIs)
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.metric("总调用次数", len(df))
-    with col2:
-        avg_latency = df["耗时(s)"].mean()
-        st.metric("平均响应耗时", f"{avg_latency:.2f} s")
-    with col3:
-        total_cost = df["Total Tokens"].sum()
-        st.metric("总 Token 消耗", f"{total_cost:,}")
-    with col4:
-        error_rate = len(df[df["状态"] == "❌"]) / len(df) * 100 if len(df) > 0 else 0
-        st.metric("错误率", f"{error_rate:.1f}%")
+    with st.expander("🗄️ 历史归档 (Archive)", expanded=False):
+        render_archive_view(version)
 
     st.markdown("---")
 
-    # 4. 详细日志表格视图
+    # 2. 详细日志表格视图：服务端过滤 + 键集分页，只读取摘要列
     st.subheader("📜 调用流水日志")
+    render_log_search(version)
+    filters = render_log_filters()
+    df, next_cursor = load_log_page(version, filters, st.session_state["log_cursors"][-1])
+
+    if df.empty:
+        st.info("📭 暂无符合条件的审计日志。")
+        return
 
     # 使用 dataframe 并允许选择行（Streamlit 1.30+ 功能，如果版本低可用普通 dataframe）
     st.dataframe(
@@ -88,8 +476,10 @@ def render_monitor_page():
         use_container_width=True,
         hide_index=True,
     )
+    render_page_controls(next_cursor)
+    render_otlp_export(version, tuple(df["ID"].tolist()))
 
-    # 5. 详情透视 (Drill Down)
+    # 3. 详情透视 (Drill Down)：选中后才按 id 读取完整日志
     st.subheader("🔍 深度诊断")
     selected_id = st.selectbox(
         "选择日志 ID 查看详情:",
@@ -98,7 +488,7 @@ def render_monitor_page():
     )
 
     if selected_id:
-        target_log = next((l for l in logs if l.id == selected_id), None)
+        target_log = ChatLogRepository.get_log(selected_id)
         if target_log:
             with st.container(border=True):
                 c1, c2 = st.columns([1, 1])
@@ -117,12 +507,33 @@ def render_monitor_page():
                 if target_log.intermediate_steps:
                     for step in target_log.intermediate_steps:
                         with st.expander(
-                            f"🔧 Tool: {step.get('tool')} ({step.get('timestamp')})"
+                            f"🔧 Tool: {step.get('tool')} ({step.get('timestamp')}"
+                            + (
+                                f", {step['duration_ms']:.0f} ms)"
+                                if step.get("duration_ms") is not None
+                                else ")"
+                            )
                         ):
-                            st.code(step.get("result"), language="json")
+                            if step.get("result") is None:
+                                # metrics 级别 (或未抽中采样) 只记录工具名与时间
+                                st.caption("未记录 (metrics 级别)")
+                            else:
+                                st.code(step["result"], language="json")
                 else:
                     st.caption("无工具调用记录")
 
+                # 链路追踪瀑布图
+                st.markdown("#### ⏱️ Span Waterfall (耗时分解)")
+                render_span_waterfall(target_log.spans)
+                if target_log.spans:
+                    st.download_button(
+                        "📥 导出 OTLP JSON",
+                        data=to_otlp_json([target_log.spans]),
+                        file_name=f"trace_{target_log.id}.otlp.json",
+                        mime="application/json",
+                        key=f"btn_otlp_{target_log.id}",
+                    )
+
                 # RAG 召回
                 st.markdown("#### 📖 RAG Context")
                 if target_log.rag_sources:
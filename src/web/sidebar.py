@@ -24,7 +24,9 @@ def render_sidebar():
         if page_mode == "💬 智能对话":
             st.markdown("### ⚡ 快捷操作")
             if st.button("🗑️ 清空对话历史", use_container_width=True):
-                st.session_state.messages = []
+                # 同时清空会话记忆，避免旧的实体与摘要继续注入 Prompt
+                st.session_state.pop("chat_history", None)
+                st.session_state.pop("memory", None)
                 st.rerun()
 
             st.markdown("---")
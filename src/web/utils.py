@@ -1,7 +1,6 @@
 # src/web/utils.py
 
 import streamlit as st
-import time
 
 
 def load_css():
@@ -60,13 +59,3 @@ def load_css():
         unsafe_allow_html=True,
     )
 
-
-def typewriter_effect(text: str):
-    """模拟流式打字机效果输出文本"""
-    # 增加空值检查，防止 text 为 None 时报错
-    if not text:
-        return
-
-    for word in text.split():
-        yield word + " "
-        time.sleep(0.02)
@@ -1,7 +1,10 @@
+import asyncio
 import sys
+import time
 import unittest
 import importlib.metadata
 from pathlib import Path
+from unittest.mock import patch
 
 # --- 1. 路径设置 (自动适配项目根目录) ---
 # 无论是在项目根目录运行还是在 tests 目录运行，都尝试找到 src
@@ -18,14 +21,35 @@ if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
 try:
+    from langchain.agents import create_tool_calling_agent
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.tools import tool
+
     from src.config import settings
-    from src.agent.agent_creator import PortAgentFactory, create_port_agent
+    from src.agent.agent_creator import (
+        ZHIPU_WEB_SEARCH_OFF,
+        PortAgentExecutor,
+        PortAgentFactory,
+        ZhipuChatOpenAI,
+        create_port_agent,
+        get_agent_factory,
+    )
+    from src.agent.fake_llm import FakePortChatModel
+    from src.agent.prerouter import EntityPrefetcher
+    from src.tools.port_tools import all_tools
+    from src.web.callbacks import AgentMonitorCallback
 except ImportError as e:
     print(f"❌ 测试脚本导入失败: {e}")
     print(f"   Python Path: {sys.path}")
     sys.exit(1)
 
 
+@tool(settings.RETRIEVER_TOOL_NAME)
+def fake_rag_tool(query: str) -> str:
+    """测试用知识库工具"""
+    return "人工查验通常需要1-2个工作日。"
+
+
 class TestAgentCreator(unittest.TestCase):
 
     @classmethod
@@ -62,6 +86,99 @@ class TestAgentCreator(unittest.TestCase):
         except Exception as e:
             self.fail(f"Agent creation failed: {e}")
 
+    def test_current_time_injected_per_invocation(self):
+        """测试 current_time 在调用时注入，而非创建时固化"""
+        print("\n🧪 Test: Per-invocation Context")
+        agent = create_port_agent()
+        prompt = agent.agent.runnable.get_prompts()[0]
+        self.assertNotIn("current_time", prompt.partial_variables)
+
+        inputs = agent.prep_inputs({"input": "你好"})
+        self.assertIn("current_time", inputs)
+
+        # 调用方显式传入的上下文优先
+        inputs = agent.prep_inputs({"input": "你好", "current_time": "2026年01月04日 12:00"})
+        self.assertEqual(inputs["current_time"], "2026年01月04日 12:00")
+        print("   ✅ current_time injected at invoke time")
+
+    def test_fast_path_honoured_by_stream(self):
+        """测试 stream 与 invoke 一样走模板快速通道，且只有模板作答时 route 才为 template"""
+        print("\n🧪 Test: Fast Path via stream")
+        tools = all_tools + [fake_rag_tool]
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", "你是口岸助手"),
+                ("human", "{input}"),
+                ("placeholder", "{prefetched_context}"),
+                ("placeholder", "{agent_scratchpad}"),
+            ]
+        )
+        executor = PortAgentExecutor(
+            agent=create_tool_calling_agent(FakePortChatModel(), tools, prompt),
+            tools=tools,
+            prefetcher=EntityPrefetcher(tools),
+        )
+        with patch("src.web.callbacks.write_audit_log"):
+            for query, route, llm_calls in (
+                ("查一下箱号 TRLU1234567 和提单号 BILL001 的状态", "template", 0),
+                ("箱号 TRLU1234567，提单号 BILL001 能赶上船吗？", "agent", 1),
+            ):
+                for run in (executor.invoke, lambda *a, **kw: list(executor.stream(*a, **kw))[-1]):
+                    monitor = AgentMonitorCallback(level="metrics")
+                    output = run({"input": query}, config={"callbacks": [monitor]})
+                    self.assertTrue(output["output"])
+                    self.assertEqual(monitor.route, route)
+                    self.assertEqual(monitor.llm_calls, llm_calls)
+        print("   ✅ Fast path honoured by invoke and stream")
+
+    def test_async_prefetch_does_not_block_loop(self):
+        """测试异步调用时预取在线程中执行，事件循环在预取期间仍可调度其他协程"""
+        print("\n🧪 Test: Async Prefetch off the Event Loop")
+        executor = create_port_agent()
+        executor.prefetcher = EntityPrefetcher(executor.tools)
+        blocking_prefetch = executor.prefetcher.prefetch
+
+        def slow_prefetch(text):
+            time.sleep(0.3)
+            return blocking_prefetch(text)
+
+        async def scenario():
+            ticks = 0
+
+            async def heartbeat():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.create_task(heartbeat())
+            with patch.object(executor.prefetcher, "prefetch", side_effect=slow_prefetch):
+                inputs = await executor.aprep_inputs({"input": "查一下箱号 TRLU1234567"})
+            task.cancel()
+            return inputs, ticks
+
+        inputs, ticks = asyncio.run(scenario())
+        self.assertIn("prefetch_stats", inputs)
+        self.assertGreater(ticks, 10)
+        print(f"   ✅ Event loop ticked {ticks} times during prefetch")
+
+    def test_zhipu_disables_web_search(self):
+        """测试智谱请求体在绑定工具后仍携带 web_search 关闭声明"""
+        print("\n🧪 Test: Zhipu web_search disabled")
+        llm = ZhipuChatOpenAI(model="glm-4", api_key="test", base_url="http://localhost")
+        bound = llm.bind_tools(all_tools)
+        payload = llm._get_request_payload("你好", **bound.kwargs)
+        self.assertEqual(payload["tools"][-1], ZHIPU_WEB_SEARCH_OFF)
+        self.assertEqual(len(payload["tools"]), len(all_tools) + 1)
+        print("   ✅ web_search disabled alongside bound tools")
+
+    def test_shared_factory(self):
+        """测试多个执行器共享同一个 LLM 客户端"""
+        print("\n🧪 Test: Shared Factory")
+        self.assertIs(get_agent_factory(), get_agent_factory())
+        self.assertIs(get_agent_factory().llm, get_agent_factory().llm)
+        print("   ✅ Factory reused across executors")
+
 
 if __name__ == "__main__":
     unittest.main()
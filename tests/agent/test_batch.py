@@ -0,0 +1,68 @@
+# tests/agent/test_batch.py
+import json
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain_core.runnables import RunnableLambda
+
+from src.agent.batch import BatchRunner, iter_queries
+
+
+def test_parse_query_examples():
+    """剧本格式只取 **Query:** 后的引用行，并去掉引号与加粗标记"""
+    queries = [q for _, q in iter_queries(project_root / "query_examples")]
+    assert len(queries) == 4
+    assert queries[1].startswith("重点关注一下 BILL_URGENT 这票货")
+    assert not any("**" in q or q.startswith("“") for q in queries)
+
+
+def _executor(fail_on: set):
+    def diagnose(inputs):
+        if inputs["input"] in fail_on:
+            raise RuntimeError("LLM 超时")
+        return {"output": f"诊断: {inputs['input']}"}
+
+    return RunnableLambda(diagnose)
+
+
+@patch("src.web.callbacks.write_audit_log")
+def test_incremental_write_and_resume(mock_save):
+    """结果逐条写入；续跑时跳过已成功的查询，只重试失败的查询"""
+    with tempfile.TemporaryDirectory() as tmp:
+        query_file = Path(tmp) / "queries.txt"
+        query_file.write_text(
+            "# 夜间批量核查\n箱号 TRLU1234567\n提单 BILL_RISK\n\n船名 东方海外宁波\n",
+            encoding="utf-8",
+        )
+        out = Path(tmp) / "results.jsonl"
+
+        stats = BatchRunner(_executor({"提单 BILL_RISK"}), out, concurrency=2).run(query_file)
+        assert stats == {"submitted": 3, "skipped": 0, "success": 2, "error": 1}
+        records = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+        assert {r["status"] for r in records} == {"success", "error"}
+        assert all("latency" in r and "tokens" in r for r in records)
+
+        # 模拟中断时写了半行
+        with out.open("a", encoding="utf-8") as f:
+            f.write('{"id": "broken"')
+        stats = BatchRunner(_executor(set()), out, concurrency=2).run(query_file)
+        assert stats == {"submitted": 1, "skipped": 2, "success": 1, "error": 0}
+        last = json.loads(out.read_text(encoding="utf-8").splitlines()[-1])
+        assert last["query"] == "提单 BILL_RISK" and last["status"] == "success"
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_batch
+    """
+    test_parse_query_examples()
+    test_incremental_write_and_resume()
+    print("\n🎉 所有批量诊断测试通过！")
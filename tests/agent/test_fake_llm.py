@@ -0,0 +1,96 @@
+# tests/agent/test_fake_llm.py
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import tool
+
+from src.config import settings
+from src.agent.fake_llm import FakePortChatModel
+from src.agent.streaming import TokenStreamHandler
+from src.tools.port_tools import all_tools
+
+MOCK_DB_DATA = {
+    "containers": {"TRLU1234567": {"container_id": "TRLU1234567", "status": "已进港"}},
+    "customs": {
+        "BILL_RISK": {
+            "bill_of_lading": "BILL_RISK",
+            "customs_status": "查验",
+            "customs_code": "人工查验",
+        }
+    },
+    "vessels": {},
+}
+
+
+@tool(settings.RETRIEVER_TOOL_NAME)
+def fake_rag_tool(query: str) -> str:
+    """测试用知识库工具"""
+    return "人工查验通常需要1-2个工作日，建议申请预漏装。"
+
+
+def _build_executor(llm) -> AgentExecutor:
+    tools = all_tools + [fake_rag_tool]
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "你是口岸助手"),
+            ("human", "{input}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ]
+    )
+    agent = create_tool_calling_agent(llm, tools, prompt)
+    return AgentExecutor(agent=agent, tools=tools, return_intermediate_steps=True)
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DB_DATA)
+def test_rule_based_tool_calls(mock_load):
+    """规则模式：先查数据，报关异常时再查知识库，最后给出结构化答案"""
+    executor = _build_executor(FakePortChatModel())
+    result = executor.invoke({"input": "箱号 TRLU1234567，提单 BILL_RISK 怎么办？"})
+
+    tools_called = [action.tool for action, _ in result["intermediate_steps"]]
+    assert tools_called == [
+        "get_container_status",
+        "get_customs_status",
+        settings.RETRIEVER_TOOL_NAME,
+    ]
+    assert "🔍 状态核查" in result["output"]
+    assert "人工查验" in result["output"]
+
+
+def test_scripted_response_and_usage():
+    """脚本模式：按 match 选择回复，并返回固定 Token 用量"""
+    llm = FakePortChatModel(
+        script=[{"match": "你好", "steps": [{"content": "您好，我是小宁。"}]}],
+        fixed_token_usage={"input_tokens": 10, "output_tokens": 5},
+    )
+    message = llm.invoke("你好")
+    assert message.content == "您好，我是小宁。"
+    assert message.usage_metadata["total_tokens"] == 15
+
+
+def test_streaming_emits_tokens():
+    """streaming=True 时 invoke 也会逐 Token 触发回调"""
+    handler = TokenStreamHandler()
+    llm = FakePortChatModel(streaming=True, stream_chunk_size=2)
+    message = llm.invoke("今天天气怎么样", config={"callbacks": [handler]})
+    assert handler.text == message.content
+    assert message.usage_metadata["output_tokens"] > 0
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_fake_llm
+    """
+    test_rule_based_tool_calls()
+    test_scripted_response_and_usage()
+    test_streaming_emits_tokens()
+    print("\n🎉 所有 Fake LLM 测试通过！")
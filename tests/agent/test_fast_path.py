@@ -0,0 +1,77 @@
+# tests/agent/test_fast_path.py
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.agent.fast_path import is_status_query, render_status_answer
+from src.agent.prerouter import EntityPrefetcher
+from src.tools.port_tools import all_tools
+
+MOCK_DATA = {
+    "containers": {
+        "TRLU1234567": {
+            "container_id": "TRLU1234567",
+            "status": "已进港",
+            "vgm_status": "已发送",
+            "location": "宁波北仑第二集装箱码头",
+        },
+        "NOVGM999": {
+            "container_id": "NOVGM999",
+            "status": "已进港",
+            "vgm_status": "未发送",
+            "location": "宁波北仑第四集装箱码头",
+        },
+    },
+    "customs": {
+        "BILL001": {"bill_of_lading": "BILL001", "customs_status": "放行"},
+        "BILL_RISK": {
+            "bill_of_lading": "BILL_RISK",
+            "customs_status": "查验",
+            "customs_code": "人工查验",
+        },
+    },
+    "vessels": {},
+}
+
+
+def test_classifier():
+    """只问状态的问题走模板；涉及时效 / 风险 / 建议的问题交给 LLM"""
+    assert is_status_query("查一下箱号 TRLU1234567 的状态")
+    assert is_status_query("提单 BILL001 放行了吗")
+    assert not is_status_query("提单 BILL_RISK 被人工查验了，我该怎么办？")
+    assert not is_status_query("箱号 TRLU1234567 能赶上‘东方海外宁波’吗")
+    assert not is_status_query("你好")
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DATA)
+def test_render_and_escalation(mock_load):
+    """数据完整且无异常时渲染状态核查；报关异常 / VGM 缺失 / 未找到时返回 None"""
+    prefetcher = EntityPrefetcher(all_tools)
+
+    query = "查一下箱号 TRLU1234567 和提单 BILL001 的状态"
+    answer = render_status_answer(query, prefetcher.prefetch(query))
+    assert answer.startswith("**🔍 状态核查**")
+    assert "TRLU1234567" in answer and "宁波北仑第二集装箱码头" in answer
+    assert "海关状态: 放行" in answer
+
+    for query in (
+        "查一下提单 BILL_RISK 的状态",
+        "查一下箱号 NOVGM999 的状态",
+        "查一下箱号 ERROR999999 的状态",
+    ):
+        assert render_status_answer(query, prefetcher.prefetch(query)) is None
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_fast_path
+    """
+    test_classifier()
+    test_render_and_escalation()
+    print("\n🎉 所有快速通道测试通过！")
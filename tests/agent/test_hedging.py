@@ -0,0 +1,115 @@
+# tests/agent/test_hedging.py
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.agent.fake_llm import FakePortChatModel
+from src.agent.hedging import HedgedChatModel, ProviderHealth
+
+
+class BrokenChatModel(FakePortChatModel):
+    """模拟供应商故障"""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("provider down")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("provider down")
+
+
+def _script(answer: str):
+    return [{"steps": [{"content": answer}]}]
+
+
+def _hedged(primary, secondary, **kwargs) -> HedgedChatModel:
+    stats = []
+    llm = HedgedChatModel(
+        primary=primary,
+        secondary=secondary,
+        primary_name="qwen",
+        secondary_name="zhipu",
+        min_delay=0.05,
+        default_delay=0.1,
+        stats_sink=lambda *row: stats.append(row),
+        **kwargs,
+    )
+    return llm, stats
+
+
+def test_hedge_fires_when_primary_is_slow():
+    """主供应商超过对冲延迟未返回：备用供应商先返回并胜出"""
+    llm, stats = _hedged(
+        FakePortChatModel(latency=1.0, script=_script("来自 qwen")),
+        FakePortChatModel(latency=0.01, script=_script("来自 zhipu")),
+    )
+    t0 = time.perf_counter()
+    message = llm.invoke("你好")
+    assert message.content == "来自 zhipu"
+    assert message.response_metadata["provider"] == "zhipu"
+    assert time.perf_counter() - t0 < 0.8
+    assert ("zhipu", stats[0][1], True, True, None) == stats[0]
+
+
+def test_fast_primary_is_not_hedged():
+    llm, stats = _hedged(
+        FakePortChatModel(script=_script("来自 qwen")),
+        FakePortChatModel(script=_script("来自 zhipu")),
+    )
+    assert llm.invoke("你好").content == "来自 qwen"
+    assert [row[0] for row in stats] == ["qwen"]
+
+
+def test_failover_and_circuit_breaker():
+    """主供应商报错立即切换；错误率过高后熔断，直接优先调用备用供应商"""
+    health = {"qwen": ProviderHealth("qwen", min_samples=2, cooldown=60)}
+    llm, stats = _hedged(
+        BrokenChatModel(),
+        FakePortChatModel(script=_script("来自 zhipu")),
+        health=health,
+    )
+    for _ in range(2):
+        assert llm.invoke("你好").content == "来自 zhipu"
+    assert not health["qwen"].healthy
+
+    stats.clear()
+    assert llm.invoke("你好").content == "来自 zhipu"
+    assert [row[0] for row in stats] == ["zhipu"]
+
+
+def test_async_hedge_cancels_loser():
+    llm, stats = _hedged(
+        FakePortChatModel(latency=5.0, script=_script("来自 qwen")),
+        FakePortChatModel(latency=0.01, script=_script("来自 zhipu")),
+    )
+    t0 = time.perf_counter()
+    message = asyncio.run(llm.ainvoke("你好"))
+    assert message.content == "来自 zhipu"
+    assert time.perf_counter() - t0 < 1.0
+    # 落败的 qwen 请求被取消，不计入统计
+    assert [row[0] for row in stats] == ["zhipu"]
+
+
+def test_health_percentile():
+    health = ProviderHealth("qwen")
+    health.seed([0.1 * i for i in range(1, 21)])
+    assert abs(health.percentile(95) - 1.9) < 1e-9
+    assert health.error_rate == 0.0
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_hedging
+    """
+    test_hedge_fires_when_primary_is_slow()
+    test_fast_primary_is_not_hedged()
+    test_failover_and_circuit_breaker()
+    test_async_hedge_cancels_loser()
+    test_health_percentile()
+    print("\n🎉 所有 Hedging 测试通过！")
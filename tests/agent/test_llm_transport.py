@@ -0,0 +1,210 @@
+# tests/agent/test_llm_transport.py
+import asyncio
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.agent.llm_transport import (
+    AsyncRetryTransport,
+    LoopLocalTransport,
+    ProviderLimiter,
+    RetryTransport,
+)
+
+
+def _stand_in(statuses, headers=None):
+    """本地替身端点：按顺序返回给定状态码，最后返回 OpenAI 格式的成功响应"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) <= len(statuses):
+            return httpx.Response(statuses[len(calls) - 1], headers=headers or {})
+        return httpx.Response(
+            200,
+            json={
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stand-in",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "你好"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+            },
+        )
+
+    return handler, calls
+
+
+@patch("src.agent.llm_transport.time.sleep")
+def test_retry_on_5xx_then_success(mock_sleep):
+    """503 两次后成功：共请求 3 次，退避 2 次"""
+    handler, calls = _stand_in([503, 502])
+    client = httpx.Client(transport=RetryTransport(httpx.MockTransport(handler)))
+    response = client.post("http://stand-in/v1/chat/completions", json={})
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert mock_sleep.call_count == 2
+
+
+@patch("src.agent.llm_transport.time.sleep")
+def test_retry_after_header_and_exhaustion(mock_sleep):
+    """遵循 Retry-After；超过最大重试次数后返回最后一次响应"""
+    handler, calls = _stand_in([429] * 5, headers={"Retry-After": "1.5"})
+    transport = RetryTransport(httpx.MockTransport(handler), max_retries=2)
+    client = httpx.Client(transport=transport)
+    response = client.post("http://stand-in/v1/chat/completions", json={})
+    assert response.status_code == 429
+    assert len(calls) == 3
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [1.5, 1.5]
+
+
+def test_concurrency_slot_released_after_close():
+    """并发名额在响应关闭后释放，不会泄漏"""
+    handler, _ = _stand_in([])
+    transport = RetryTransport(httpx.MockTransport(handler), max_concurrency=1)
+    client = httpx.Client(transport=transport)
+    for _ in range(3):
+        with client.stream("POST", "http://stand-in/v1/chat/completions", json={}) as r:
+            r.read()
+    assert transport.limiter.in_flight == 0
+
+
+def test_async_retry():
+    handler, calls = _stand_in([500])
+
+    async def scenario():
+        transport = AsyncRetryTransport(httpx.MockTransport(handler), backoff_base=0)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post("http://stand-in/v1/chat/completions", json={})
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert len(calls) == 2
+
+
+def test_async_client_reused_across_event_loops():
+    """共享异步客户端在多次 asyncio.run() 之间复用：每个事件循环使用独立的传输与并发名额"""
+    handler, calls = _stand_in([])
+
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        return handler(request)
+
+    transport = LoopLocalTransport(
+        lambda: AsyncRetryTransport(httpx.MockTransport(slow_handler), max_concurrency=1)
+    )
+    client = httpx.AsyncClient(transport=transport)
+
+    async def scenario():
+        # 并发名额为 1，第二个请求需要在信号量上等待 (信号量因此绑定当前事件循环)
+        responses = await asyncio.gather(
+            *(client.post("http://stand-in/v1/chat/completions", json={}) for _ in range(2))
+        )
+        return [r.status_code for r in responses]
+
+    for _ in range(3):
+        assert asyncio.run(scenario()) == [200, 200]
+    assert len(calls) == 6
+    assert len(transport._transports) <= 1, "已关闭事件循环的传输应被丢弃"
+
+
+def test_provider_limit_shared_across_clients_and_loops():
+    """同步客户端与多个事件循环中的异步客户端共用同一份并发名额"""
+    handler, calls = _stand_in([])
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+
+    def track(delta):
+        with lock:
+            active["now"] += delta
+            active["peak"] = max(active["peak"], active["now"])
+
+    def sync_handler(request: httpx.Request) -> httpx.Response:
+        track(1)
+        time.sleep(0.01)
+        track(-1)
+        return handler(request)
+
+    async def async_handler(request: httpx.Request) -> httpx.Response:
+        track(1)
+        await asyncio.sleep(0.01)
+        track(-1)
+        return handler(request)
+
+    limiter = ProviderLimiter(2)
+    sync_client = httpx.Client(
+        transport=RetryTransport(httpx.MockTransport(sync_handler), limiter=limiter)
+    )
+    async_client = httpx.AsyncClient(
+        transport=LoopLocalTransport(
+            lambda: AsyncRetryTransport(httpx.MockTransport(async_handler), limiter=limiter)
+        )
+    )
+
+    async def burst():
+        await asyncio.gather(
+            *(async_client.post("http://stand-in/v1/chat/completions", json={}) for _ in range(4))
+        )
+
+    def sync_burst():
+        for _ in range(4):
+            sync_client.post("http://stand-in/v1/chat/completions", json={})
+
+    workers = [threading.Thread(target=asyncio.run, args=(burst(),)) for _ in range(2)]
+    workers += [threading.Thread(target=sync_burst) for _ in range(2)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert len(calls) == 16
+    assert active["peak"] == 2
+    assert limiter.in_flight == 0
+
+
+def test_chat_model_against_stand_in():
+    """ChatOpenAI 通过共享传输层访问本地替身端点"""
+    from langchain_openai import ChatOpenAI
+
+    handler, calls = _stand_in([503])
+    transport = RetryTransport(httpx.MockTransport(handler), backoff_base=0)
+    llm = ChatOpenAI(
+        model="stand-in",
+        api_key="test",
+        base_url="http://stand-in/v1",
+        http_client=httpx.Client(transport=transport),
+        max_retries=0,
+    )
+    message = llm.invoke("你好")
+    assert message.content == "你好"
+    assert message.usage_metadata["total_tokens"] == 5
+    assert json.loads(calls[-1].content)["model"] == "stand-in"
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_llm_transport
+    """
+    test_retry_on_5xx_then_success()
+    test_retry_after_header_and_exhaustion()
+    test_concurrency_slot_released_after_close()
+    test_async_retry()
+    test_async_client_reused_across_event_loops()
+    test_provider_limit_shared_across_clients_and_loops()
+    test_chat_model_against_stand_in()
+    print("\n🎉 所有 LLM Transport 测试通过！")
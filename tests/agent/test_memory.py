@@ -0,0 +1,65 @@
+# tests/agent/test_memory.py
+import sys
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain_core.messages import HumanMessage
+
+from src.agent.memory import ConversationMemory
+
+ANSWER = """**🔍 状态核查**
+- 提单 BILL_RISK：人工查验
+**💡 行动建议**
+尽快联系报关行配合查验，并申请预漏装。
+"""
+
+
+def test_window_summary_and_entities():
+    """滑出窗口的轮次被压缩为摘要，实体表保留全部出现过的单证号"""
+    memory = ConversationMemory(window_turns=2, max_tokens=10_000)
+    memory.add_turn("帮我查一下箱号 TRLU1234567，配‘中远海运金牛座’", "状态正常。")
+    memory.add_turn("最急的是提单号 BILL_RISK，怎么办？", ANSWER)
+    memory.add_turn("那这票货还能赶上吗？", "可以赶上。")
+
+    variables = memory.load_variables()
+    history = variables["chat_history"]
+    assert len(history) == 4
+    assert isinstance(history[0], HumanMessage)
+    assert "BILL_RISK" in history[0].content
+
+    context = variables["memory_context"]
+    assert "TRLU1234567" in context and "BILL_RISK" in context
+    assert "中远海运金牛座" in context
+    assert "早前对话摘要" in context and "状态正常" in context
+
+
+def test_token_budget_is_bounded():
+    """会话再长，记忆总量也不超过预算 (最近一轮始终保留原文)"""
+    memory = ConversationMemory(window_turns=5, max_tokens=300, summary_max_tokens=80)
+    for i in range(50):
+        memory.add_turn(f"第 {i} 次追问提单号 BILL{i:03d} 的状态", ANSWER * 3)
+    stats = memory.stats()
+    assert stats["turns"] >= 1
+    assert stats["tokens"] <= 300 or stats["turns"] == 1
+    assert "行动建议" not in memory.context_text().split("早前对话摘要")[-1]
+    assert "尽快联系报关行" in memory.summary_lines[-1]
+
+
+def test_empty_memory():
+    variables = ConversationMemory().load_variables()
+    assert variables == {"chat_history": [], "memory_context": ""}
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_memory
+    """
+    test_window_summary_and_entities()
+    test_token_budget_is_bounded()
+    test_empty_memory()
+    print("\n🎉 所有 Memory 测试通过！")
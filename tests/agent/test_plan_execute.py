@@ -0,0 +1,179 @@
+# tests/agent/test_plan_execute.py
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import tool
+
+from src.config import settings
+from src.agent.fake_llm import FakePortChatModel
+from src.agent.fast_path import ROUTE_TEMPLATE
+from src.agent.plan_execute import (
+    PlanExecuteExecutor,
+    build_plan_prompts,
+    missing_entities,
+)
+from src.agent.prerouter import EntityPrefetcher
+from src.tools.port_tools import all_tools
+
+MOCK_DB_DATA = {
+    "containers": {"TRLU1234567": {"container_id": "TRLU1234567", "status": "已进港"}},
+    "customs": {
+        "BILL_RISK": {
+            "bill_of_lading": "BILL_RISK",
+            "customs_status": "查验",
+            "customs_code": "人工查验",
+        }
+    },
+    "vessels": {},
+}
+
+
+@tool(settings.RETRIEVER_TOOL_NAME)
+def fake_rag_tool(query: str) -> str:
+    """测试用知识库工具"""
+    return "人工查验通常需要1-2个工作日，建议申请预漏装。"
+
+
+TOOLS = all_tools + [fake_rag_tool]
+
+
+class Recorder(BaseCallbackHandler):
+    def __init__(self):
+        self.llm_calls = 0
+        self.tools = []
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.tools.append(serialized["name"])
+
+
+def _build(llm, prefetch: bool = False) -> PlanExecuteExecutor:
+    react_prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "你是口岸助手"),
+            ("human", "{input}"),
+            ("placeholder", "{prefetched_context}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ]
+    )
+    fallback = AgentExecutor(
+        agent=create_tool_calling_agent(llm, TOOLS, react_prompt), tools=TOOLS
+    )
+    planning, synthesis = build_plan_prompts()
+    return PlanExecuteExecutor(
+        llm=llm,
+        tools=TOOLS,
+        planning_prompt=planning,
+        synthesis_prompt=synthesis,
+        fallback=fallback,
+        context_factory=lambda: {"current_time": "2026年01月03日 10:00", "memory_context": ""},
+        prefetcher=EntityPrefetcher(TOOLS) if prefetch else None,
+    )
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DB_DATA)
+def test_two_llm_calls_with_supplementary_rag(mock_load):
+    """规划 + 综合两次 LLM 调用；报关异常时自动补充知识库检索"""
+    recorder = Recorder()
+    result = _build(FakePortChatModel()).invoke(
+        {"input": "箱号 TRLU1234567，提单 BILL_RISK 怎么办？"},
+        config={"callbacks": [recorder]},
+    )
+    assert recorder.llm_calls == 2
+    assert sorted(recorder.tools) == sorted(
+        ["get_container_status", "get_customs_status", settings.RETRIEVER_TOOL_NAME]
+    )
+    assert "🔍 状态核查" in result["output"]
+    assert "人工查验" in result["output"]
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DB_DATA)
+def test_incomplete_plan_falls_back_to_react(mock_load):
+    """计划遗漏提单号时回退 ReAct，已执行的查询不会重复执行"""
+    llm = FakePortChatModel(
+        script=[
+            {
+                "steps": [
+                    {
+                        "tool_calls": [
+                            {
+                                "name": "get_container_status",
+                                "args": {"container_id": "TRLU1234567"},
+                            }
+                        ]
+                    },
+                    {"content": "回退后的最终答案"},
+                ]
+            }
+        ]
+    )
+    recorder = Recorder()
+    result = _build(llm).invoke(
+        {"input": "箱号 TRLU1234567，提单 BILL_RISK 怎么办？"},
+        config={"callbacks": [recorder]},
+    )
+    assert result["output"] == "回退后的最终答案"
+    assert recorder.tools == ["get_container_status"]
+    assert recorder.llm_calls == 2
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DB_DATA)
+def test_status_query_takes_template_route(mock_load):
+    """Plan 模式同样在规划前预路由：纯状态查询直接返回模板答案，不调用 LLM"""
+    executor = _build(FakePortChatModel(), prefetch=True)
+    for run in (
+        lambda cfg: executor.invoke({"input": "查一下箱号 TRLU1234567 的状态"}, config=cfg),
+        lambda cfg: asyncio.run(
+            executor.ainvoke({"input": "查一下箱号 TRLU1234567 的状态"}, config=cfg)
+        ),
+    ):
+        recorder = Recorder()
+        result = run({"callbacks": [recorder]})
+        assert result["output"].startswith("**🔍 状态核查**")
+        assert result["route"] == ROUTE_TEMPLATE
+        assert recorder.llm_calls == 0
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DB_DATA)
+def test_prefetched_results_not_replanned(mock_load):
+    """需要推理的问题：预取结果注入规划，已查询的单证不会重复查询，也不会误判为计划遗漏"""
+    recorder = Recorder()
+    result = _build(FakePortChatModel(), prefetch=True).invoke(
+        {"input": "箱号 TRLU1234567，提单 BILL_RISK 怎么办？"},
+        config={"callbacks": [recorder]},
+    )
+    assert "route" not in result
+    # 预路由 (不经过回调) 已完成全部查询，规划阶段直接作答
+    assert recorder.tools == []
+    assert recorder.llm_calls == 1
+    assert "人工查验" in result["output"]
+
+
+def test_missing_entities():
+    calls = [{"name": "get_customs_status", "args": {"bill_of_lading": "bill_risk"}}]
+    assert missing_entities("提单 BILL_RISK，箱号 TRLU1234567", calls) == ["TRLU1234567"]
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_plan_execute
+    """
+    test_two_llm_calls_with_supplementary_rag()
+    test_incomplete_plan_falls_back_to_react()
+    test_status_query_takes_template_route()
+    test_prefetched_results_not_replanned()
+    test_missing_entities()
+    print("\n🎉 所有 Plan-Execute 测试通过！")
@@ -0,0 +1,97 @@
+# tests/agent/test_prerouter.py
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+
+from src.config import settings
+from src.agent.prerouter import EntityPrefetcher, extract_entities
+from src.tools.port_tools import all_tools
+
+MOCK_DB_DATA = {
+    "containers": {
+        "TRLU1234567": {"container_id": "TRLU1234567", "status": "已进港"},
+    },
+    "customs": {
+        "BILL_URGENT": {
+            "bill_of_lading": "BILL_URGENT",
+            "customs_status": "查验",
+            "customs_code": "H98",
+        },
+        "BILL001": {"bill_of_lading": "BILL001", "customs_status": "放行"},
+    },
+    "vessels": {
+        "东方海外宁波": {"vessel_name": "东方海外宁波", "voyage": "OOCL004W"},
+    },
+}
+
+
+@tool(settings.RETRIEVER_TOOL_NAME)
+def fake_rag_tool(query: str) -> str:
+    """测试用知识库工具"""
+    return f"知识库: {query}"
+
+
+def test_extract_entities():
+    """测试箱号/提单/船名抽取"""
+    text = "帮我查一下箱号TRLU1234567，提单号是bill_urgent，船名是‘东方海外宁波’。但货被‘人工查验’了"
+    entities = extract_entities(text)
+    assert entities.containers == ["TRLU1234567"]
+    assert entities.bills == ["BILL_URGENT"]
+    # ‘人工查验’ 前没有船名提示词，不应被识别为船名
+    assert entities.vessels == ["东方海外宁波"]
+
+    # 航次号 OOCL004W 与查验代码 H98 不是箱号
+    assert extract_entities("航次 OOCL004W 状态 H98").containers == []
+    assert extract_entities("你好").is_empty()
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DB_DATA)
+def test_prefetch_with_customs_exception(mock_load):
+    """报关异常时应追加一轮知识库预取"""
+    prefetcher = EntityPrefetcher(all_tools + [fake_rag_tool])
+    result = prefetcher.prefetch("重点关注 BILL_URGENT，配‘东方海外宁波’，箱号 TRLU1234567")
+
+    tools_called = [c.tool for c in result.calls]
+    assert tools_called[:3] == [
+        "get_container_status",
+        "get_customs_status",
+        "get_vessel_schedule",
+    ]
+    assert tools_called[3] == settings.RETRIEVER_TOOL_NAME
+    assert result.stages == 2
+
+    messages = result.to_messages()
+    # 两轮：每轮一个 AIMessage(tool_calls) + 对应数量的 ToolMessage
+    assert isinstance(messages[0], AIMessage) and len(messages[0].tool_calls) == 3
+    assert all(isinstance(m, ToolMessage) for m in messages[1:4])
+    assert isinstance(messages[4], AIMessage) and len(messages[4].tool_calls) == 1
+    assert "H98" in messages[5].content
+
+
+@patch("src.tools.port_tools._load_mock_data", return_value=MOCK_DB_DATA)
+def test_prefetch_without_exception(mock_load):
+    """报关放行时只预取数据，不检索知识库"""
+    prefetcher = EntityPrefetcher(all_tools + [fake_rag_tool])
+    result = prefetcher.prefetch("提单 BILL001 放行了吗")
+    assert [c.tool for c in result.calls] == ["get_customs_status"]
+    assert result.stages == 1
+    assert prefetcher.prefetch("今天天气怎么样") is None
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_prerouter
+    """
+    test_extract_entities()
+    test_prefetch_with_customs_exception()
+    test_prefetch_without_exception()
+    print("\n🎉 所有 Pre-router 测试通过！")
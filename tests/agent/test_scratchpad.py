@@ -0,0 +1,129 @@
+# tests/agent/test_scratchpad.py
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain.agents.output_parsers.tools import ToolAgentAction
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.agent.fake_llm import FakePortChatModel
+from src.agent.scratchpad import (
+    COMPACTION_EVENT,
+    ScratchpadCompactor,
+    project_observation,
+)
+from src.tools.port_tools import all_tools
+
+CUSTOMS_RESULT = {
+    "bill_of_lading": "BILL_RISK",
+    "customs_status": "查验",
+    "customs_code": "人工查验",
+    "declaration_time": "2026-01-02 09:00:00",
+    "instruction_time": "2026-01-03 09:00:00",
+    "raw_payload": "x" * 400,
+}
+
+
+def _step(tool: str, args: dict, observation, call_id: str):
+    message = AIMessage(
+        content="", tool_calls=[{"name": tool, "args": args, "id": call_id}]
+    )
+    action = ToolAgentAction(
+        tool=tool,
+        tool_input=args,
+        log="",
+        message_log=[message],
+        tool_call_id=call_id,
+    )
+    return action, observation
+
+
+def test_projection():
+    """结构化结果只保留所需字段；系统反馈只保留首句"""
+    content = project_observation("get_customs_status", CUSTOMS_RESULT)
+    assert json.loads(content) == {
+        "bill_of_lading": "BILL_RISK",
+        "customs_status": "查验",
+        "customs_code": "人工查验",
+        "declaration_time": "2026-01-02 09:00:00",
+        "instruction_time": "2026-01-03 09:00:00",
+    }
+    # 放行的提单只有申报时间，压缩后必须保留 (CVT 对比依赖它)
+    cleared = {
+        "bill_of_lading": "BILL001",
+        "customs_status": "放行",
+        "declaration_time": "2026-01-02 09:00:00",
+    }
+    assert json.loads(project_observation("get_customs_status", cleared)) == cleared
+    feedback = "系统反馈：在港区系统中未找到箱号 'ERROR999999'。请提示用户核对箱号格式。"
+    assert (
+        project_observation("get_container_status", feedback)
+        == "在港区系统中未找到箱号 'ERROR999999'"
+    )
+
+
+def test_budget_summarizes_older_rounds():
+    """超出预算时较早轮次被摘要，最新一轮完整保留，tool_call_id 一一对应"""
+    steps = [
+        _step("get_customs_status", {"bill_of_lading": "BILL_RISK"}, CUSTOMS_RESULT, "c1"),
+        _step("port_regulation_knowledge_base", {"query": "人工查验"}, "查验说明" * 200, "c2"),
+        _step("get_customs_status", {"bill_of_lading": "BILL_RISK"}, CUSTOMS_RESULT, "c3"),
+    ]
+    messages, stats = ScratchpadCompactor(max_tokens=200, rag_max_chars=300).format(steps)
+
+    tool_messages = [m for m in messages if isinstance(m, ToolMessage)]
+    assert [m.tool_call_id for m in tool_messages] == ["c1", "c2", "c3"]
+    assert tool_messages[1].content.startswith("[已压缩]")
+    assert json.loads(tool_messages[2].content)["customs_code"] == "人工查验"
+    assert stats["summarized"] >= 1
+    assert stats["saved_tokens"] > 0
+    assert stats["compacted_tokens"] < stats["raw_tokens"]
+
+
+class CompactionRecorder(BaseCallbackHandler):
+    def __init__(self):
+        self.events = []
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        if name == COMPACTION_EVENT:
+            self.events.append(data)
+
+
+@patch(
+    "src.tools.port_tools._load_mock_data",
+    return_value={"containers": {}, "customs": {"BILL_RISK": CUSTOMS_RESULT}, "vessels": {}},
+)
+def test_savings_reported_per_llm_call(mock_load):
+    """每次带观测的 LLM 调用都会通过回调上报压缩统计"""
+    prompt = ChatPromptTemplate.from_messages(
+        [("human", "{input}"), ("placeholder", "{agent_scratchpad}")]
+    )
+    agent = create_tool_calling_agent(
+        FakePortChatModel(), all_tools, prompt, message_formatter=ScratchpadCompactor()
+    )
+    executor = AgentExecutor(agent=agent, tools=all_tools)
+    recorder = CompactionRecorder()
+    executor.invoke({"input": "提单 BILL_RISK"}, config={"callbacks": [recorder]})
+
+    assert len(recorder.events) == 1
+    assert recorder.events[0]["saved_tokens"] > 0
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_scratchpad
+    """
+    test_projection()
+    test_budget_summarizes_older_rounds()
+    test_savings_reported_per_llm_call()
+    print("\n🎉 所有 Scratchpad 测试通过！")
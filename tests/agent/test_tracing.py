@@ -0,0 +1,144 @@
+# tests/agent/test_tracing.py
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+from unittest.mock import patch
+from uuid import uuid4
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.tools import tool
+
+from src.config import settings
+from src.agent.fake_llm import FakePortChatModel
+from src.agent.tracing import SpanRecorder, span_depths, to_otlp_json
+from src.observability.spans import span
+from src.tools.port_tools import all_tools
+
+CUSTOMS_RESULT = {
+    "bill_of_lading": "BILL_RISK",
+    "customs_status": "查验",
+    "customs_code": "人工查验",
+}
+
+
+class SlowRetriever(BaseRetriever):
+    """模拟 Embedding + 向量检索两段耗时"""
+
+    def _get_relevant_documents(self, query: str, **kwargs) -> List[Document]:
+        with span("embedding", chars=len(query)):
+            time.sleep(0.02)
+        time.sleep(0.01)
+        return [Document(page_content="人工查验需 1-2 个工作日。")]
+
+
+retriever = SlowRetriever()
+
+
+@tool(settings.RETRIEVER_TOOL_NAME)
+def fake_knowledge_base(query: str) -> str:
+    """查询口岸法规知识库"""
+    return "\n".join(doc.page_content for doc in retriever.invoke(query))
+
+
+@patch(
+    "src.tools.port_tools._load_mock_data",
+    return_value={"containers": {}, "customs": {"BILL_RISK": CUSTOMS_RESULT}, "vessels": {}},
+)
+def _run_agent(mock_load) -> SpanRecorder:
+    tools = all_tools + [fake_knowledge_base]
+    prompt = ChatPromptTemplate.from_messages(
+        [("human", "{input}"), ("placeholder", "{agent_scratchpad}")]
+    )
+    agent = create_tool_calling_agent(FakePortChatModel(), tools, prompt)
+    executor = AgentExecutor(agent=agent, tools=tools)
+    recorder = SpanRecorder()
+    executor.invoke(
+        {"input": "提单 BILL_RISK", "prefetch_stats": {"calls": 1, "stages": 1, "latency": 0.005}},
+        config={"callbacks": [recorder]},
+    )
+    return recorder
+
+
+def test_span_hierarchy():
+    """LLM / 工具 / 检索 / Embedding Span 按调用关系嵌套，子 Span 落在父 Span 区间内"""
+    trace = _run_agent().trace()
+    spans = {s["span_id"]: s for s in trace["spans"]}
+    by_name = {}
+    for s in trace["spans"]:
+        by_name.setdefault(s["name"], []).append(s)
+
+    root = by_name["AgentExecutor"][0]
+    assert root["parent_id"] is None and root["start_ns"] == 0
+    assert by_name["prefetch"][0]["parent_id"] == root["span_id"]
+    assert len(by_name["llm"]) == 3
+    assert all(s["parent_id"] == root["span_id"] for s in by_name["llm"])
+
+    retriever_span = by_name["retriever"][0]
+    tool_span = spans[retriever_span["parent_id"]]
+    assert tool_span["name"] == settings.RETRIEVER_TOOL_NAME
+    embedding = by_name["embedding"][0]
+    assert embedding["parent_id"] == retriever_span["span_id"]
+    # self_ms 扣除了 Embedding，即剩余的向量检索耗时
+    assert retriever_span["self_ms"] < retriever_span["duration_ms"]
+    assert embedding["duration_ms"] >= 20
+
+    for s in trace["spans"]:
+        if s["parent_id"]:
+            parent = spans[s["parent_id"]]
+            assert parent["start_ns"] <= s["start_ns"] <= s["end_ns"] <= parent["end_ns"]
+    assert span_depths(trace["spans"])[embedding["span_id"]] == 3
+
+
+def test_otlp_export():
+    """导出为 OTLP/JSON：十六进制 ID、纳秒时间戳字符串、父子关系保留"""
+    trace = _run_agent().trace()
+    payload = json.loads(to_otlp_json([trace]))
+    otlp_spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+    assert len(otlp_spans) == len(trace["spans"])
+    for s in otlp_spans:
+        assert len(s["traceId"]) == 32 and len(s["spanId"]) == 16
+        assert int(s["endTimeUnixNano"]) >= int(s["startTimeUnixNano"]) >= trace["start_unix_nano"]
+    ids = {s["spanId"] for s in otlp_spans}
+    assert all(s["parentSpanId"] in ids for s in otlp_spans if "parentSpanId" in s)
+
+
+def test_max_spans_includes_prefetch():
+    """补记的 prefetch Span 同样受 max_spans 限制"""
+    recorder = SpanRecorder(max_spans=1)
+    recorder.on_chain_start(
+        {},
+        {"input": "提单 BILL_RISK", "prefetch_stats": {"calls": 1, "stages": 1, "latency": 0.005}},
+        run_id=uuid4(),
+        name="AgentExecutor",
+    )
+    assert [s["name"] for s in recorder.spans] == ["AgentExecutor"]
+    assert recorder.dropped_spans == 1
+
+
+def test_span_without_run_context():
+    """不在 Runnable 上下文中使用 span() 时不报错"""
+    with span("embedding") as attributes:
+        attributes["dim"] = 512
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.agent.test_tracing
+    """
+    test_span_hierarchy()
+    test_otlp_export()
+    test_max_spans_includes_prefetch()
+    test_span_without_run_context()
+    print("\n🎉 所有链路追踪测试通过！")
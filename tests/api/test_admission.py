@@ -0,0 +1,63 @@
+# tests/api/test_admission.py
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.api.admission import AdmissionController, QueueFullError
+
+
+def test_queue_full_rejected():
+    """并发槽位与队列都占满时立即拒绝"""
+
+    async def scenario():
+        ctrl = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        assert await ctrl.acquire() == 0
+
+        # 第二个请求进入队列，位置为 1
+        waiter = asyncio.create_task(ctrl.acquire())
+        await asyncio.sleep(0)
+        assert ctrl.snapshot()["queue_depth"] == 1
+        assert ctrl.saturated
+
+        # 第三个请求被拒绝
+        with pytest.raises(QueueFullError) as exc:
+            await ctrl.acquire()
+        assert exc.value.reason == "queue_full"
+
+        ctrl.release()
+        assert await waiter == 1
+        assert ctrl.in_flight == 1 and ctrl.waiting == 0
+        ctrl.release()
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout():
+    """排队超时同样拒绝，并且不会占用槽位"""
+
+    async def scenario():
+        ctrl = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        async with ctrl.slot():
+            with pytest.raises(QueueFullError) as exc:
+                await ctrl.acquire()
+            assert exc.value.reason == "queue_timeout"
+        assert ctrl.in_flight == 0 and ctrl.waiting == 0
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.api.test_admission
+    """
+    test_queue_full_rejected()
+    test_queue_timeout()
+    print("\n🎉 所有 Admission 测试通过！")
@@ -0,0 +1,131 @@
+# tests/api/test_server.py
+import asyncio
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from fastapi.testclient import TestClient
+from langchain.agents import create_tool_calling_agent
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import tool
+
+from src.config import settings
+from src.agent.fake_llm import FakePortChatModel
+from src.agent.prerouter import EntityPrefetcher
+from src.tools.port_tools import all_tools
+
+# 服务模块会加载 RAG 依赖 (Embedding / FAISS)，缺失时跳过
+server = pytest.importorskip("src.api.server")
+from src.agent.agent_creator import PortAgentExecutor  # noqa: E402
+
+TEMPLATE_QUERY = "查一下箱号 TRLU1234567 和提单号 BILL001 的状态"
+
+
+@tool(settings.RETRIEVER_TOOL_NAME)
+def fake_rag_tool(query: str) -> str:
+    """测试用知识库工具"""
+    return "人工查验通常需要1-2个工作日。"
+
+
+def _build_service() -> "server.AgentService":
+    """使用离线模拟模型的服务 (不触发 lifespan，直接注入执行器)"""
+    tools = all_tools + [fake_rag_tool]
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "你是口岸助手"),
+            ("human", "{input}"),
+            ("placeholder", "{prefetched_context}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ]
+    )
+    service = server.AgentService()
+    service.executor = PortAgentExecutor(
+        agent=create_tool_calling_agent(FakePortChatModel(), tools, prompt),
+        tools=tools,
+        prefetcher=EntityPrefetcher(tools),
+    )
+    return service
+
+
+def _parse_sse(body: str):
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        yield event[len("event: "):], json.loads(data[len("data: "):])
+
+
+@patch("src.web.callbacks.write_audit_log")
+def test_sse_template_route_skips_llm(mock_write):
+    """SSE 流式接口同样走模板快速通道：不调用 LLM，记录的 route 与节省次数真实"""
+    service = _build_service()
+    client = TestClient(server.create_app(service))
+
+    resp = client.post("/v1/diagnose", json={"query": TEMPLATE_QUERY, "stream": True})
+    assert resp.status_code == 200
+    events = dict(_parse_sse(resp.text))
+    assert events["done"]["output"].startswith("**🔍 状态核查**")
+    metrics = events["done"]["metrics"]
+    assert metrics["llm_calls"] == 0 and metrics["route"] == "template"
+    assert mock_write.call_args.args[0]["route"] == "template"
+    assert service.admission.in_flight == 0
+
+    # 需要推理的问题仍交给 LLM Agent
+    resp = client.post(
+        "/v1/diagnose", json={"query": "箱号 TRLU1234567 能赶上船吗？", "stream": True}
+    )
+    metrics = dict(_parse_sse(resp.text))["done"]["metrics"]
+    assert metrics["llm_calls"] >= 1 and metrics["route"] == "agent"
+    assert service.admission.in_flight == 0
+
+
+def test_stream_slot_released_on_early_disconnect():
+    """客户端在首个字节前断开 (生成器从未开始迭代) 时，执行槽位也会释放"""
+    service = _build_service()
+    app = server.create_app(service)
+    body = json.dumps({"query": TEMPLATE_QUERY, "stream": True}).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/v1/diagnose",
+        "raw_path": b"/v1/diagnose",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("testserver", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        raise OSError("client disconnected")
+
+    async def scenario():
+        with pytest.raises(Exception):
+            await app(scope, receive, send)
+
+    with patch("src.web.callbacks.write_audit_log"):
+        asyncio.run(scenario())
+    assert service.admission.in_flight == 0
+    assert not service.admission.saturated
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.api.test_server
+    """
+    test_sse_template_route_skips_llm()
+    test_stream_slot_released_on_early_disconnect()
+    print("\n🎉 所有 API 服务测试通过！")
@@ -0,0 +1,120 @@
+# tests/database/test_analytics.py
+import math
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy.orm import sessionmaker
+
+from src.database.analytics import log_distributions, provider_latency
+from src.database.engine import create_sqlite_engine
+from src.database.models import Base, ProviderStat
+from src.database.repository import ChatLogRepository
+
+BASE_TIME = datetime(2025, 1, 6, 10, 0)
+
+
+def nearest_rank(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def test_percentiles_match_nearest_rank():
+    rng = random.Random(7)
+    samples = {}
+    logs = []
+    for i in range(400):
+        model = "qwen-plus" if i % 3 else "glm-4"
+        hour = i % 2
+        latency = round(rng.lognormvariate(0, 0.8), 3)
+        tokens = rng.randint(200, 3000)
+        calls = rng.choice([1, 1, 1, 2, 3])
+        samples.setdefault((hour, model), []).append((latency, tokens, calls, i % 10 == 0))
+        logs.append(
+            ChatLogRepository.build_log(
+                user_input="q",
+                ai_output="a",
+                latency=latency,
+                token_usage={"total": tokens},
+                intermediate_steps=[],
+                rag_sources=[],
+                llm_calls=calls,
+                status="error" if i % 10 == 0 else "success",
+                model_name=model,
+                timestamp=BASE_TIME + timedelta(hours=hour, minutes=i % 60),
+            )
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(Path(tmp) / "analytics.db")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            db.add_all(logs)
+            db.commit()
+            rows = log_distributions(db, granularity="hour")
+            overall = log_distributions(db, granularity="day", by_model=False)
+            later = log_distributions(db, since=BASE_TIME + timedelta(hours=1), granularity="hour")
+        engine.dispose()
+
+    assert len(rows) == 4
+    for row in rows:
+        hour = int((row["bucket"] - BASE_TIME).total_seconds() // 3600)
+        values = samples[(hour, row["group"])]
+        assert row["count"] == len(values)
+        for p in (50, 90, 99):
+            assert row[f"latency_p{p}"] == nearest_rank([v[0] for v in values], p)
+            assert row[f"tokens_p{p}"] == nearest_rank([v[1] for v in values], p)
+            assert row[f"llm_calls_p{p}"] == nearest_rank([v[2] for v in values], p)
+        assert abs(row["error_rate"] - sum(v[3] for v in values) / len(values) * 100) < 1e-9
+
+    assert len(overall) == 1 and overall[0]["count"] == 400
+    assert overall[0]["bucket"] == datetime(2025, 1, 6)
+    all_latency = [v[0] for values in samples.values() for v in values]
+    assert overall[0]["latency_p99"] == nearest_rank(all_latency, 99)
+    assert {r["bucket"].hour for r in later} == {11}
+
+
+def test_provider_latency():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(Path(tmp) / "analytics.db")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            db.add_all(
+                ProviderStat(
+                    provider=provider,
+                    latency=latency,
+                    success=latency < 9,
+                    timestamp=BASE_TIME,
+                )
+                for provider, base in (("qwen", 0.0), ("zhipu", 5.0))
+                for latency in [base + x for x in (0.5, 1.0, 1.5, 2.0, 4.0)]
+            )
+            db.commit()
+            rows = provider_latency(db, granularity="day")
+        engine.dispose()
+
+    by_provider = {r["group"]: r for r in rows}
+    assert by_provider["qwen"]["latency_p50"] == 1.5
+    assert by_provider["qwen"]["latency_p99"] == 4.0
+    assert by_provider["qwen"]["error_rate"] == 0
+    assert by_provider["zhipu"]["latency_p90"] == 9.0
+    assert by_provider["zhipu"]["error_rate"] == 20.0
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.database.test_analytics
+    """
+    test_percentiles_match_nearest_rank()
+    test_provider_latency()
+    print("\n🎉 所有延迟分位数统计测试通过！")
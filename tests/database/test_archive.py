@@ -0,0 +1,87 @@
+# tests/database/test_archive.py
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy.orm import sessionmaker
+
+from src.database.archive import archive_logs, list_partitions, read_archive
+from src.database.engine import create_sqlite_engine
+from src.database.models import Base, ChatLog
+from src.database.repository import ChatLogRepository
+
+NOW = datetime(2025, 3, 1, 12, 0)
+
+
+def _log(i: int, days_ago: int) -> ChatLog:
+    return ChatLogRepository.build_log(
+        user_input=f"查询 {i}",
+        ai_output="ok",
+        latency=1.0 + i,
+        token_usage={"input": 10, "output": 5, "total": 15},
+        intermediate_steps=[{"tool": "get_customs_status", "result": f"r{i}"}],
+        rag_sources=["人工查验需 1-2 个工作日。"],
+        status="error" if i % 3 == 0 else "success",
+        timestamp=NOW - timedelta(days=days_ago, hours=i % 5),
+    )
+
+
+def test_archive_moves_old_rows_to_partitions():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(Path(tmp) / "logs.db")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        archive_dir = Path(tmp) / "archive"
+        with Session() as db:
+            # 12 条 40~42 天前的旧日志 + 5 条新日志
+            db.add_all([_log(i, 40 + i % 3) for i in range(12)])
+            db.add_all([_log(100 + i, 1) for i in range(5)])
+            db.commit()
+
+            stats = archive_logs(db, NOW - timedelta(days=30), archive_dir, chunk_size=5)
+            remaining = db.query(ChatLog).count()
+            # 再次运行没有可归档的数据
+            again = archive_logs(db, NOW - timedelta(days=30), archive_dir, chunk_size=5)
+        engine.dispose()
+
+        assert stats["archived"] == 12
+        assert remaining == 5
+        assert again["archived"] == 0
+
+        partitions = list_partitions(archive_dir)
+        assert len(partitions) >= 3
+        assert sum(p["files"] for p in partitions) == stats["files"]
+
+        df = read_archive(archive_dir=archive_dir)
+        assert sorted(df["id"]) == list(range(1, 13))
+        assert df.loc[0, "intermediate_steps"][0]["tool"] == "get_customs_status"
+        assert df.loc[0, "rag_sources"] == ["人工查验需 1-2 个工作日。"]
+
+        # 分区裁剪 + 列裁剪
+        first_day = date.fromisoformat(partitions[0]["date"])
+        subset = read_archive(first_day, first_day, columns=["latency", "status"], archive_dir=archive_dir)
+        assert list(subset.columns) == ["id", "latency", "status"]
+        assert 0 < len(subset) < 12
+
+
+def test_read_archive_without_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        df = read_archive(archive_dir=Path(tmp), columns=["status"])
+        assert df.empty
+        assert list_partitions(Path(tmp)) == []
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.database.test_archive
+    """
+    test_archive_moves_old_rows_to_partitions()
+    test_read_archive_without_files()
+    print("\n🎉 所有日志归档测试通过！")
@@ -0,0 +1,144 @@
+# tests/database/test_audit_writer.py
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy.orm import sessionmaker
+
+from src.database import repository
+from src.database.audit_writer import AuditLogWriter
+from src.database.engine import create_sqlite_engine
+from src.database.models import Base
+from src.database.repository import ProviderStatRepository
+
+
+def _record(i: int) -> dict:
+    return {"user_input": f"q{i}", "ai_output": "ok", "latency": 0.1}
+
+
+def test_batches_by_size_and_interval():
+    """攒满 batch_size 立即写一批；不足一批时在 flush_interval 后写入"""
+    batches = []
+    writer = AuditLogWriter(sink=batches.append, batch_size=3, flush_interval=0.2)
+    for i in range(7):
+        assert writer.submit(_record(i))
+
+    time.sleep(0.1)
+    assert [len(b) for b in batches] == [3, 3]
+    time.sleep(0.3)
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert writer.stats()["written"] == 7
+    assert writer.stats()["batches"] == 3
+
+
+def test_drops_when_full_and_flushes_on_close():
+    """写入线程阻塞时队列写满后丢弃并计数；关闭时写完剩余记录"""
+    release = threading.Event()
+    batches = []
+
+    def slow_sink(batch):
+        release.wait(5)
+        batches.append(batch)
+
+    writer = AuditLogWriter(sink=slow_sink, max_queue=2, batch_size=1, flush_interval=0.05)
+    writer.submit(_record(0))
+    time.sleep(0.1)  # 第一条已被取出，写入线程阻塞在 sink 中
+    results = [writer.submit(_record(i)) for i in range(1, 5)]
+    assert results == [True, True, False, False]
+    assert writer.stats()["dropped"] == 2
+    assert writer.stats()["max_queue_depth"] == 2
+
+    release.set()
+    writer.close()
+    assert sum(len(b) for b in batches) == 3
+    assert writer.stats()["queue_depth"] == 0
+    assert writer.submit(_record(9)) is False
+
+
+def test_flush_times_out_when_queue_stays_full():
+    """写入线程阻塞且队列持续写满时，flush 超时返回 False 而不是抛出 queue.Full"""
+    release = threading.Event()
+    writer = AuditLogWriter(sink=lambda batch: release.wait(5), max_queue=1, batch_size=1)
+    writer.submit(_record(0))
+    time.sleep(0.1)  # 第一条已被取出，写入线程阻塞在 sink 中
+    assert writer.submit(_record(1))
+    assert writer.flush(timeout=0.1) is False
+    release.set()
+    assert writer.flush()
+
+
+def test_failed_batch_is_counted():
+    def broken_sink(batch):
+        raise RuntimeError("database is locked")
+
+    writer = AuditLogWriter(sink=broken_sink, batch_size=2)
+    writer.submit(_record(0))
+    writer.submit(_record(1))
+    assert writer.flush()
+    assert writer.stats()["failed"] == 2
+    assert writer.stats()["written"] == 0
+
+
+def test_successful_batch_bumps_log_version():
+    """批次落库后日志版本号递增 (监控页缓存失效)；写入失败时不变"""
+    before = repository._log_version
+    writer = AuditLogWriter(sink=lambda batch: None, batch_size=2)
+    writer.submit(_record(0))
+    writer.submit(_record(1))
+    assert writer.flush()
+    assert repository._log_version == before + 1
+
+    def broken_sink(batch):
+        raise RuntimeError("database is locked")
+
+    writer = AuditLogWriter(sink=broken_sink, batch_size=1)
+    writer.submit(_record(2))
+    assert writer.flush()
+    assert repository._log_version == before + 1
+
+
+def test_provider_stats_written_in_batches():
+    """供应商统计经写入队列批量落库，不影响日志版本号"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(Path(tmp) / "stats.db")
+        Base.metadata.create_all(engine)
+        original = repository.SessionLocal
+        repository.SessionLocal = sessionmaker(bind=engine)
+        try:
+            before = repository._log_version
+            writer = AuditLogWriter(
+                sink=ProviderStatRepository.save_stats, batch_size=10, on_written=None
+            )
+            for i in range(5):
+                writer.submit(
+                    dict(provider="qwen", latency=(i + 1) / 4, success=i != 4, hedged=i == 0)
+                )
+            writer.submit(dict(provider="zhipu", latency=3.0, success=False, error_msg="timeout"))
+            assert writer.flush()
+            assert writer.stats()["written"] == 6 and writer.stats()["batches"] == 1
+            assert sorted(ProviderStatRepository.get_recent_latencies("qwen")) == [0.25, 0.5, 0.75, 1.0]
+            assert repository._log_version == before
+        finally:
+            repository.SessionLocal = original
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.database.test_audit_writer
+    """
+    test_batches_by_size_and_interval()
+    test_drops_when_full_and_flushes_on_close()
+    test_flush_times_out_when_queue_stays_full()
+    test_failed_batch_is_counted()
+    test_successful_batch_bumps_log_version()
+    test_provider_stats_written_in_batches()
+    print("\n🎉 所有审计写入器测试通过！")
@@ -0,0 +1,123 @@
+# tests/database/test_fts.py
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy.orm import sessionmaker
+
+from src.database.engine import create_sqlite_engine
+from src.database.fts import install_fts, search_logs
+from src.database.models import Base, ChatLog
+from src.database.repository import ChatLogRepository
+
+BASE_TIME = datetime(2025, 1, 6, 8, 0)
+
+
+def _log(i: int, user_input: str, ai_output: str) -> ChatLog:
+    return ChatLogRepository.build_log(
+        user_input=user_input,
+        ai_output=ai_output,
+        latency=1.0,
+        token_usage={},
+        intermediate_steps=[],
+        rag_sources=[],
+        timestamp=BASE_TIME + timedelta(minutes=i),
+    )
+
+
+def _session(tmp: str):
+    engine = create_sqlite_engine(Path(tmp) / "fts.db")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    return engine, Session
+
+
+def test_triggers_keep_index_in_sync():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = _session(tmp)
+        with Session() as db:
+            # 建索引前已存在的日志通过 rebuild 回填
+            db.add(_log(0, "查一下提单 BILL001", "海关状态: 放行"))
+            db.commit()
+            assert install_fts(engine)
+            assert install_fts(engine)  # 重复执行无副作用
+
+            db.add_all(
+                [
+                    _log(1, "集装箱 NBCT1234567 为什么被扣", "海关指令 H98，需要机检查验"),
+                    _log(2, "BILL002 能赶上船期吗", "报关状态: 查验 (H98)，风险极高"),
+                    _log(3, "今天天气", "与通关无关"),
+                ]
+            )
+            db.commit()
+
+            rows, total = search_logs(db, "bill001")
+            assert total == 1 and rows[0]["user_input"].endswith("BILL001")
+            assert isinstance(rows[0]["timestamp"], datetime)
+
+            rows, total = search_logs(db, "H98")
+            assert total == 2
+            assert "**H98**" in rows[0]["snippet"]
+
+            # 多词为 AND；中文子串无需分词
+            rows, total = search_logs(db, "H98 风险极高")
+            assert [r["id"] for r in rows] == [3]
+            rows, total = search_logs(db, "机检查验")
+            assert [r["id"] for r in rows] == [2]
+
+            # 更新与删除同步到索引
+            log = db.get(ChatLog, 4)
+            log.ai_output = "H98 的说明请见知识库"
+            db.commit()
+            assert search_logs(db, "H98")[1] == 3
+            db.query(ChatLog).filter(ChatLog.id == 2).delete()
+            db.commit()
+            assert search_logs(db, "H98")[1] == 2
+            assert search_logs(db, "NBCT1234567")[1] == 0
+        engine.dispose()
+
+
+def test_ranking_pagination_and_short_terms():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = _session(tmp)
+        assert install_fts(engine)
+        with Session() as db:
+            db.add_all(
+                [_log(i, f"问题 {i}", "常规回复 " + "填充内容 " * 20) for i in range(5)]
+                + [_log(10, "H98 是什么意思", "H98 为机检指令")]
+                + [_log(11 + i, f"问题 {i}", "其中提到 H98 " + "填充内容 " * 20) for i in range(4)]
+            )
+            db.commit()
+
+            rows, total = search_logs(db, "H98", limit=2)
+            assert total == 5
+            # 提问与回答都命中且文本更短的日志最相关
+            assert rows[0]["id"] == 6
+            page2, _ = search_logs(db, "H98", limit=2, offset=2)
+            page3, _ = search_logs(db, "H98", limit=2, offset=4)
+            ids = [r["id"] for r in rows + page2 + page3]
+            assert sorted(ids) == [6, 7, 8, 9, 10]
+
+            # 不足 3 个字符的词退化为 LIKE；特殊字符按字面匹配
+            assert search_logs(db, "机检")[1] == 1
+            assert search_logs(db, "机检 H98")[1] == 1
+            assert search_logs(db, '"H98" OR 问题')[1] == 0
+            assert search_logs(db, "100%")[1] == 0
+            assert search_logs(db, "   ") == ([], 0)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.database.test_fts
+    """
+    test_triggers_keep_index_in_sync()
+    test_ranking_pagination_and_short_terms()
+    print("\n🎉 所有全文检索测试通过！")
@@ -0,0 +1,126 @@
+# tests/database/test_log_pagination.py
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy.orm import sessionmaker
+
+from src.database import repository
+from src.database.engine import create_sqlite_engine
+from src.database.models import Base
+from src.database.repository import ChatLogRepository
+
+BASE_TIME = datetime(2025, 1, 6, 8, 0)
+
+
+def _seed(n: int):
+    """n 条日志，每 3 条共享同一时间戳 (检验 id 作为翻页决胜列)"""
+    ChatLogRepository.save_logs(
+        [
+            {
+                "user_input": f"查询 {i} " + "长文本" * 100,
+                "ai_output": "ok" * 500,
+                "latency": float(i % 10),
+                "token_usage": {"input": 10, "output": 5, "total": 15},
+                "intermediate_steps": [{"tool": "get_customs_status", "result": "x" * 200}],
+                "rag_sources": [],
+                "spans": {"trace_id": f"t{i}", "spans": []},
+                "status": "error" if i % 4 == 0 else "success",
+                "timestamp": BASE_TIME + timedelta(minutes=i // 3),
+            }
+            for i in range(n)
+        ]
+    )
+
+
+def _with_temp_db(test):
+    def wrapper():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_sqlite_engine(Path(tmp) / "logs.db")
+            Base.metadata.create_all(engine)
+            original = repository.SessionLocal
+            repository.SessionLocal = sessionmaker(bind=engine)
+            try:
+                test()
+            finally:
+                repository.SessionLocal = original
+                engine.dispose()
+
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@_with_temp_db
+def test_keyset_pages_cover_all_rows_once():
+    _seed(25)
+    seen, cursor, pages = [], None, 0
+    while True:
+        page, cursor = ChatLogRepository.list_logs(limit=7, cursor=cursor)
+        seen.extend(page)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 4
+    ids = [row["id"] for row in seen]
+    assert sorted(ids) == list(range(1, 26))
+    assert len(set(ids)) == 25
+    # 按 (timestamp, id) 倒序
+    keys = [(row["timestamp"], row["id"]) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+    # 只返回摘要列，提问截断为预览
+    assert "ai_output" not in seen[0] and "intermediate_steps" not in seen[0]
+    assert len(seen[0]["user_input"]) == repository.PREVIEW_CHARS
+
+
+@_with_temp_db
+def test_filters_and_lazy_detail():
+    _seed(40)
+    since = BASE_TIME + timedelta(minutes=2)
+    until = BASE_TIME + timedelta(minutes=10)
+    page, cursor = ChatLogRepository.list_logs(
+        limit=100, status="error", since=since, until=until, min_latency=2.0
+    )
+    assert cursor is None
+    expected = [
+        i for i in range(40)
+        if i % 4 == 0 and 2 <= i // 3 < 10 and i % 10 >= 2
+    ]
+    assert sorted(row["id"] - 1 for row in page) == expected
+
+    detail = ChatLogRepository.get_log(page[0]["id"])
+    assert detail.ai_output == "ok" * 500
+    assert detail.intermediate_steps[0]["tool"] == "get_customs_status"
+    assert ChatLogRepository.get_log(10**6) is None
+
+    spans = ChatLogRepository.get_spans([row["id"] for row in page])
+    assert [s["trace_id"] for s in spans] == [f"t{i}" for i in expected]
+
+
+@_with_temp_db
+def test_log_version_changes_on_write_and_clear():
+    """监控页缓存键：新增日志 (含其他进程写入) 与清空日志都会改变版本号"""
+    empty = ChatLogRepository.log_version()
+    _seed(3)
+    seeded = ChatLogRepository.log_version()
+    assert seeded != empty and seeded[1] == 3
+    assert ChatLogRepository.log_version() == seeded
+    ChatLogRepository.clear_logs()
+    assert ChatLogRepository.log_version() not in (empty, seeded)
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.database.test_log_pagination
+    """
+    test_keyset_pages_cover_all_rows_once()
+    test_filters_and_lazy_detail()
+    test_log_version_changes_on_write_and_clear()
+    print("\n🎉 所有日志分页测试通过！")
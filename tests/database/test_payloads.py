@@ -0,0 +1,121 @@
+# tests/database/test_payloads.py
+import sys
+import tempfile
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy.orm import sessionmaker
+
+from src.database.engine import create_sqlite_engine
+from src.database.models import Base, ChatLog, LogPayload
+from src.database.payloads import (
+    hydrate_payloads,
+    migrate_inline_payloads,
+    payload_report,
+    prune_payloads,
+    store_payloads,
+)
+from src.database.repository import ChatLogRepository
+
+CHUNKS = ["人工查验需 1-2 个工作日。" * 20, "H98 为机检指令，图像正常 4-6 小时放行。" * 20]
+
+
+def _log(i: int, spans=None) -> ChatLog:
+    return ChatLogRepository.build_log(
+        user_input=f"查询 {i}",
+        ai_output="ok",
+        latency=1.0,
+        token_usage={},
+        intermediate_steps=[{"tool": "get_customs_status", "result": '{"status": "查验"}'}],
+        rag_sources=[CHUNKS[i % 2], CHUNKS[(i + 1) % 2]],
+        spans=spans,
+    )
+
+
+def _session(tmp: str):
+    engine = create_sqlite_engine(Path(tmp) / "payloads.db")
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)
+
+
+def test_store_dedupes_and_roundtrips():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = _session(tmp)
+        with Session() as db:
+            logs = [_log(i, spans={"trace_id": f"t{i}"} if i == 0 else None) for i in range(10)]
+            store_payloads(db, logs)
+            db.add_all(logs)
+            db.commit()
+            # 2 个 RAG 片段 + 1 个工具结果 + 1 个 spans
+            assert db.query(LogPayload).count() == 4
+            codecs = {p.codec for p in db.query(LogPayload)}
+            assert codecs <= {"zstd", "zlib", "raw"}
+
+            # 再写一批：已存在的内容不重复存储
+            more = [_log(i) for i in range(5)]
+            store_payloads(db, more, codec="zlib")
+            db.add_all(more)
+            db.commit()
+            assert db.query(LogPayload).count() == 4
+
+            raw = db.get(ChatLog, 1)
+            assert raw.intermediate_steps is None and raw.rag_sources is None
+            assert len(raw.payload_refs["rag_sources"]) == 2
+
+            log = hydrate_payloads(db, [raw])[0]
+            assert log.rag_sources == [CHUNKS[0], CHUNKS[1]]
+            assert log.intermediate_steps[0]["tool"] == "get_customs_status"
+            assert log.spans == {"trace_id": "t0"}
+            # 还原的值不会写回数据库
+            db.commit()
+            assert db.query(ChatLog.rag_sources).filter(ChatLog.id == 1).scalar() is None
+
+            report = payload_report(db)
+            assert report["inline"] == 0
+            assert report["logical"] > report["unique"] > report["stored"]
+        engine.dispose()
+
+
+def test_migrate_inline_rows_and_prune():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = _session(tmp)
+        with Session() as db:
+            # 旧版本写入的内联行
+            db.add_all([_log(i) for i in range(7)])
+            db.commit()
+            before = payload_report(db)
+            assert before["inline"] > 0 and before["blobs"] == 0
+
+            assert migrate_inline_payloads(db, chunk_size=3) == 7
+            assert migrate_inline_payloads(db) == 0
+            after = payload_report(db)
+            assert after["inline"] == 0
+            assert after["blobs"] == 3
+            assert after["stored"] < before["inline"]
+
+            log = hydrate_payloads(db, [db.get(ChatLog, 7)])[0]
+            assert log.rag_sources == [CHUNKS[0], CHUNKS[1]]
+
+            # 删除部分日志后，仍被引用的 blob 保留
+            db.query(ChatLog).filter(ChatLog.id <= 6).delete()
+            db.commit()
+            assert prune_payloads(db) == 0
+            db.query(ChatLog).delete()
+            db.commit()
+            assert prune_payloads(db) == 3
+            assert db.query(LogPayload).count() == 0
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.database.test_payloads
+    """
+    test_store_dedupes_and_roundtrips()
+    test_migrate_inline_rows_and_prune()
+    print("\n🎉 所有日志大字段存储测试通过！")
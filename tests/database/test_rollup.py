@@ -0,0 +1,126 @@
+# tests/database/test_rollup.py
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy.orm import sessionmaker
+
+from src.database.engine import create_sqlite_engine
+from src.database.models import Base, ChatLog, MetricsDaily, MetricsHourly
+from src.database.repository import ChatLogRepository
+from src.database.rollup import (
+    apply_rollups,
+    histogram_percentile,
+    rebuild_rollups,
+    rows_by_bucket,
+    summarize,
+)
+
+BASE_TIME = datetime(2025, 1, 6, 10, 30)
+
+
+def _log(latency: float, status: str = "success", hours: int = 0, route: str = "agent") -> ChatLog:
+    return ChatLogRepository.build_log(
+        user_input="查一下提单状态",
+        ai_output="ok",
+        latency=latency,
+        token_usage={"input": 80, "output": 20, "total": 100},
+        intermediate_steps=[],
+        rag_sources=[],
+        status=status,
+        route=route,
+        timestamp=BASE_TIME + timedelta(hours=hours),
+    )
+
+
+def _session(tmp: str):
+    engine = create_sqlite_engine(Path(tmp) / "rollup.db")
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)
+
+
+def test_incremental_upsert_merges_buckets():
+    """多次写入同一时间桶时计数、Token、最大耗时与直方图累加合并"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = _session(tmp)
+        with Session() as db:
+            for batch in ([_log(0.3), _log(4.0, "error")], [_log(70.0, route="template"), _log(2.5, hours=1)]):
+                db.add_all(batch)
+                apply_rollups(db, batch)
+                db.commit()
+
+            hourly = rows_by_bucket(db.query(MetricsHourly).order_by(MetricsHourly.bucket).all())
+            daily = rows_by_bucket(db.query(MetricsDaily).all())
+        engine.dispose()
+
+    assert [r["count"] for r in hourly] == [3, 1]
+    first = hourly[0]
+    assert first["error_count"] == 1
+    assert first["template_count"] == 1
+    assert first["total_tokens"] == 300
+    assert first["latency_max"] == 70.0
+    assert sum(first["latency_hist"]) == 3
+    assert first["latency_hist"][0] == 1 and first["latency_hist"][-1] == 1
+
+    assert len(daily) == 1
+    kpi = summarize(daily)
+    assert kpi["count"] == 4
+    assert kpi["error_rate"] == 25.0
+    assert kpi["template_rate"] == 25.0
+    assert abs(kpi["avg_latency"] - (0.3 + 4.0 + 70.0 + 2.5) / 4) < 1e-9
+
+
+def test_histogram_percentile():
+    # 100 个样本均匀落在 (1, 2] 桶内
+    hist = [0, 0, 100] + [0] * 8
+    assert abs(histogram_percentile(hist, 50) - 1.5) < 1e-9
+    assert abs(histogram_percentile(hist, 95) - 1.95) < 1e-9
+    # 落在溢出桶时以最大耗时为上界
+    overflow = [0] * 10 + [10]
+    assert histogram_percentile(overflow, 100, latency_max=90.0) == 90.0
+    assert histogram_percentile([0] * 11, 95) == 0.0
+
+
+def test_rebuild_matches_incremental():
+    """重建结果与写入时增量维护的结果一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = _session(tmp)
+        with Session() as db:
+            logs = [_log(0.1 * i, "error" if i % 5 == 0 else "success", hours=i % 30) for i in range(50)]
+            db.add_all(logs)
+            apply_rollups(db, logs)
+            db.commit()
+            before = rows_by_bucket(db.query(MetricsHourly).order_by(MetricsHourly.bucket).all())
+
+            assert rebuild_rollups(db, chunk_size=7) == 50
+            after = rows_by_bucket(db.query(MetricsHourly).order_by(MetricsHourly.bucket).all())
+
+            # 部分重建只重算 since 之后的桶
+            assert rebuild_rollups(db, since=BASE_TIME + timedelta(days=1)) < 50
+            partial = rows_by_bucket(db.query(MetricsHourly).order_by(MetricsHourly.bucket).all())
+        engine.dispose()
+
+    assert len(before) == 30
+    for a, b in zip(before, after):
+        assert a["bucket"] == b["bucket"]
+        assert a["count"] == b["count"]
+        assert a["latency_hist"] == b["latency_hist"]
+        assert abs(a["latency_sum"] - b["latency_sum"]) < 1e-9
+    assert summarize(partial) == summarize(before)
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.database.test_rollup
+    """
+    test_incremental_upsert_merges_buckets()
+    test_histogram_percentile()
+    test_rebuild_matches_incremental()
+    print("\n🎉 所有指标预聚合测试通过！")
@@ -0,0 +1,109 @@
+# tests/observability/test_metrics.py
+import functools
+import sys
+import urllib.request
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.observability.metrics import (
+    CACHE_REQUESTS,
+    CONTENT_TYPE,
+    TOOL_LATENCY,
+    MetricsRegistry,
+    cache_hit_rate,
+    counted_cache,
+    start_metrics_server,
+)
+from src.tools import port_tools
+
+
+def test_render_prometheus_format():
+    """Counter / Gauge / Histogram 按 Prometheus 文本格式输出，直方图桶为累计值"""
+    registry = MetricsRegistry(namespace="t")
+    requests = registry.counter("requests_total", "请求数", ("route", "status"))
+    depth = registry.gauge("queue_depth", "队列长度")
+    latency = registry.histogram("latency_seconds", "耗时", ("route",), (0.1, 1))
+
+    requests.inc(route="agent", status="success")
+    requests.inc(2, route="agent", status="success")
+    depth.set_function(lambda: 7)
+    for value in (0.05, 0.5, 0.5, 3):
+        latency.observe(value, route='a"b')
+
+    text = registry.render()
+    print(text)
+    assert "# TYPE t_requests_total counter" in text
+    assert 't_requests_total{route="agent",status="success"} 3' in text
+    assert "t_queue_depth 7" in text
+    assert 't_latency_seconds_bucket{route="a\\"b",le="0.1"} 1' in text
+    assert 't_latency_seconds_bucket{route="a\\"b",le="1"} 3' in text
+    assert 't_latency_seconds_bucket{route="a\\"b",le="+Inf"} 4' in text
+    assert 't_latency_seconds_count{route="a\\"b"} 4' in text
+    assert 't_latency_seconds_sum{route="a\\"b"} 4.05' in text
+
+    # 同名指标重复注册返回同一对象；标签不匹配时报错
+    assert registry.counter("requests_total", "请求数", ("route", "status")) is requests
+    try:
+        requests.inc(route="agent")
+        assert False, "缺少标签应报错"
+    except ValueError:
+        pass
+
+
+def test_tool_latency_per_tool():
+    """工具耗时按工具名记录"""
+    data = {"containers": {"ABCD1234567": {"status": "已进港"}}, "customs": {}, "vessels": {}}
+    with patch.object(port_tools, "_load_mock_data", return_value=data):
+        calls = TOOL_LATENCY.count(tool="get_container_status")
+        result = port_tools.get_container_status.invoke({"container_id": "abcd1234567"})
+        assert result == {"status": "已进港"}
+        assert TOOL_LATENCY.count(tool="get_container_status") == calls + 1
+
+
+def test_counted_cache_hit_rate():
+    """包装已有的缓存装饰器：函数体实际执行记为未命中，其余记为命中"""
+    executed = []
+
+    @counted_cache("t_lru", functools.lru_cache(maxsize=8))
+    def load(version):
+        executed.append(version)
+        return version * 2
+
+    assert [load(1), load(1), load(2), load(1)] == [2, 2, 4, 2]
+    assert executed == [1, 2]
+    assert CACHE_REQUESTS.value(cache="t_lru", result="miss") == 2
+    assert CACHE_REQUESTS.value(cache="t_lru", result="hit") == 2
+    assert cache_hit_rate("t_lru") == 0.5
+
+
+def test_metrics_http_endpoint():
+    """独立 /metrics 端点返回注册表内容"""
+    registry = MetricsRegistry(namespace="t")
+    registry.counter("pings_total", "探测次数").inc()
+    server = start_metrics_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            assert resp.headers["Content-Type"] == CONTENT_TYPE
+            body = resp.read().decode("utf-8")
+        assert "t_pings_total 1" in body
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.observability.test_metrics
+    """
+    test_render_prometheus_format()
+    test_tool_latency_per_tool()
+    test_counted_cache_hit_rate()
+    test_metrics_http_endpoint()
+    print("\n🎉 所有指标导出测试通过！")
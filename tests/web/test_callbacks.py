@@ -0,0 +1,110 @@
+# tests/web/test_callbacks.py
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# --- 1. 路径设置 (确保能导入 src) ---
+current_test_dir = Path(__file__).resolve().parent
+project_root = current_test_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from langchain_core.callbacks import CallbackManager
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from src.web.callbacks import MAX_RAG_SOURCES, RAG_SNIPPET_CHARS, AgentMonitorCallback
+
+
+def _llm_result(with_llm_output: bool = True, with_usage: bool = True) -> LLMResult:
+    message = AIMessage(
+        content="答案",
+        usage_metadata={"input_tokens": 100, "output_tokens": 20, "total_tokens": 120}
+        if with_usage
+        else None,
+        response_metadata={"model_name": "qwen-plus"},
+    )
+    return LLMResult(
+        generations=[[ChatGeneration(message=message)]],
+        llm_output={"token_usage": {"prompt_tokens": 100, "completion_tokens": 20}}
+        if with_llm_output
+        else None,
+    )
+
+
+def _replay(monitor: AgentMonitorCallback, docs: int = 3) -> None:
+    """按 AgentExecutor 的顺序触发一次请求的回调：LLM -> 工具 (含检索) -> LLM"""
+    manager = CallbackManager.configure(inheritable_callbacks=[monitor])
+    chain = manager.on_chain_start({"name": "AgentExecutor"}, {"input": "查 BILL002"}, name="AgentExecutor")
+    child = chain.get_child()
+    for round_no in range(2):
+        [llm] = child.on_chat_model_start({}, [[HumanMessage(content="查 BILL002")]])
+        llm.on_llm_new_token("答")
+        llm.on_llm_end(_llm_result())
+        if round_no == 0:
+            tool = child.on_tool_start({"name": "get_customs_status"}, "BILL002", name="get_customs_status")
+            retriever = tool.get_child().on_retriever_start({}, "H98")
+            retriever.on_retriever_end([Document(page_content="H98" * 500)] * docs)
+            tool.on_tool_end("x" * 2000, name="get_customs_status")
+    chain.on_chain_end({"output": "已放行"})
+
+
+def test_tokens_not_double_counted():
+    """usage_metadata 与 llm_output 同时存在时只累加一次；只有 llm_output 时使用它"""
+    monitor = AgentMonitorCallback(level="metrics")
+    monitor.on_llm_end(_llm_result(with_llm_output=True), run_id=None)
+    assert monitor.token_usage == {"input": 100, "output": 20, "total": 120}
+    assert monitor.model_name == "qwen-plus"
+
+    monitor.on_llm_end(_llm_result(with_llm_output=True, with_usage=False), run_id=None)
+    assert monitor.token_usage == {"input": 200, "output": 40, "total": 240}
+
+
+@patch("src.web.callbacks.write_audit_log")
+def test_full_level_keeps_bounded_trace(mock_write):
+    monitor = AgentMonitorCallback(level="full", sample_rate=1.0)
+    _replay(monitor, docs=MAX_RAG_SOURCES + 5)
+
+    record = mock_write.call_args.args[0]
+    assert record["token_usage"]["total"] == 240 and record["llm_calls"] == 2
+    assert record["spans"]["spans"], "完整级别应记录 Span"
+    # 只保留截断后的字符串，且数量有上限
+    assert len(record["rag_sources"]) == MAX_RAG_SOURCES
+    assert all(isinstance(s, str) and len(s) == RAG_SNIPPET_CHARS for s in record["rag_sources"])
+    step = record["intermediate_steps"][0]
+    assert step["tool"] == "get_customs_status" and len(step["result"]) == 500
+    assert "duration_ms" in step
+
+
+@patch("src.web.callbacks.write_audit_log")
+def test_metrics_level_and_sampling(mock_write):
+    """metrics 级别 (及未抽中的 full 请求) 只记录摘要；off 不写日志但仍计算耗时"""
+    for monitor in (
+        AgentMonitorCallback(level="metrics"),
+        AgentMonitorCallback(level="full", sample_rate=0.0),
+    ):
+        assert not monitor.tracing
+        _replay(monitor)
+        record = mock_write.call_args.args[0]
+        assert record["token_usage"]["total"] == 240 and record["llm_calls"] == 2
+        assert record["spans"] is None and record["rag_sources"] == []
+        assert record["intermediate_steps"][0].keys() == {"tool", "timestamp"}
+        assert record["model_name"] == "qwen-plus"
+
+    mock_write.reset_mock()
+    monitor = AgentMonitorCallback(level="off")
+    _replay(monitor)
+    mock_write.assert_not_called()
+    assert monitor.end_time >= monitor.start_time > 0
+    assert monitor.llm_calls == 0 and monitor.tool_calls == []
+
+
+if __name__ == "__main__":
+    """
+    uv run python -m tests.web.test_callbacks
+    """
+    test_tokens_not_double_counted()
+    test_full_level_keeps_bounded_trace()
+    test_metrics_level_and_sampling()
+    print("\n🎉 所有监控回调测试通过！")